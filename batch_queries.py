@@ -0,0 +1,138 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, ALL_COMPLETED, wait as wait_futures
+
+from benchmark import summarize_latencies
+from retrievers.strategies import STRATEGIES
+
+DEFAULT_BATCH_OUTPUT = "data/batch_results.jsonl"
+
+
+def iter_query_records(path, query_field="query"):
+    """
+    Stream (line_no, record) pairs from a JSONL file without loading it.
+    Blank lines are skipped; a line that is not a JSON object or lacks
+    `query_field` comes through as a record with an "error" key instead.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, {"error": f"invalid JSON: {e}"}
+                continue
+            if not isinstance(record, dict):
+                yield line_no, {"error": "line is not a JSON object"}
+                continue
+            if not isinstance(record.get(query_field), str):
+                yield line_no, {**record, "error": f"missing '{query_field}' field"}
+                continue
+            yield line_no, record
+
+
+def result_entry(doc):
+    """Compact JSON-friendly view of a retrieved Document."""
+    metadata = doc.metadata
+    return {
+        "id": metadata.get("_id") or metadata.get("parent_id"),
+        "score": metadata.get("_rrf_score", metadata.get("_score")),
+        "source_file": metadata.get("source_file"),
+        "chunk_id": metadata.get("chunk_id", metadata.get("chunk_ids")),
+        "text": doc.page_content[:200],
+    }
+
+
+def run_query_record(context, collection, line_no, record, strategy="baseline", k=3, query_field="query",
+                     filter=None):
+    """
+    Run one JSONL record and return its output line as a dict. A record may
+    override the strategy ("strategy"), result count ("k") and metadata
+    filter ("filter"); its "id" (or the input line number) is echoed back
+    for joining.
+    """
+    out = {"line": line_no, "id": record.get("id", record.get("request_id"))}
+    if "error" in record:
+        return {**out, "error": record["error"]}
+
+    name = record.get("strategy") or strategy
+    out.update(query=record[query_field], strategy=name)
+    if name not in STRATEGIES:
+        return {**out, "error": f"unknown strategy '{name}'"}
+
+    start = time.perf_counter()
+    try:
+        docs = STRATEGIES[name](context, collection, record[query_field], k=int(record.get("k", k)),
+                                filter=record.get("filter", filter))
+    except Exception as e:
+        return {**out, "latency_ms": (time.perf_counter() - start) * 1000.0, "error": f"{type(e).__name__}: {e}"}
+    return {**out, "latency_ms": (time.perf_counter() - start) * 1000.0, "results": [result_entry(d) for d in docs]}
+
+
+def run_batch(context, collection, input_path, output_path=DEFAULT_BATCH_OUTPUT, workers=4, strategy="baseline",
+              k=3, query_field="query", filter=None):
+    """
+    Replay queries from `input_path` through `workers` concurrent strategy
+    calls. Records are read lazily and at most 2 x `workers` are queued, so
+    memory stays flat for any log size; each result is written (and flushed)
+    to `output_path` as soon as it finishes, in completion order. Pass "-"
+    to write to stdout. Returns the latency summary.
+    """
+    if output_path != "-" and os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    out = sys.stdout if output_path == "-" else open(output_path, "w", encoding="utf-8")
+
+    latencies = []
+    errors = 0
+    done = 0
+
+    def drain(in_flight, return_when):
+        nonlocal errors, done
+        finished, _ = wait_futures(in_flight, return_when=return_when)
+        for future in finished:
+            in_flight.pop(future)
+            entry = future.result()
+            out.write(json.dumps(entry, default=str) + "\n")
+            out.flush()
+            done += 1
+            if "error" in entry:
+                errors += 1
+            if "latency_ms" in entry:
+                latencies.append(entry["latency_ms"] / 1000.0)
+            if done % 100 == 0:
+                print(f"  📨 {done} queries done ({errors} errors)", file=sys.stderr)
+
+    wall_start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            in_flight = {}
+            for line_no, record in iter_query_records(input_path, query_field):
+                if len(in_flight) >= workers * 2:
+                    drain(in_flight, FIRST_COMPLETED)
+                future = pool.submit(run_query_record, context, collection, line_no, record, strategy, k, query_field,
+                                     filter)
+                in_flight[future] = line_no
+            if in_flight:
+                drain(in_flight, ALL_COMPLETED)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    wall_time = time.perf_counter() - wall_start
+
+    summary = summarize_latencies(latencies, wall_time, errors) if latencies else {"runs": 0, "errors": errors}
+    summary["queries"] = done
+    summary["wall_s"] = wall_time
+    return summary
+
+
+def print_batch_summary(summary, output_path):
+    print(f"\n📦 {summary['queries']} queries ({summary['errors']} errors) in {summary['wall_s']:.2f}s", file=sys.stderr)
+    if summary.get("runs"):
+        print(f"   p50 {summary['p50_ms']:.1f}ms  p95 {summary['p95_ms']:.1f}ms  p99 {summary['p99_ms']:.1f}ms  "
+              f"throughput {summary['queries'] / summary['wall_s']:.1f} queries/sec", file=sys.stderr)
+    if output_path != "-":
+        print(f"💾 Results streamed to {output_path}", file=sys.stderr)
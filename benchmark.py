@@ -0,0 +1,341 @@
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from embedding_helper import StubEmbeddings, stub_embed_batch
+from qdrant_helper import (
+    collection_config, detect_vector_dims, generate_json_from_docs, generate_parent_child_docs, make_qdrant_client,
+    make_search_params, open_parent_docstore, setup_qdrant, upload_points,
+)
+from retrievers.context import RetrievalContext
+from retrievers.fusion import document_key
+from retrievers.strategies import STRATEGIES
+from vector_artifact import count_documents, iter_documents
+
+DEFAULT_RESULTS_PATH = "data/benchmark_results.json"
+
+_VARIANT_ANGLES = ["in practice", "step by step", "common pitfalls", "compared with alternatives", "at scale"]
+
+
+class StubChatModel(BaseChatModel):
+    """
+    Offline stand-in for ChatOllama: answers the multi-query prompt with
+    deterministic variants of the original question after `latency` seconds.
+    """
+
+    model: str = "stub-llm"
+    latency: float = 0.0
+    n_variants: int = 3
+
+    @property
+    def _llm_type(self):
+        return "stub"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = messages[-1].content
+        question = prompt.rsplit("Original question:", 1)[-1].strip()
+        text = "\n".join(f"{question} ({angle})" for angle in _VARIANT_ANGLES[:self.n_variants])
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+
+def build_offline_context(input_file, collection, embed_latency=0.0, llm_latency=0.0, workdir=None, backend="qdrant"):
+    """
+    Ingest `input_file` with stub embeddings into qdrant-client's in-process
+    mode (flat, children and parent docstore) and return a RetrievalContext
+    wired to stub embedding and LLM backends. Nothing touches the network.
+    With backend="numpy" the artifacts are searched in process and Qdrant
+    is not used at all.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="rag_bench_")
+    flat_path = os.path.join(workdir, "demo_data")
+    children_path = os.path.join(workdir, "parent_child")
+    docstore_path = os.path.join(workdir, "parent_docstore")
+
+    generate_json_from_docs(input_file, flat_path, embed_fn=stub_embed_batch, cache=False)
+    generate_parent_child_docs(input_file, children_path, docstore_path, embed_fn=stub_embed_batch, cache=False)
+
+    client = None
+    if backend == "qdrant":
+        client = make_qdrant_client(":memory:", 0)
+        setup_qdrant(":memory:", 0, collection, flat_path, client=client)
+        setup_qdrant(":memory:", 0, f"{collection}_children", children_path, client=client)
+
+    return RetrievalContext(
+        client=client,
+        backend=backend,
+        data_paths={collection: flat_path, f"{collection}_children": children_path},
+        embeddings=StubEmbeddings(latency=embed_latency),
+        llm=StubChatModel(latency=llm_latency),
+        expansion_cache=False,
+        docstore=open_parent_docstore(docstore_path),
+    )
+
+
+def summarize_latencies(latencies, wall_time, errors=0):
+    """Latency percentiles of the successful runs in `latencies`; the *_ms fields are None when there are none."""
+    if not len(latencies):
+        return {"runs": 0, "errors": errors, "mean_ms": None, "min_ms": None, "p50_ms": None, "p95_ms": None,
+                "p99_ms": None, "max_ms": None, "throughput_qps": 0.0}
+    ms = np.asarray(latencies, dtype=np.float64) * 1000.0
+    return {
+        "runs": len(latencies),
+        "errors": errors,
+        "mean_ms": float(ms.mean()),
+        "min_ms": float(ms.min()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+        "throughput_qps": len(latencies) / wall_time if wall_time > 0 else float("inf"),
+    }
+
+
+def benchmark_strategy(strategy, context, collection, queries, runs=20, warmup=3, k=3, filter=None):
+    """
+    Run `strategy` `warmup` untimed times, then `runs` timed times cycling
+    through `queries`. A failing call never aborts the benchmark: failed
+    timed runs are counted in "errors" and left out of the latency stats
+    (so "runs" is the number that succeeded), failed warmups in "warmup_errors".
+    """
+    warmup_errors = 0
+    for i in range(warmup):
+        try:
+            strategy(context, collection, queries[i % len(queries)], k=k, filter=filter)
+        except Exception as e:
+            warmup_errors += 1
+            print(f"⚠️  Warmup {i} failed: {e}")
+
+    latencies = []
+    errors = 0
+    wall_start = time.perf_counter()
+    for i in range(runs):
+        start = time.perf_counter()
+        try:
+            strategy(context, collection, queries[i % len(queries)], k=k, filter=filter)
+        except Exception as e:
+            errors += 1
+            print(f"⚠️  Run {i} failed: {e}")
+            continue
+        latencies.append(time.perf_counter() - start)
+    stats = summarize_latencies(latencies, time.perf_counter() - wall_start, errors)
+    stats["warmup_errors"] = warmup_errors
+    return stats
+
+
+def run_benchmark(context, collection, queries, strategies=None, runs=20, warmup=3, k=3, config=None, filter=None):
+    strategies = strategies or list(STRATEGIES)
+    results = {}
+    for name in strategies:
+        print(f"⏱️  Benchmarking {name}: {warmup} warmup + {runs} timed runs...")
+        results[name] = benchmark_strategy(STRATEGIES[name], context, collection, queries, runs, warmup, k, filter)
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "environment": {"python": sys.version.split()[0], "platform": platform.platform()},
+        "config": {"runs": runs, "warmup": warmup, "k": k, "queries": queries, "filter": filter, **(config or {})},
+        "results": results,
+    }
+
+
+def print_benchmark_table(report):
+    print(f"\n{'Strategy':<20}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'qps':>10}{'errors':>8}")
+    print("-" * 78)
+    for name, r in report["results"].items():
+        if not r["runs"]:
+            print(f"{name:<20}{'every run failed':>50}{r['errors']:>8}")
+            continue
+        print(f"{name:<20}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+              f"{r['mean_ms']:>10.2f}{r['throughput_qps']:>10.1f}{r['errors']:>8}")
+
+
+def compare_reports(previous, current, threshold=0.10):
+    """Print p50/p95 change per strategy vs. an earlier report; flag slowdowns beyond `threshold`."""
+    print(f"\n📈 Change vs. previous run ({previous.get('timestamp', 'unknown')}):")
+    regressions = []
+    for name, cur in current["results"].items():
+        prev = previous.get("results", {}).get(name)
+        if prev is None:
+            print(f"  {name:<20} (new)")
+            continue
+        if cur.get("p50_ms") is None or prev.get("p50_ms") is None:
+            print(f"  {name:<20} (no successful runs to compare)")
+            continue
+        deltas = {m: (cur[m] - prev[m]) / prev[m] if prev[m] else 0.0 for m in ("p50_ms", "p95_ms")}
+        flag = "🚨" if any(d > threshold for d in deltas.values()) else "✅"
+        if flag == "🚨":
+            regressions.append(name)
+        print(f"  {flag} {name:<20} p50 {deltas['p50_ms']:+.1%}  p95 {deltas['p95_ms']:+.1%}")
+    return regressions
+
+
+def write_report(report, path=DEFAULT_RESULTS_PATH):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Benchmark results written to {path}")
+
+
+def compare_recall(context, collection, queries, strategies=("hybrid",), reference="multi_query", k=3,
+                   filter=None):
+    """
+    How much of `reference`'s extra recall each strategy reproduces, and at
+    what latency, without relevance labels.
+
+    Multi-query's value is the chunks it finds that plain similarity search
+    misses. Per query, "gain" = reference results not in the baseline top-k;
+    a strategy's `gain_recovered` is the share of that gain it also returns,
+    `overlap@k` its plain overlap with the reference top-k and `novel` the
+    mean number of results beyond baseline. Every strategy's results are
+    cut to its first k before comparing, so a reference that returns the
+    union of its variants' hits (plain multi-query) is not credited with
+    more than k chunks. Every strategy runs once per query after one
+    untimed warmup.
+    """
+    names = ["baseline", reference, *[s for s in strategies if s not in ("baseline", reference)]]
+    results = {name: [] for name in names}
+    latencies = {name: [] for name in names}
+    for name in names:
+        STRATEGIES[name](context, collection, queries[0], k=k, filter=filter)
+        for query in queries:
+            start = time.perf_counter()
+            docs = STRATEGIES[name](context, collection, query, k=k, filter=filter)
+            latencies[name].append(time.perf_counter() - start)
+            results[name].append({document_key(d) for d in docs[:k]})
+
+    rows = []
+    for name in names:
+        overlap, recovered, novel = [], [], []
+        for got, want, base in zip(results[name], results[reference], results["baseline"]):
+            if want:
+                overlap.append(len(got & want) / len(want))
+            gain = want - base
+            if gain:
+                recovered.append(len((got - base) & gain) / len(gain))
+            novel.append(len(got - base))
+        stats = summarize_latencies(latencies[name], sum(latencies[name]))
+        rows.append({
+            "strategy": name,
+            f"overlap@{k}": float(np.mean(overlap)) if overlap else None,
+            "gain_recovered": float(np.mean(recovered)) if recovered else None,
+            "novel": float(np.mean(novel)),
+            "p50_ms": stats["p50_ms"],
+            "p95_ms": stats["p95_ms"],
+        })
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "reference": reference, "k": k, "queries": queries, "filter": filter, "results": rows,
+    }
+
+
+def print_recall_table(report):
+    k = report["k"]
+    ref = next(r for r in report["results"] if r["strategy"] == report["reference"])
+    fmt = lambda v: f"{v:.2f}" if v is not None else "-"
+    print(f"\nReference: {report['reference']} ({len(report['queries'])} queries, k={k}); "
+          f"gain = its results missing from baseline")
+    print(f"{'Strategy':<20}{f'overlap@{k}':>11}{'gain rec.':>11}{'novel':>8}{'p50 ms':>10}{'p95 ms':>10}{'vs ref':>9}")
+    print("-" * 79)
+    for r in report["results"]:
+        speed = ref["p50_ms"] / r["p50_ms"] if r["p50_ms"] else float("inf")
+        print(f"{r['strategy']:<20}{fmt(r[f'overlap@{k}']):>11}{fmt(r['gain_recovered']):>11}{r['novel']:>8.2f}"
+              f"{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{speed:>8.1f}x")
+
+
+def sample_query_vectors(data_path, num_queries=50, noise=0.1, seed=0):
+    """
+    Deterministic query set for recall tests: stored vectors picked at random
+    and nudged by Gaussian noise, so queries sit near real data without being
+    exact copies of indexed points.
+    """
+    rng = np.random.default_rng(seed)
+    total = count_documents(data_path)
+    picks = set(rng.choice(total, size=min(num_queries, total), replace=False).tolist())
+    rows = np.array([d["vector"] for i, d in enumerate(iter_documents(data_path)) if i in picks], dtype=np.float32)
+    rows /= np.linalg.norm(rows, axis=1, keepdims=True)
+    rows += rng.normal(0.0, noise / np.sqrt(rows.shape[1]), size=rows.shape).astype(np.float32)
+    return rows
+
+
+def _timed_searches(client, collection, queries, k, search_params):
+    ids, latencies = [], []
+    for vector in queries:
+        start = time.perf_counter()
+        response = client.query_points(collection_name=collection, query=vector.tolist(), limit=k,
+                                       search_params=search_params, with_payload=False)
+        latencies.append(time.perf_counter() - start)
+        ids.append([str(p.id) for p in response.points])
+    return ids, latencies
+
+
+def compare_quantization(client, data_path, modes=("scalar", "binary"), num_queries=50, k=10,
+                         oversampling=2.0, on_disk=False, prefix="quant_bench"):
+    """
+    Recall@k and latency of quantized collections vs. the unquantized one.
+
+    Builds throwaway collections `<prefix>_<mode>` from `data_path`. Exact
+    (brute-force) search on the float32 collection is the ground truth; the
+    float32 HNSW search and every quantized mode, with and without
+    rescoring, are measured against it. The collections are deleted again.
+    """
+    dims = detect_vector_dims(data_path)
+    count = count_documents(data_path)
+    queries = sample_query_vectors(data_path, num_queries)
+    vector_bytes = {"none": count * dims * 4, "scalar": count * dims, "binary": count * dims // 8}
+
+    collections = {}
+    try:
+        for mode in ("none", *modes):
+            name = f"{prefix}_{mode}"
+            if client.collection_exists(name):
+                client.delete_collection(name)
+            client.create_collection(collection_name=name, **collection_config(dims, mode, on_disk))
+            upload_points(client, name, data_path, wait=True)
+            collections[mode] = name
+
+        truth, _ = _timed_searches(client, collections["none"], queries, k, make_search_params(exact=True))
+        variants = [("none", "hnsw", make_search_params())]
+        for mode in modes:
+            variants.append((mode, "no rescore", make_search_params(rescore=False)))
+            variants.append((mode, f"rescore x{oversampling:g}", make_search_params(rescore=True, oversampling=oversampling)))
+
+        rows = []
+        for mode, label, params in variants:
+            ids, latencies = _timed_searches(client, collections[mode], queries, k, params)
+            recall = np.mean([len(set(got) & set(want)) / len(want) for got, want in zip(ids, truth) if want])
+            stats = summarize_latencies(latencies, sum(latencies))
+            rows.append({
+                "quantization": mode,
+                "search": label,
+                f"recall@{k}": float(recall),
+                "p50_ms": stats["p50_ms"],
+                "p95_ms": stats["p95_ms"],
+                # RAM for the vectors Qdrant scores first: quantized copies stay in RAM, originals may be on disk
+                "vector_ram_mb": (vector_bytes[mode] if mode != "none" or not on_disk else 0) / 2**20,
+            })
+        return {"dims": dims, "points": count, "queries": len(queries), "k": k, "on_disk": on_disk, "results": rows}
+    finally:
+        for name in collections.values():
+            client.delete_collection(name)
+
+
+def print_quantization_table(report):
+    k = report["k"]
+    print(f"\n{report['points']} points x {report['dims']} dims, {report['queries']} queries, "
+          f"ground truth = exact float32 search")
+    print(f"{'Quantization':<14}{'Search':<16}{f'recall@{k}':>11}{'p50 ms':>10}{'p95 ms':>10}{'vector RAM MB':>15}")
+    print("-" * 76)
+    for r in report["results"]:
+        print(f"{r['quantization']:<14}{r['search']:<16}{r[f'recall@{k}']:>11.3f}{r['p50_ms']:>10.2f}"
+              f"{r['p95_ms']:>10.2f}{r['vector_ram_mb']:>15.2f}")
+
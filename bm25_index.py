@@ -0,0 +1,247 @@
+import heapq
+import itertools
+import json
+import math
+import os
+import re
+import shutil
+from array import array
+from collections import Counter
+
+import numpy as np
+
+BM25_FORMAT = "rag-bm25"
+BM25_VERSION = 1
+BM25_DIR = "bm25"
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Postings buffered in memory at ingest before they are spilled to a sorted run on disk
+BM25_SPILL_POSTINGS = int(os.getenv("BM25_SPILL_POSTINGS", "2000000"))
+
+_TOKEN = re.compile(r"\w+")
+# Words too common to say anything about a chunk; single characters are dropped as well
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in into is it its just me my no not of on
+or our so than that the their them then there these they this to too was we were what when where which who why
+will with you your
+""".split())
+
+
+def tokenize(text):
+    """Lowercased word tokens without stopwords; the same function is used at ingest and query time."""
+    return [t for t in _TOKEN.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+
+def bm25_index_path(data_path):
+    """bm25/ inside an artifact directory, or <name>.bm25/ next to a legacy JSON file."""
+    if data_path.endswith(".json"):
+        return data_path[:-len(".json")] + ".bm25"
+    return os.path.join(data_path, BM25_DIR)
+
+
+class BM25IndexWriter:
+    """
+    Build a BM25 inverted index over records in artifact order:
+
+        bm25.json        {"format", "version", "docs", "terms", "postings", "avgdl", "k1", "b"}
+        vocab.txt        one term per line, sorted; line number = term id
+        offsets.u64      terms + 1 offsets into the posting arrays
+        postings.u32     document rows, grouped by term
+        tfs.u16          term frequency for each posting
+        doc_len.u32      tokens per document
+        ids.txt          point ID per document row
+
+    Everything but the vocabulary is a flat little-endian array that the
+    reader memory-maps. As with vector artifacts, bm25.json is written last.
+
+    Postings are buffered in memory only up to `spill_postings`; then they
+    are written out as a term-sorted run under runs/. close() merges the
+    runs term by term, so memory stays bounded by one buffer however large
+    the corpus. Runs hold consecutive document rows, so concatenating a
+    term's postings in run order keeps them sorted by row.
+    """
+
+    def __init__(self, path, spill_postings=None):
+        self.path = path
+        self.spill_postings = spill_postings or BM25_SPILL_POSTINGS
+        self.docs = 0
+        self.tokens = 0
+        self._postings = {}   # term -> (array rows, array tfs), since the last spill
+        self._buffered = 0
+        self._runs = []
+        self._runs_dir = os.path.join(path, "runs")
+        os.makedirs(path, exist_ok=True)
+        manifest_path = os.path.join(path, "bm25.json")
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        shutil.rmtree(self._runs_dir, ignore_errors=True)
+        self._ids = open(os.path.join(path, "ids.txt"), "w", encoding="utf-8")
+        self._doc_len = open(os.path.join(path, "doc_len.u32"), "wb")
+
+    def add(self, point_id, text):
+        tokens = tokenize(text)
+        term_counts = Counter(tokens)
+        for term, tf in term_counts.items():
+            rows, tfs = self._postings.setdefault(term, (array("I"), array("H")))
+            rows.append(self.docs)
+            tfs.append(min(tf, 0xFFFF))
+        self._buffered += len(term_counts)
+        array("I", [len(tokens)]).tofile(self._doc_len)
+        self._ids.write(f"{point_id}\n")
+        self.tokens += len(tokens)
+        self.docs += 1
+        if self._buffered >= self.spill_postings:
+            self._spill()
+
+    def _spill(self):
+        """Write the buffered postings as one term-sorted run and start a new buffer."""
+        if not self._postings:
+            return
+        os.makedirs(self._runs_dir, exist_ok=True)
+        base = os.path.join(self._runs_dir, f"run-{len(self._runs):05d}")
+        with open(base + ".terms", "w", encoding="utf-8") as terms_f, \
+                open(base + ".rows", "wb") as rows_f, open(base + ".tfs", "wb") as tfs_f:
+            for term in sorted(self._postings):
+                rows, tfs = self._postings[term]
+                terms_f.write(f"{term}\t{len(rows)}\n")
+                rows.tofile(rows_f)
+                tfs.tofile(tfs_f)
+        self._runs.append(base)
+        self._postings = {}
+        self._buffered = 0
+
+    @staticmethod
+    def _read_run(index, base):
+        """(term, run index, rows, tfs) for every term of one run, in term order."""
+        with open(base + ".terms", "r", encoding="utf-8") as terms_f, \
+                open(base + ".rows", "rb") as rows_f, open(base + ".tfs", "rb") as tfs_f:
+            for line in terms_f:
+                term, n = line.rstrip("\n").split("\t")
+                rows, tfs = array("I"), array("H")
+                rows.fromfile(rows_f, int(n))
+                tfs.fromfile(tfs_f, int(n))
+                yield term, index, rows, tfs
+
+    def close(self):
+        self._ids.close()
+        self._doc_len.close()
+        self._spill()
+        terms = 0
+        offsets = array("Q", [0])
+        runs = [self._read_run(i, base) for i, base in enumerate(self._runs)]
+        with open(os.path.join(self.path, "postings.u32"), "wb") as rows_f, \
+                open(os.path.join(self.path, "tfs.u16"), "wb") as tfs_f, \
+                open(os.path.join(self.path, "vocab.txt"), "w", encoding="utf-8") as vocab_f:
+            merged = heapq.merge(*runs, key=lambda entry: entry[:2])
+            for term, entries in itertools.groupby(merged, key=lambda entry: entry[0]):
+                postings = 0
+                for _, _, rows, tfs in entries:
+                    rows.tofile(rows_f)
+                    tfs.tofile(tfs_f)
+                    postings += len(rows)
+                vocab_f.write(f"{term}\n")
+                offsets.append(offsets[-1] + postings)
+                terms += 1
+        with open(os.path.join(self.path, "offsets.u64"), "wb") as f:
+            offsets.tofile(f)
+        shutil.rmtree(self._runs_dir, ignore_errors=True)
+        manifest = {
+            "format": BM25_FORMAT,
+            "version": BM25_VERSION,
+            "docs": self.docs,
+            "terms": terms,
+            "postings": offsets[-1],
+            "avgdl": self.tokens / self.docs if self.docs else 0.0,
+            "k1": BM25_K1,
+            "b": BM25_B,
+        }
+        with open(os.path.join(self.path, "bm25.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._ids.close()
+            self._doc_len.close()
+            shutil.rmtree(self._runs_dir, ignore_errors=True)
+        return False
+
+
+def write_bm25_index(data_path, records):
+    """Index the "text" of `records` (in artifact order) next to the artifact at `data_path`."""
+    with BM25IndexWriter(bm25_index_path(data_path)) as writer:
+        for record in records:
+            writer.add(record["id"], record["text"])
+    return writer.docs
+
+
+def _map(path, name, dtype, count):
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(os.path.join(path, name), dtype=dtype, mode="r", shape=(count,))
+
+
+class BM25Index:
+    """
+    Read side of BM25IndexWriter. Posting arrays are memory-mapped; only the
+    vocabulary (term -> id) and point IDs are held as Python objects.
+    A query touches the postings of its own terms and nothing else.
+    """
+
+    def __init__(self, path):
+        manifest_path = os.path.join(path, "bm25.json")
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f"No BM25 index at {path} (run `python main.py` to build it at ingest)")
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != BM25_FORMAT:
+            raise ValueError(f"{path} is not a {BM25_FORMAT} index")
+        self.path = path
+        self.docs = manifest["docs"]
+        self.avgdl = manifest["avgdl"] or 1.0
+        self.k1 = manifest["k1"]
+        self.b = manifest["b"]
+        with open(os.path.join(path, "vocab.txt"), "r", encoding="utf-8") as f:
+            self.vocab = {line.rstrip("\n"): i for i, line in enumerate(f)}
+        with open(os.path.join(path, "ids.txt"), "r", encoding="utf-8") as f:
+            self.ids = [line.rstrip("\n") for line in f]
+        self.offsets = _map(path, "offsets.u64", np.uint64, manifest["terms"] + 1)
+        self.postings = _map(path, "postings.u32", np.uint32, manifest["postings"])
+        self.tfs = _map(path, "tfs.u16", np.uint16, manifest["postings"])
+        doc_len = _map(path, "doc_len.u32", np.uint32, self.docs).astype(np.float32)
+        # Per-document part of the BM25 denominator, computed once
+        self._norm = self.k1 * (1.0 - self.b + self.b * doc_len / self.avgdl)
+
+    def __len__(self):
+        return self.docs
+
+    def scores(self, query):
+        """BM25 score of every document for `query` (zeros where no term matches)."""
+        scores = np.zeros(self.docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            rows = self.postings[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            df = end - start
+            idf = math.log(1.0 + (self.docs - df + 0.5) / (df + 0.5))
+            scores[rows] += idf * tf * (self.k1 + 1.0) / (tf + self._norm[rows])
+        return scores
+
+    def search(self, query, k=10):
+        """Top-k (point_id, score) pairs, best first; documents without a query term are never returned."""
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores)
+        if not len(matched) or k <= 0:
+            return []
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(self.ids[row], float(scores[row])) for row in matched]
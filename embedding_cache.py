@@ -0,0 +1,375 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from langchain_core.embeddings import Embeddings
+
+from tracing import count, span
+
+EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+# Set EMBED_CACHE_PATH to an empty string to disable the persistent cache
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "data/embedding_cache.sqlite")
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "1024"))
+# Seconds before an in-process query embedding expires; 0 keeps entries until evicted
+QUERY_EMBED_CACHE_TTL = float(os.getenv("QUERY_EMBED_CACHE_TTL", "0"))
+# LRU bookkeeping of the SQLite caches: last_access updates are buffered and written this many keys at a time,
+# and the size cap is checked every max_entries / 100 inserts (at most EVICT_CHECK_INTERVAL)
+LAST_ACCESS_BATCH = 256
+EVICT_CHECK_INTERVAL = 1000
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """Normalize text before hashing so cosmetic whitespace changes still hit."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model, text):
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache stored in SQLite.
+
+    Entries are keyed by embedding model plus a SHA-256 of the normalized text
+    and stored as float32 blobs. The table is capped at `max_entries` with
+    least-recently-used eviction. SQLite's file locking (WAL mode plus a busy
+    timeout) makes the cache safe to share between threads and processes, e.g.
+    `main.py` ingesting while `run_retrievers.py` answers queries.
+
+    Lookups are plain autocommit reads, which WAL never blocks; only writes
+    take the write lock. Hits are recorded in a LastAccessBuffer and written
+    in batches, and the cap is enforced every `evict_interval(max_entries)`
+    inserts, so the LRU order is approximate and the table can run over
+    `max_entries` by up to that many rows between checks.
+    """
+
+    def __init__(self, path=None, max_entries=None):
+        self.path = path or EMBED_CACHE_PATH
+        self.max_entries = max_entries or EMBED_CACHE_MAX_ENTRIES
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._touches = LastAccessBuffer("embeddings")
+        self._evict_interval = evict_interval(self.max_entries)
+        self._inserts_since_check = 0
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings(last_access)")
+
+    def _connection(self):
+        # sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _connect(self):
+        """Write transaction on this thread's connection."""
+        return SQLiteTransaction(self._connection())
+
+    def get_many(self, model, texts):
+        """Return cached vectors for `texts` (None where missing), in order."""
+        keys = [cache_key(model, t) for t in texts]
+        found = {}
+        conn = self._connection()   # autocommit: each SELECT is its own read transaction
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            placeholders = ",".join("?" * len(part))
+            rows = conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+            ).fetchall()
+            found.update((k, list(array("f", blob))) for k, blob in rows)
+        if found and self._touches.add(found):
+            with self._connect() as conn:
+                self._touches.flush(conn)
+        with self._stats_lock:
+            self.hits += sum(1 for k in keys if k in found)
+            self.misses += sum(1 for k in keys if k not in found)
+        return [found.get(k) for k in keys]
+
+    def put_many(self, model, texts, vectors):
+        now = time.time()
+        rows = [
+            (cache_key(model, t), model, array("f", v).tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+        with self._stats_lock:
+            self._inserts_since_check += len(rows)
+            check = self._inserts_since_check >= self._evict_interval
+            if check:
+                self._inserts_since_check = 0
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_access) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            if check:
+                # Recent hits must be on disk before the least recently used rows are picked
+                self._touches.flush(conn)
+                entries = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                if entries > self.max_entries:
+                    conn.execute(
+                        "DELETE FROM embeddings WHERE key IN ("
+                        " SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                        (entries - self.max_entries,),
+                    )
+
+    def stats(self):
+        entries = self._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries,
+        }
+
+
+class SQLiteTransaction:
+    """Run a block inside BEGIN IMMEDIATE so writers from other processes queue up."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def evict_interval(max_entries):
+    """Inserts between checks of a cache's size cap: every insert for tiny caches, at most EVICT_CHECK_INTERVAL."""
+    return max(1, min(EVICT_CHECK_INTERVAL, max_entries // 100))
+
+
+class LastAccessBuffer:
+    """
+    last_access updates for one cache table, collected in memory so a cache
+    hit doesn't need the write lock. add() says when `batch_size` keys are
+    pending; flush() writes them inside the caller's write transaction.
+    """
+
+    def __init__(self, table, batch_size=LAST_ACCESS_BATCH):
+        self.table = table
+        self.batch_size = batch_size
+        self._pending = {}   # key -> last access time
+        self._lock = threading.Lock()
+
+    def add(self, keys):
+        """Record an access to `keys`; True once a flush is due."""
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                self._pending[key] = now
+            return len(self._pending) >= self.batch_size
+
+    def flush(self, conn):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            conn.executemany(f"UPDATE {self.table} SET last_access = ? WHERE key = ?",
+                             [(at, key) for key, at in pending.items()])
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Process-wide cache at EMBED_CACHE_PATH, or None when caching is disabled."""
+    global _default_cache
+    if not EMBED_CACHE_PATH:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+        return _default_cache
+
+
+class CachedEmbeddings(Embeddings):
+    """LangChain Embeddings wrapper that reads and fills an EmbeddingCache."""
+
+    def __init__(self, embeddings, model, cache):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        vectors = self.cache.get_many(self.model, texts)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            fresh = self.embeddings.embed_documents([texts[i] for i in missing])
+            self.cache.put_many(self.model, [texts[i] for i in missing], fresh)
+            for i, v in zip(missing, fresh):
+                vectors[i] = v
+        return vectors
+
+    def embed_query(self, text):
+        cached = self.cache.get_many(self.model, [text])[0]
+        if cached is not None:
+            return cached
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many(self.model, [text], [vector])
+        return vector
+
+
+class QueryEmbeddingCache(Embeddings):
+    """
+    In-process LRU in front of another Embeddings object.
+
+    Retrieval strategies embed the same query string several times (baseline,
+    multi-query fallback, parent-doc and its fallback); this keeps the last
+    `max_size` vectors in memory, optionally expiring them after `ttl`
+    seconds. Concurrent requests for a text that is already being embedded
+    wait for that result instead of issuing a second call.
+    """
+
+    def __init__(self, embeddings, max_size=None, ttl=None):
+        self.embeddings = embeddings
+        self.max_size = max_size or QUERY_EMBED_CACHE_SIZE
+        self.ttl = QUERY_EMBED_CACHE_TTL if ttl is None else ttl
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def _get_locked(self, text):
+        entry = self._entries.get(text)
+        if entry is None:
+            return None
+        vector, stored_at = entry
+        if self.ttl and time.monotonic() - stored_at > self.ttl:
+            del self._entries[text]
+            return None
+        self._entries.move_to_end(text)
+        return vector
+
+    def _put_locked(self, text, vector):
+        self._entries[text] = (vector, time.monotonic())
+        self._entries.move_to_end(text)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _embed(self, texts, embed_many):
+        results = [None] * len(texts)
+        owned = {}
+        waiting = {}
+        with self._lock:
+            for i, text in enumerate(texts):
+                vector = self._get_locked(text)
+                if vector is not None:
+                    self.hits += 1
+                    results[i] = vector
+                elif text in owned:
+                    self.hits += 1
+                    owned[text].append(i)
+                elif text in self._inflight:
+                    self.coalesced += 1
+                    waiting.setdefault(text, []).append(i)
+                else:
+                    self.misses += 1
+                    self._inflight[text] = Future()
+                    owned[text] = [i]
+
+        coalesced = sum(len(indices) for indices in waiting.values())
+        count("query_embed_cache_hits", len(texts) - len(owned) - coalesced)
+        count("query_embed_cache_misses", len(owned))
+        count("query_embed_cache_coalesced", coalesced)
+        if owned:
+            pending = list(owned)
+            try:
+                with span("embed.query", texts=len(pending)):
+                    vectors = embed_many(pending)
+            except Exception as e:
+                with self._lock:
+                    for text in pending:
+                        self._inflight.pop(text).set_exception(e)
+                raise
+            with self._lock:
+                for text, vector in zip(pending, vectors):
+                    self._put_locked(text, vector)
+                    self._inflight.pop(text).set_result(vector)
+            for text, vector in zip(pending, vectors):
+                for i in owned[text]:
+                    results[i] = vector
+
+        for text, indices in waiting.items():
+            with self._lock:
+                future = self._inflight.get(text)
+                vector = self._get_locked(text) if future is None else None
+            if future is not None:
+                vector = future.result()
+            elif vector is None:
+                vector = embed_many([text])[0]
+            for i in indices:
+                results[i] = vector
+        return results
+
+    def embed_documents(self, texts):
+        return self._embed(list(texts), self.embeddings.embed_documents)
+
+    def embed_query(self, text):
+        return self._embed([text], lambda texts: [self.embeddings.embed_query(texts[0])])[0]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+                "size": len(self._entries),
+            }
+
+
+_query_embeddings = {}
+_query_embeddings_lock = threading.Lock()
+
+
+def get_query_embeddings(model=None):
+    """
+    Process-wide query embedder for `model`: OllamaEmbeddings behind the
+    shared on-disk cache (when enabled) and an in-process QueryEmbeddingCache.
+    """
+    from langchain_ollama import OllamaEmbeddings
+
+    model = model or EMBED_MODEL
+    with _query_embeddings_lock:
+        if model not in _query_embeddings:
+            embeddings = OllamaEmbeddings(model=model)
+            cache = get_embedding_cache()
+            if cache is not None:
+                embeddings = CachedEmbeddings(embeddings, model, cache)
+            _query_embeddings[model] = QueryEmbeddingCache(embeddings)
+        return _query_embeddings[model]
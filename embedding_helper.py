@@ -0,0 +1,148 @@
+import hashlib
+import math
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import ollama
+from langchain_core.embeddings import Embeddings
+
+from retry import call_with_retry
+from tracing import bind_context, count, span
+
+EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+STUB_EMBED_DIMS = int(os.getenv("STUB_EMBED_DIMS", "768"))
+
+
+def ollama_embed_batch(texts, model=None):
+    """Embed a list of texts with a single Ollama request."""
+    response = ollama.embed(model=model or EMBED_MODEL, input=list(texts))
+    return [list(v) for v in response["embeddings"]]
+
+
+def stub_embed_batch(texts, model=None, dims=None, latency=0.0):
+    """
+    Deterministic offline embedder for tests and benchmarks.
+    Each vector is derived from a SHA-256 of the text, so the same text always
+    maps to the same unit-length vector regardless of process or machine.
+    `latency` simulates the round trip of a real embedding server.
+    """
+    dims = dims or STUB_EMBED_DIMS
+    if latency:
+        time.sleep(latency)
+    vectors = []
+    for text in texts:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        vec = [rng.gauss(0.0, 1.0) for _ in range(dims)]
+        norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+        vectors.append([x / norm for x in vec])
+    return vectors
+
+
+class StubEmbeddings(Embeddings):
+    """LangChain Embeddings over stub_embed_batch, with simulated per-call latency."""
+
+    def __init__(self, dims=None, latency=0.0):
+        self.dims = dims or STUB_EMBED_DIMS
+        self.latency = latency
+
+    def embed_documents(self, texts):
+        return stub_embed_batch(list(texts), dims=self.dims, latency=self.latency)
+
+    def embed_query(self, text):
+        return stub_embed_batch([text], dims=self.dims, latency=self.latency)[0]
+
+
+def get_embed_fn(backend=None):
+    """Pick the batch embedding function from EMBED_BACKEND (ollama | stub)."""
+    backend = backend or os.getenv("EMBED_BACKEND", "ollama")
+    if backend == "stub":
+        return stub_embed_batch
+    if backend == "ollama":
+        return ollama_embed_batch
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def _embed_with_retry(embed_fn, texts, model, max_retries):
+    def attempt_embed(attempt):
+        with span("embed.batch", texts=len(texts), attempt=attempt):
+            vectors = embed_fn(texts, model=model)
+        if len(vectors) != len(texts):
+            raise ValueError(f"Embedder returned {len(vectors)} vectors for {len(texts)} texts")
+        return vectors
+
+    return call_with_retry(attempt_embed, max_retries, "Embedding batch", "embed_retries")
+
+
+def cache_namespace(embed_fn, model):
+    """
+    Cache key prefix for vectors produced by `embed_fn`.
+    Ollama vectors are keyed by model name alone so ingest and query-side
+    OllamaEmbeddings share entries; any other embedder gets its own namespace.
+    """
+    if embed_fn is ollama_embed_batch:
+        return model
+    name = getattr(embed_fn, "__name__", type(embed_fn).__name__)
+    return f"{name}:{model}"
+
+
+def embed_chunks(texts, embed_fn=None, model=None, batch_size=None, max_workers=None,
+                 max_retries=None, cache=None, verbose=True):
+    """
+    Embed `texts` in batches with a bounded number of requests in flight.
+
+    `embed_fn(texts, model=...)` takes a list of strings and returns one vector
+    per string in the same order. Failed batches are retried with exponential
+    backoff; results are returned in input order. When `cache` is given, only
+    texts missing from it are sent to the embedder. `verbose=False` drops the
+    per-call summary lines for callers that report their own progress.
+    """
+    embed_fn = embed_fn or get_embed_fn()
+    model = model or EMBED_MODEL
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    max_workers = max_workers or EMBED_WORKERS
+    max_retries = EMBED_MAX_RETRIES if max_retries is None else max_retries
+
+    texts = list(texts)
+    if cache is not None:
+        namespace = cache_namespace(embed_fn, model)
+        vectors = cache.get_many(namespace, texts)
+        pending = [i for i, v in enumerate(vectors) if v is None]
+        if verbose:
+            print(f"💾 Embedding cache: {len(texts) - len(pending)} hits, {len(pending)} misses")
+        count("embed_cache_hits", len(texts) - len(pending))
+    else:
+        vectors = [None] * len(texts)
+        pending = list(range(len(texts)))
+
+    batches = [
+        (pending[start:start + batch_size], [texts[i] for i in pending[start:start + batch_size]])
+        for start in range(0, len(pending), batch_size)
+    ]
+
+    start_time = time.time()
+    with span("embed.chunks", texts=len(pending), batches=len(batches)), ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(bind_context(_embed_with_retry), embed_fn, batch, model, max_retries): (indices, batch)
+            for indices, batch in batches
+        }
+        for future in as_completed(futures):
+            indices, batch = futures[future]
+            batch_vectors = future.result()
+            for i, vec in zip(indices, batch_vectors):
+                vectors[i] = vec
+            if cache is not None:
+                cache.put_many(namespace, batch, batch_vectors)
+    elapsed = time.time() - start_time
+    count("chunks_embedded", len(pending))
+
+    rate = len(pending) / elapsed if elapsed > 0 else float("inf")
+    if verbose:
+        print(f"⏱️  Embedded {len(pending)} chunks in {len(batches)} batches "
+              f"({max_workers} in flight) in {elapsed:.2f}s — {rate:.1f} chunks/sec")
+    return vectors
@@ -0,0 +1,361 @@
+import glob
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from bm25_index import BM25IndexWriter, bm25_index_path
+from embedding_cache import get_embedding_cache
+from embedding_helper import EMBED_BATCH_SIZE, EMBED_MODEL, EMBED_WORKERS, embed_chunks
+from text_cleaning import CorpusCleaner, removed_log_path
+from qdrant_helper import (
+    DEFAULT_DATA_PATH, UPSERT_BATCH_SIZE, UPSERT_MAX_RETRIES, UPSERT_PARALLEL, ChunkSequence, delete_stale_points,
+    ensure_collection, iter_batches, iter_text_segments, split_segment, upsert_batches,
+)
+from tracing import count, span
+from vector_artifact import VectorArtifactWriter, is_legacy_json
+
+INGEST_EXTENSIONS = tuple(os.getenv("INGEST_EXTENSIONS", ".txt,.md").split(","))
+INGEST_SPLIT_WORKERS = int(os.getenv("INGEST_SPLIT_WORKERS", "0")) or os.cpu_count() or 1
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+INGEST_PROGRESS_INTERVAL = float(os.getenv("INGEST_PROGRESS_INTERVAL", "2"))
+
+_DONE = object()
+_boilerplate = None   # per worker process, set by _init_split_worker
+
+
+class _Cancelled(Exception):
+    """Raised inside a stage when another stage failed and the pipeline is shutting down."""
+
+
+def expand_inputs(patterns, extensions=INGEST_EXTENSIONS):
+    """
+    Files named by `patterns`: plain files as given, directories walked
+    recursively for `extensions`, and glob patterns (** allowed) expanded.
+    Returned sorted and de-duplicated.
+    """
+    files = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, names in os.walk(pattern):
+                files.update(os.path.join(root, n) for n in names if n.endswith(extensions))
+        elif glob.has_magic(pattern):
+            files.update(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+        elif os.path.isfile(pattern):
+            files.add(pattern)
+        else:
+            raise FileNotFoundError(f"No such file, directory or glob match: {pattern}")
+    return sorted(files)
+
+
+def _init_split_worker(boilerplate):
+    global _boilerplate
+    _boilerplate = boilerplate
+
+
+def _timed_split(source_file, text):
+    """Process-pool worker: split_segment with the boilerplate filter the pool was started with."""
+    start = time.perf_counter()
+    chunks, removed = split_segment(source_file, text, _boilerplate)
+    return chunks, removed, time.perf_counter() - start
+
+
+class StageProgress:
+    """Items a pipeline stage has emitted and the time it spent working (not waiting)."""
+
+    def __init__(self, name, unit):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, items, elapsed):
+        with self._lock:
+            self.items += items
+            self.busy += elapsed
+
+    def rate(self):
+        return self.items / self.busy if self.busy > 0 else 0.0
+
+
+class IngestPipeline:
+    """
+    Streaming ingest: read → split + metadata → embed → write/upsert.
+
+    Each stage runs in its own thread and hands work to the next through a
+    bounded queue, so a slow stage (usually embedding) blocks the ones before
+    it instead of letting chunks pile up. In-flight chunks are bounded by
+    the queue sizes; the cleaner's line counts and near-duplicate index are
+    capped by BOILERPLATE_MAX_LINES and NEAR_DUP_MAX_CHUNKS (see
+    text_cleaning), and ChunkSequence keeps one entry per distinct chunk of
+    the current file. Files are split in the same segments and numbered
+    by the same ChunkSequence as generate_json_from_docs, so both produce
+    identical chunks and point IDs. With `clean`, a counting pass over the files
+    first finds repeated boilerplate lines, which the split workers strip,
+    and near-duplicate chunks are dropped before they reach the embedder
+    (see text_cleaning). Splitting and metadata extraction run in a
+    process pool with at most 2 x workers segments in flight, consumed in
+    submission order so chunk_id stays sequential per file. Embedded records
+    are appended to the vector artifact and BM25 index and upserted to
+    Qdrant as they arrive; the artifact and index manifests are only written
+    once every stage finished, and points of the ingested files that the run
+    no longer produced are deleted after that.
+    """
+
+    def __init__(self, files, output_path=DEFAULT_DATA_PATH, client=None, collection_name=None,
+                 embed_fn=None, cache=None, split_workers=None, queue_size=None, embed_batch_size=None,
+                 embed_workers=None, upsert_batch_size=None, upsert_parallel=None, collection_options=None,
+                 progress_interval=None, clean=True):
+        if is_legacy_json(output_path):
+            raise ValueError("The ingest pipeline writes binary artifacts; pass a directory as output_path")
+        self.files = list(files)
+        self.output_path = output_path
+        self.client = client
+        self.collection_name = collection_name
+        self.embed_fn = embed_fn
+        self.cache = get_embedding_cache() if cache is None else (cache or None)  # cache=False disables
+        self.split_workers = split_workers or INGEST_SPLIT_WORKERS
+        self.queue_size = queue_size or INGEST_QUEUE_SIZE
+        self.embed_batch_size = embed_batch_size or EMBED_BATCH_SIZE
+        self.embed_workers = embed_workers or EMBED_WORKERS
+        self.upsert_batch_size = upsert_batch_size or UPSERT_BATCH_SIZE
+        self.upsert_parallel = upsert_parallel or UPSERT_PARALLEL
+        self.collection_options = collection_options or {}
+        self.progress_interval = INGEST_PROGRESS_INTERVAL if progress_interval is None else progress_interval
+        self.cleaner = CorpusCleaner() if clean else None
+
+        self.segments = queue.Queue(self.queue_size)   # (source_file, text)
+        self.chunks = queue.Queue(self.queue_size)     # lists of records
+        self.embedded = queue.Queue(self.queue_size)   # lists of (record, vector)
+        self.progress = {
+            "read": StageProgress("read", "segments"),
+            "split": StageProgress("split", "chunks"),
+            "embed": StageProgress("embed", "chunks"),
+            "write": StageProgress("write", "records"),
+        }
+        if client is not None:
+            self.progress["upsert"] = StageProgress("upsert", "points")
+        self._stop = threading.Event()
+        self._errors = []
+
+    # --- queue helpers (give up when another stage failed) --------------
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise _Cancelled()
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        raise _Cancelled()
+
+    def _stage(self, fn):
+        def run():
+            try:
+                fn()
+            except _Cancelled:
+                pass
+            except BaseException as e:
+                self._errors.append(e)
+                self._stop.set()
+        return threading.Thread(target=run, name=f"ingest-{fn.__name__.strip('_')}", daemon=True)
+
+    # --- stages ---------------------------------------------------------
+
+    def _read(self):
+        for path in self.files:
+            start = time.perf_counter()
+            for text in iter_text_segments(path):
+                self.progress["read"].record(1, time.perf_counter() - start)
+                self._put(self.segments, (path, text))
+                start = time.perf_counter()
+        self._put(self.segments, _DONE)
+
+    def _split(self):
+        in_flight = deque()
+        # Segments are emitted in file order, so numbering only needs the current file's sequence
+        sequence = None
+
+        def emit(future, source_file):
+            nonlocal sequence
+            chunks, removed, elapsed = future.result()
+            if sequence is None or sequence.source_file != source_file:
+                sequence = ChunkSequence(source_file, self.cleaner)
+            if self.cleaner:
+                self.cleaner.record_lines(removed)
+            records = sequence.records(chunks)
+            self.progress["split"].record(len(records), elapsed)
+            count("pipeline_chunks", len(records))
+            if records:
+                self._put(self.chunks, records)
+
+        boilerplate = self.cleaner.boilerplate.frozen() if self.cleaner else None
+        with ProcessPoolExecutor(max_workers=self.split_workers, initializer=_init_split_worker,
+                                 initargs=(boilerplate,)) as pool:
+            while True:
+                item = self._get(self.segments)
+                if item is _DONE:
+                    break
+                if len(in_flight) >= self.split_workers * 2:
+                    emit(*in_flight.popleft())
+                source_file, text = item
+                in_flight.append((pool.submit(_timed_split, source_file, text), source_file))
+            while in_flight:
+                emit(*in_flight.popleft())
+        self._put(self.chunks, _DONE)
+
+    def _embed(self):
+        group_size = self.embed_batch_size * self.embed_workers  # one call keeps every embed worker busy
+        pending = []
+
+        def flush(records):
+            start = time.perf_counter()
+            with span("pipeline.embed", chunks=len(records)):
+                vectors = embed_chunks([r["text"] for r in records], embed_fn=self.embed_fn,
+                                       batch_size=self.embed_batch_size, max_workers=self.embed_workers,
+                                       cache=self.cache, verbose=False)
+            self.progress["embed"].record(len(records), time.perf_counter() - start)
+            self._put(self.embedded, list(zip(records, vectors)))
+
+        while True:
+            records = self._get(self.chunks)
+            if records is _DONE:
+                break
+            pending.extend(records)
+            while len(pending) >= group_size:
+                flush(pending[:group_size])
+                pending = pending[group_size:]
+        if pending:
+            flush(pending)
+        self._put(self.embedded, _DONE)
+
+    def _store(self):
+        batch_sizes = {}
+
+        def documents():
+            with VectorArtifactWriter(self.output_path, EMBED_MODEL) as writer, \
+                    BM25IndexWriter(bm25_index_path(self.output_path)) as lexical:
+                while True:
+                    pairs = self._get(self.embedded)
+                    if pairs is _DONE:
+                        break
+                    if self.client is not None and writer.count == 0:
+                        # Vector size comes from the first embedded chunk
+                        ensure_collection(self.client, self.collection_name, len(pairs[0][1]), self.output_path,
+                                          **self.collection_options)
+                    start = time.perf_counter()
+                    for record, vector in pairs:
+                        writer.add(record, vector)
+                        lexical.add(record["id"], record["text"])
+                    self.progress["write"].record(len(pairs), time.perf_counter() - start)
+                    for record, vector in pairs:
+                        yield {**record, "vector": vector}
+            self.records_written = writer.count
+
+        if self.client is None:
+            for _ in documents():
+                pass
+            return
+
+        def indexed_batches():
+            for index, batch in enumerate(iter_batches(documents(), self.upsert_batch_size)):
+                batch_sizes[index] = (len(batch), time.perf_counter())
+                yield index, batch
+
+        def on_batch_done(index):
+            size, submitted = batch_sizes.pop(index)
+            self.progress["upsert"].record(size, time.perf_counter() - submitted)
+
+        with span("qdrant.upload", collection=self.collection_name):
+            upsert_batches(self.client, self.collection_name, indexed_batches(), self.upsert_parallel, False,
+                           UPSERT_MAX_RETRIES, on_batch_done, verbose=False, model=EMBED_MODEL)
+
+    # --- driver ---------------------------------------------------------
+
+    def _report(self, elapsed):
+        stages = " | ".join(f"{p.name} {p.items} {p.unit}" for p in self.progress.values())
+        depths = "/".join(str(q.qsize()) for q in (self.segments, self.chunks, self.embedded))
+        print(f"  🚰 {elapsed:6.1f}s  {stages}  (queued {depths} of {self.queue_size})")
+
+    def run(self):
+        """Run every stage to completion; returns {"files", "records", "elapsed_s", "stages"}."""
+        self.records_written = 0
+        start = time.perf_counter()
+        if self.cleaner:
+            # Repeated-line counts must cover the whole corpus before any file is stripped
+            with span("clean.observe", files=len(self.files)):
+                for path in self.files:
+                    self.cleaner.boilerplate.observe_file(path)
+        threads = [self._stage(fn) for fn in (self._read, self._split, self._embed, self._store)]
+        with span("pipeline.ingest", files=len(self.files)):
+            for t in threads:
+                t.start()
+            next_report = start + self.progress_interval
+            while any(t.is_alive() for t in threads):
+                threads[-1].join(timeout=0.1)
+                if self._stop.is_set():
+                    break
+                if self.progress_interval and time.perf_counter() >= next_report:
+                    self._report(time.perf_counter() - start)
+                    next_report += self.progress_interval
+            for t in threads:
+                t.join()
+        if self._errors:
+            raise self._errors[0]
+        stale = 0
+        # Also runs when every file came out empty, so their old points go too
+        collections = [c.name for c in self.client.get_collections().collections] if self.client is not None else []
+        if self.collection_name in collections:
+            stale = delete_stale_points(self.client, self.collection_name, self.output_path,
+                                        self.upsert_batch_size, source_files=self.files)
+        elapsed = time.perf_counter() - start
+        if self.cleaner:
+            self.cleaner.write_log(removed_log_path(self.output_path))
+        return {
+            "files": len(self.files),
+            "records": self.records_written,
+            "stale_deleted": stale,
+            "removed_lines": sum(self.cleaner.removed_lines.values()) if self.cleaner else 0,
+            "removed_chunks": self.cleaner.chunks_removed if self.cleaner else 0,
+            "elapsed_s": elapsed,
+            "stages": {name: {"items": p.items, "unit": p.unit, "busy_s": p.busy, "per_sec": p.rate()}
+                       for name, p in self.progress.items()},
+        }
+
+
+def print_pipeline_summary(summary):
+    print(f"\n🚰 Ingested {summary['files']} files → {summary['records']} chunks in {summary['elapsed_s']:.2f}s "
+          f"({summary['records'] / summary['elapsed_s'] if summary['elapsed_s'] > 0 else 0:.0f} chunks/sec end to end)")
+    if summary["removed_lines"] or summary["removed_chunks"]:
+        print(f"🧹 Removed {summary['removed_lines']} boilerplate lines and {summary['removed_chunks']} "
+              f"near-duplicate chunks before embedding")
+    print(f"{'Stage':<8} {'items':>9} {'busy s':>9} {'items/sec':>11}")
+    for name, stage in summary["stages"].items():
+        print(f"{name:<8} {stage['items']:>9} {stage['busy_s']:>9.2f} {stage['per_sec']:>11.0f}  {stage['unit']}")
+
+
+def run_ingest_pipeline(inputs, output_path=DEFAULT_DATA_PATH, client=None, collection_name=None, **options):
+    """
+    Expand `inputs` (files, directories, globs), stream them through the
+    pipeline into `output_path` (and `collection_name` when a client is
+    given), print per-stage throughput and return the summary.
+    """
+    files = expand_inputs(inputs)
+    if not files:
+        raise FileNotFoundError(f"No {'/'.join(INGEST_EXTENSIONS)} files matched {', '.join(inputs)}")
+    print(f"🚰 Ingest pipeline: {len(files)} files → {output_path}"
+          + (f" + Qdrant '{collection_name}'" if client is not None else ""))
+    summary = IngestPipeline(files, output_path, client, collection_name, **options).run()
+    print_pipeline_summary(summary)
+    return summary
@@ -1,20 +1,77 @@
 import os
-from qdrant_helper import setup_qdrant, generate_json_from_docs
+import argparse
+import tracing
+from ingest_pipeline import run_ingest_pipeline
+from qdrant_helper import (
+    setup_qdrant, sync_qdrant, generate_json_from_docs, generate_parent_child_docs, make_qdrant_client,
+    DEFAULT_DATA_PATH, PARENT_CHILD_DATA_PATH,
+)
 
 QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
 DEMO_COLLECTION = "demo_index"
+CHILDREN_COLLECTION = f"{DEMO_COLLECTION}_children"
 
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")
 EMBED_MODEL = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Embed my_doc.txt and load it into Qdrant')
+    parser.add_argument('--sync', action='store_true',
+                        help='Only upsert new/changed chunks and delete removed ones instead of a full upload')
+    parser.add_argument('--input', nargs='+', metavar='PATH',
+                        help='Files, directories or globs (quote them, ** allowed) to stream into demo_index through '
+                             'the concurrent ingest pipeline instead of embedding my_doc.txt in one pass')
+    parser.add_argument('--split-workers', type=int,
+                        help='Processes for splitting and metadata extraction (default: INGEST_SPLIT_WORKERS or CPU count)')
+    parser.add_argument('--no-clean', dest='clean', action='store_false',
+                        help='Keep boilerplate lines and near-duplicate chunks (embed the text as-is)')
+    parser.add_argument('--quantization', choices=['none', 'scalar', 'binary'],
+                        help='Quantize vectors in newly created collections (default: QDRANT_QUANTIZATION or none)')
+    parser.add_argument('--on-disk', action='store_true', default=None,
+                        help='Store float32 vectors on disk in newly created collections (quantized copies stay in RAM)')
+    parser.add_argument('--hnsw-m', type=int, help='HNSW graph degree for newly created collections')
+    parser.add_argument('--hnsw-ef-construct', type=int, help='HNSW build-time search width for newly created collections')
+    parser.add_argument('--trace-json', help='Write per-stage ingest spans as a Chrome trace-event JSON file')
+    parser.add_argument('--metrics-prom', help='Write ingest stage latency histograms and counters in Prometheus text format')
+    args = parser.parse_args()
+    if args.input and args.sync:
+        parser.error('--sync diffs a finished artifact against Qdrant; the --input pipeline upserts as it goes')
+    if args.trace_json or args.metrics_prom:
+        tracing.enable_tracing()
+
+    # Vector size is read from the generated data; these only matter when a collection is created
+    collection_options = {"quantization": args.quantization, "on_disk": args.on_disk,
+                          "hnsw_m": args.hnsw_m, "hnsw_ef_construct": args.hnsw_ef_construct}
+    upload = sync_qdrant if args.sync else setup_qdrant
+
     # Step 1: Generate embeddings JSON from a real doc
     input_file = "my_doc.txt"
-    if os.path.exists(input_file):
-        generate_json_from_docs(input_file)
+    if args.input:
+        # read → split/metadata → embed → upsert run concurrently; chunks land in Qdrant as they are embedded
+        client = make_qdrant_client(QDRANT_HOST, QDRANT_PORT)
+        run_ingest_pipeline(args.input, DEFAULT_DATA_PATH, client, DEMO_COLLECTION,
+                            split_workers=args.split_workers, collection_options=collection_options,
+                            clean=args.clean)
+    elif os.path.exists(input_file):
+        generate_json_from_docs(input_file, clean=args.clean)
     else:
-        print(f"Place your document at {input_file} to auto-generate embeddings.")
+        parser.exit(1, f"❌ {input_file} not found. Place your document there to auto-generate embeddings, "
+                       f"or pass --input PATH to ingest other files.\n")
+    if os.path.exists(input_file):
+        # Parents go to the file-backed docstore, child vectors to their own collection
+        generate_parent_child_docs(input_file, clean=args.clean)
 
     # Step 2: Upload to Qdrant
-    setup_qdrant(QDRANT_HOST, QDRANT_PORT, DEMO_COLLECTION)
+    if not args.input:
+        client = upload(QDRANT_HOST, QDRANT_PORT, DEMO_COLLECTION, **collection_options)
+    if os.path.exists(PARENT_CHILD_DATA_PATH):
+        upload(QDRANT_HOST, QDRANT_PORT, CHILDREN_COLLECTION, PARENT_CHILD_DATA_PATH, client=client,
+               **collection_options)
+
+    if args.trace_json:
+        tracing.export_json_trace(args.trace_json)
+        print(f"💾 Ingest trace written to {args.trace_json}")
+    if args.metrics_prom:
+        tracing.export_prometheus(args.metrics_prom)
+        print(f"💾 Ingest metrics written to {args.metrics_prom}")
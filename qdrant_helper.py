@@ -1,8 +1,39 @@
-import json, os, re
+import hashlib, json, os, re, time, uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, ALL_COMPLETED, wait as wait_futures
 from qdrant_client import QdrantClient
+from qdrant_client import models
 from qdrant_client.models import VectorParams, Distance, PointStruct
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-import ollama
+from langchain.storage import LocalFileStore, create_kv_docstore
+from langchain_core.documents import Document
+from embedding_helper import embed_chunks, EMBED_MODEL
+from embedding_cache import get_embedding_cache
+from retry import call_with_retry
+from text_cleaning import CorpusCleaner, removed_log_path
+from bm25_index import write_bm25_index
+from vector_artifact import MANIFEST_FILE, is_legacy_json, iter_documents, read_manifest, write_vector_artifact
+from tracing import bind_context, count, span
+
+UPSERT_BATCH_SIZE = int(os.getenv("QDRANT_UPSERT_BATCH_SIZE", "256"))
+UPSERT_PARALLEL = int(os.getenv("QDRANT_UPSERT_PARALLEL", "4"))
+UPSERT_MAX_RETRIES = int(os.getenv("QDRANT_UPSERT_MAX_RETRIES", "3"))
+
+# Chunking shared by generate_json_from_docs and the ingest pipeline, so both produce the same point IDs
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+DOCUMENT_TITLE = "RAG System Documentation"
+# Files are read and split in segments of roughly this many characters, cut at blank lines
+INGEST_SEGMENT_CHARS = int(os.getenv("INGEST_SEGMENT_CHARS", str(256 * 1024)))
+
+# Collection storage options (applied when setup_qdrant creates a collection)
+QUANTIZATION = os.getenv("QDRANT_QUANTIZATION") or "none"   # none | scalar | binary
+VECTORS_ON_DISK = os.getenv("QDRANT_ON_DISK", "0") == "1"
+HNSW_M = int(os.getenv("QDRANT_HNSW_M") or 0) or None
+HNSW_EF_CONSTRUCT = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT") or 0) or None
+# Query-time options; unset means Qdrant's defaults
+SEARCH_RESCORE = {"1": True, "0": False}.get(os.getenv("QDRANT_RESCORE", ""))
+SEARCH_OVERSAMPLING = float(os.getenv("QDRANT_OVERSAMPLING") or 0) or None
+SEARCH_HNSW_EF = int(os.getenv("QDRANT_HNSW_EF") or 0) or None
 
 def extract_metadata_from_text(text, chunk_id, source_file="unknown", document_title="untitled"):
     """
@@ -76,57 +107,686 @@ def extract_metadata_from_text(text, chunk_id, source_file="unknown", document_t
     
     return metadata
 
-def generate_json_from_docs(input_file: str, output_path: str = "data/demo_data.json"):
+DEFAULT_DATA_PATH = "data/demo_data"
+PARENT_CHILD_DATA_PATH = "data/parent_child"
+PARENT_DOCSTORE_PATH = os.getenv("PARENT_DOCSTORE_PATH", "data/parent_docstore")
+POINT_ID_NAMESPACE = uuid.UUID("6f1c3a52-7d2e-4b8a-9c1f-2e5d8b7a4c30")
+# Payload field naming the embedding model a point's vector came from (IDs only hash the text)
+EMBED_MODEL_FIELD = "embed_model"
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_point_id(source_file, chunk_hash, occurrence=0):
+    """
+    Stable point ID derived from the chunk's content rather than its position,
+    so editing one part of a document leaves the other chunks' IDs unchanged.
+    """
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source_file}\n{chunk_hash}\n{occurrence}"))
+
+
+def iter_text_segments(path, segment_chars=None):
+    """
+    Yield the text of `path` in pieces of about `segment_chars`, ending at a
+    blank line where possible (hard cut at twice the size), so a large file
+    is never held in memory at once.
+    """
+    segment_chars = segment_chars or INGEST_SEGMENT_CHARS
+    lines = []
+    size = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            lines.append(line)
+            size += len(line)
+            if (size >= segment_chars and not line.strip()) or size >= 2 * segment_chars:
+                yield "".join(lines)
+                lines = []
+                size = 0
+    if lines:
+        yield "".join(lines)
+
+
+_splitter = None
+
+
+def split_segment(source_file, text, boilerplate=None):
+    """
+    Strip boilerplate lines from one segment, chunk it and extract each
+    chunk's metadata. Returns ([(text, metadata)], removed_lines); chunk_id
+    is assigned by ChunkSequence, which sees the segments in file order.
+    """
+    global _splitter
+    if _splitter is None:
+        _splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    removed = []
+    if boilerplate is not None:
+        text, removed = boilerplate.strip(text)
+    chunks = []
+    for chunk in _splitter.split_text(text):
+        # Add realistic metadata based on content analysis
+        metadata = extract_metadata_from_text(chunk, 0, source_file, DOCUMENT_TITLE)
+        metadata["content_hash"] = content_hash(chunk)
+        chunks.append((chunk, metadata))
+    return chunks, removed
+
+
+class ChunkSequence:
+    """
+    Point IDs and chunk_ids for one source file, fed its chunks in file order
+    (in as many calls as there are segments).
+
+    Identical chunks in one file get distinct IDs via their occurrence
+    number. With a `cleaner`, near-duplicate chunks are dropped and leave no
+    gap in chunk_id, so neighbor windows stay contiguous.
+    """
+
+    def __init__(self, source_file, cleaner=None):
+        self.source_file = source_file
+        self.cleaner = cleaner
+        self.chunk_id = 0
+        self._seen = {}
+
+    def records(self, chunks):
+        """[(text, metadata)] from split_segment -> [{"id", "text", "metadata"}] to embed."""
+        records = []
+        for text, metadata in chunks:
+            occurrence = self._seen.get(metadata["content_hash"], 0)
+            point_id = chunk_point_id(self.source_file, metadata["content_hash"], occurrence)
+            if self.cleaner and not self.cleaner.keep_chunk(point_id, text, self.source_file):
+                continue
+            self._seen[metadata["content_hash"]] = occurrence + 1
+            self.chunk_id += 1
+            metadata["chunk_id"] = self.chunk_id
+            records.append({"id": point_id, "text": text, "metadata": metadata})
+        return records
+
+
+def generate_json_from_docs(input_file: str, output_path: str = DEFAULT_DATA_PATH,
+                            embed_fn=None, batch_size=None, max_workers=None, cache=None, clean=True):
+    """
+    Split, embed and save `input_file`.
+    By default writes the compact binary artifact (float32 matrix + JSONL
+    records + manifest); an `output_path` ending in .json writes the legacy
+    indented JSON array instead. The file is split in the same segments as
+    the ingest pipeline, so both produce the same chunks and point IDs.
+
+    With `clean`, boilerplate lines (nav bars, cookie banners, repeated
+    headers) are stripped before splitting and near-duplicate chunks are
+    dropped before embedding; what was removed is logged to
+    removed_log_path(output_path).
+    """
+    cleaner = CorpusCleaner() if clean else None
+    if cleaner:
+        cleaner.boilerplate.observe_file(input_file)
+
+    sequence = ChunkSequence(input_file, cleaner)
+    records = []
+    with span("ingest.split", file=input_file):
+        for segment in iter_text_segments(input_file):
+            chunks, removed = split_segment(input_file, segment, cleaner.boilerplate if cleaner else None)
+            if cleaner:
+                cleaner.record_lines(removed)
+            records.extend(sequence.records(chunks))
+    if cleaner:
+        cleaner.write_log(removed_log_path(output_path))
+        print(f"{cleaner.summary()} (see {removed_log_path(output_path)})")
+    chunks = [r["text"] for r in records]
+
+    # Batched, concurrent embedding; pass embed_fn to run against a local stub.
+    # Unchanged chunks are served from the on-disk embedding cache.
+    cache = get_embedding_cache() if cache is None else (cache or None)  # cache=False disables
+    vectors = embed_chunks(chunks, embed_fn=embed_fn, batch_size=batch_size,
+                           max_workers=max_workers, cache=cache)
+
+    with span("ingest.save", records=len(records)):
+        _save_records(output_path, records, vectors)
+    # Lexical index over the same chunks, for hybrid (BM25 + dense) retrieval
+    with span("ingest.bm25", records=len(records)):
+        write_bm25_index(output_path, records)
+    print(f"Saved {len(records)} chunks with embeddings and a BM25 index to {output_path}")
+    return output_path
+
+
+def _save_records(output_path, records, vectors):
+    if is_legacy_json(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        data = [{**r, "vector": v} for r, v in zip(records, vectors)]
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+    else:
+        write_vector_artifact(output_path, records, vectors, EMBED_MODEL)
+
+
+def open_parent_docstore(path=PARENT_DOCSTORE_PATH):
+    """File-backed key-value docstore holding parent Documents by parent ID."""
+    return create_kv_docstore(LocalFileStore(path))
+
+
+def _source_parents_path(docstore_path, source_file):
+    digest = hashlib.sha256(source_file.encode("utf-8")).hexdigest()[:32]
+    return os.path.join(f"{docstore_path.rstrip(os.sep)}.sources", f"{digest}.json")
+
+
+def replace_source_parents(docstore, docstore_path, source_file, parents):
+    """
+    Store `parents` [(parent_id, Document)] of `source_file` and delete the
+    parents an earlier ingest of the same file wrote that are gone now.
+
+    The parent IDs of each source file are listed in <docstore_path>.sources/,
+    so only this file's keys are read. A docstore written before those lists
+    existed is scanned once to find this file's old parents.
+    """
+    current = [parent_id for parent_id, _ in parents]
+    list_path = _source_parents_path(docstore_path, source_file)
+    docstore.mset(parents)
+    if os.path.exists(list_path):
+        with open(list_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)["parent_ids"]
+        stale = sorted(set(previous) - set(current))
+    else:
+        current_set = set(current)
+        existing = [key for key in docstore.yield_keys() if key not in current_set]
+        stale = [
+            key for key, doc in zip(existing, docstore.mget(existing))
+            if doc is not None and doc.metadata.get("source_file") == source_file
+        ]
+    if stale:
+        docstore.mdelete(stale)
+    os.makedirs(os.path.dirname(list_path), exist_ok=True)
+    with open(list_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"source_file": source_file, "parent_ids": current}, f)
+    os.replace(list_path + ".tmp", list_path)
+    return len(stale)
+
+
+def generate_parent_child_docs(input_file: str, output_path: str = PARENT_CHILD_DATA_PATH,
+                               docstore_path: str = PARENT_DOCSTORE_PATH,
+                               embed_fn=None, batch_size=None, max_workers=None, cache=None, clean=True):
+    """
+    Build the parent/child layout ParentDocumentRetriever expects, once, at ingest.
+
+    The document is split into ~2000-char parents, written to a persistent
+    file-backed docstore keyed by a stable parent ID, and each parent is split
+    into ~400-char children. Only children are embedded; their records carry
+    `parent_id` in the metadata and are saved to `output_path` for upload to
+    the children collection. Parents that no longer exist for this source
+    file are removed from the docstore. With `clean`, boilerplate lines are
+    stripped first (parents and children are nested, so near-duplicate
+    chunks are not dropped here).
+    """
     with open(input_file, "r", encoding="utf-8") as f:
         raw_text = f.read()
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    chunks = splitter.split_text(raw_text)
+    if clean:
+        cleaner = CorpusCleaner()
+        cleaner.boilerplate.observe(raw_text)
+        raw_text = cleaner.strip_boilerplate(raw_text)
+        cleaner.write_log(removed_log_path(output_path))
 
-    data = []
-    for i, text in enumerate(chunks):
-        emb = ollama.embeddings(model=os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text"), prompt=text)
-        
-        # Add realistic metadata based on content analysis
-        metadata = extract_metadata_from_text(text, i + 1, input_file, "RAG System Documentation")
-        
-        data.append({
-            "id": i + 1,
-            "text": text,
-            "vector": emb["embedding"],
-            "metadata": metadata
-        })
-
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
-
-    print(f"Saved {len(data)} chunks with embeddings to {output_path}")
+    parent_splitter = RecursiveCharacterTextSplitter(chunk_size=2000)
+    child_splitter = RecursiveCharacterTextSplitter(chunk_size=400)
+
+    parents = []
+    children = []
+    seen_hashes = {}
+    for parent_text in parent_splitter.split_text(raw_text):
+        parent_hash = content_hash(parent_text)
+        occurrence = seen_hashes.get(parent_hash, 0)
+        seen_hashes[parent_hash] = occurrence + 1
+        parent_id = chunk_point_id(f"{input_file}#parent", parent_hash, occurrence)
+        parents.append((parent_id, Document(
+            page_content=parent_text,
+            metadata={"parent_id": parent_id, "source_file": input_file, "content_hash": parent_hash},
+        )))
+        for child_text in child_splitter.split_text(parent_text):
+            metadata = extract_metadata_from_text(child_text, len(children) + 1, input_file, "RAG System Documentation")
+            metadata["content_hash"] = content_hash(child_text)
+            metadata["parent_id"] = parent_id
+            child_occurrence = seen_hashes.get((parent_id, metadata["content_hash"]), 0)
+            seen_hashes[(parent_id, metadata["content_hash"])] = child_occurrence + 1
+            children.append({
+                "id": chunk_point_id(parent_id, metadata["content_hash"], child_occurrence),
+                "text": child_text,
+                "metadata": metadata,
+            })
+
+    with span("ingest.docstore", parents=len(parents)):
+        stale = replace_source_parents(open_parent_docstore(docstore_path), docstore_path, input_file, parents)
+
+    cache = get_embedding_cache() if cache is None else (cache or None)  # cache=False disables
+    vectors = embed_chunks([c["text"] for c in children], embed_fn=embed_fn, batch_size=batch_size,
+                           max_workers=max_workers, cache=cache)
+    _save_records(output_path, children, vectors)
+    print(f"Saved {len(parents)} parents to {docstore_path} ({stale} stale removed) "
+          f"and {len(children)} child chunks with embeddings to {output_path}")
     return output_path
 
 
-def setup_qdrant(host, port, collection_name, data_path="data/demo_data.json"):
-    client = QdrantClient(host=host, port=port)
+def _vector_as_list(vector):
+    # Memory-mapped rows are numpy views; the client serializes plain lists
+    return vector.tolist() if hasattr(vector, "tolist") else vector
+
+
+def _payload_from_document(d, model=None):
+    payload = {
+        "text": d["text"],
+        **d.get("metadata", {})  # Include all metadata fields
+    }
+    if model:
+        payload[EMBED_MODEL_FIELD] = model
+    return payload
+
+
+def point_from_document(d, model=None):
+    return PointStruct(
+        id=d["id"],
+        vector=_vector_as_list(d["vector"]),
+        payload=_payload_from_document(d, model),
+    )
+
+
+def data_model(data_path):
+    """Embedding model recorded in the artifact manifest; None for legacy JSON, which doesn't store it."""
+    if is_legacy_json(data_path):
+        return None
+    return read_manifest(data_path).get("model")
+
+
+def make_qdrant_client(host, port):
+    """Network client, or qdrant-client's in-process local mode when host is ':memory:'."""
+    if host == ":memory:":
+        return QdrantClient(location=":memory:")
+    return QdrantClient(host=host, port=port)
+
+
+def iter_batches(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _data_signature(data_path):
+    # Changes whenever the data file (or artifact manifest) is rewritten
+    stat_path = data_path if is_legacy_json(data_path) else os.path.join(data_path, MANIFEST_FILE)
+    st = os.stat(stat_path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def _load_checkpoint(checkpoint_path, expected):
+    if not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    if any(state.get(k) != v for k, v in expected.items()):
+        print(f"⚠️  Ignoring stale checkpoint {checkpoint_path} (data or batch size changed)")
+        return set()
+    return set(state.get("done", []))
+
+
+def _save_checkpoint(checkpoint_path, expected, done):
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({**expected, "done": sorted(done)}, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def _upsert_batch(client, collection_name, batch, wait, max_retries, model=None):
+    points = [point_from_document(d, model) for d in batch]
+
+    def attempt_upsert(attempt):
+        start = time.time()
+        with span("qdrant.upsert", collection=collection_name, points=len(points), attempt=attempt):
+            client.upsert(collection_name=collection_name, points=points, wait=wait)
+        count("points_upserted", len(points))
+        return len(points), time.time() - start
+
+    return call_with_retry(attempt_upsert, max_retries, "Upsert batch", "upsert_retries")
+
+
+def upsert_batches(client, collection_name, indexed_batches, parallel, wait, max_retries, on_batch_done=None,
+                   verbose=True, model=None):
+    """
+    Upsert (index, batch) pairs with at most `parallel` requests in flight;
+    `model` is stored in each payload under EMBED_MODEL_FIELD.
+    """
+    uploaded = 0
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        in_flight = {}
+
+        def drain(return_when):
+            nonlocal uploaded
+            finished, _ = wait_futures(in_flight, return_when=return_when)
+            for future in finished:
+                index = in_flight.pop(future)
+                points, elapsed = future.result()
+                uploaded += points
+                if on_batch_done:
+                    on_batch_done(index)
+                rate = points / elapsed if elapsed > 0 else float("inf")
+                if verbose:
+                    print(f"  📤 Batch {index}: {points} points in {elapsed:.2f}s ({rate:.0f} points/sec)")
+
+        for index, batch in indexed_batches:
+            if len(in_flight) >= parallel:
+                drain(FIRST_COMPLETED)
+            in_flight[pool.submit(bind_context(_upsert_batch), client, collection_name, batch, wait, max_retries,
+                                  model)] = index
+        if in_flight:
+            drain(ALL_COMPLETED)
+    return uploaded
+
+
+def upload_points(client, collection_name, data_path=DEFAULT_DATA_PATH, batch_size=None,
+                  parallel=None, max_retries=None, wait=False, checkpoint_path=None):
+    """
+    Stream documents from `data_path` into `collection_name` in batches.
+
+    Documents are read lazily, at most `parallel` batches are in flight at
+    once, and failed batches are retried with backoff. Completed batch
+    numbers are recorded in a checkpoint file next to the data so a crashed
+    upload resumes where it stopped; the checkpoint is removed on success.
+    """
+    batch_size = batch_size or UPSERT_BATCH_SIZE
+    parallel = parallel or UPSERT_PARALLEL
+    max_retries = UPSERT_MAX_RETRIES if max_retries is None else max_retries
+    checkpoint_path = checkpoint_path or f"{data_path.rstrip(os.sep)}.{collection_name}.checkpoint.json"
+
+    expected = {
+        "data_path": os.path.abspath(data_path),
+        "collection": collection_name,
+        "batch_size": batch_size,
+        "signature": _data_signature(data_path),
+    }
+    done = _load_checkpoint(checkpoint_path, expected)
+    if done:
+        print(f"🔁 Resuming upload: skipping {len(done)} batches already in '{collection_name}'")
+
+    def on_batch_done(index):
+        done.add(index)
+        _save_checkpoint(checkpoint_path, expected, done)
+
+    pending = (
+        (index, batch)
+        for index, batch in enumerate(iter_batches(iter_documents(data_path), batch_size))
+        if index not in done
+    )
+    start_time = time.time()
+    with span("qdrant.upload", collection=collection_name):
+        uploaded = upsert_batches(client, collection_name, pending, parallel, wait, max_retries, on_batch_done,
+                                  model=data_model(data_path))
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    elapsed = time.time() - start_time
+    rate = uploaded / elapsed if elapsed > 0 else float("inf")
+    print(f"⏱️  Upserted {uploaded} points in {elapsed:.2f}s ({rate:.0f} points/sec, {parallel} batches in flight)")
+    return uploaded
+
+
+# Payload fields that retrievers filter on; indexed so filters don't scan the collection
+PAYLOAD_INDEXES = {
+    "source_file": models.PayloadSchemaType.KEYWORD,
+    "chunk_id": models.PayloadSchemaType.INTEGER,
+    # Computed by extract_metadata_from_text; used for scoped (metadata-filtered) search
+    "category": models.PayloadSchemaType.KEYWORD,
+    "document_type": models.PayloadSchemaType.KEYWORD,
+    "technical_level": models.PayloadSchemaType.KEYWORD,
+    "has_code": models.PayloadSchemaType.BOOL,
+}
+
+_RANGE_OPERATORS = ("gt", "gte", "lt", "lte")
+
+
+def build_qdrant_filter(metadata_filter):
+    """
+    Turn a metadata filter dict into a Qdrant Filter (all conditions must hold):
+        {"category": "setup"}                 exact match
+        {"document_type": ["tutorial", ...]}  match any
+        {"chunk_id": {"gte": 3, "lte": 9}}    range
+    None/empty gives None; a models.Filter is passed through unchanged.
+    """
+    if not metadata_filter:
+        return None
+    if isinstance(metadata_filter, models.Filter):
+        return metadata_filter
+    conditions = []
+    for field, condition in metadata_filter.items():
+        if isinstance(condition, dict):
+            unknown = set(condition) - set(_RANGE_OPERATORS)
+            if unknown:
+                raise ValueError(f"Unsupported range operator(s) {sorted(unknown)} for field '{field}'")
+            conditions.append(models.FieldCondition(key=field, range=models.Range(**condition)))
+        elif isinstance(condition, (list, tuple, set)):
+            conditions.append(models.FieldCondition(key=field, match=models.MatchAny(any=list(condition))))
+        else:
+            conditions.append(models.FieldCondition(key=field, match=models.MatchValue(value=condition)))
+    return models.Filter(must=conditions)
+
+
+def create_payload_indexes(client, collection_name, fields=None):
+    """Create (idempotently) the payload indexes in PAYLOAD_INDEXES."""
+    for field, schema in (fields or PAYLOAD_INDEXES).items():
+        client.create_payload_index(collection_name=collection_name, field_name=field, field_schema=schema)
+
+
+def detect_vector_dims(data_path):
+    """Vector size of `data_path`: from the artifact manifest, or the first vector of a legacy JSON file."""
+    if not is_legacy_json(data_path):
+        dims = read_manifest(data_path)["dims"]
+        if dims:
+            return dims
+    for d in iter_documents(data_path):
+        return len(d["vector"])
+    raise ValueError(f"Cannot detect vector size: {data_path} contains no vectors")
+
+
+def collection_config(dims, quantization=None, on_disk=None, hnsw_m=None, hnsw_ef_construct=None):
+    """
+    create_collection kwargs for `dims`-sized cosine vectors.
+
+    quantization="scalar" keeps an int8 copy of every vector in RAM (~4x
+    smaller); "binary" keeps 1 bit per dimension (~32x smaller, best for
+    high-dimensional models). With on_disk=True the float32 originals live
+    on disk and are only read to rescore the quantized candidates.
+    """
+    quantization = (quantization or QUANTIZATION).lower()
+    on_disk = VECTORS_ON_DISK if on_disk is None else on_disk
+    config = {"vectors_config": VectorParams(size=dims, distance=Distance.COSINE, on_disk=on_disk or None)}
+
+    if quantization == "scalar":
+        config["quantization_config"] = models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    elif quantization == "binary":
+        config["quantization_config"] = models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True)
+        )
+    elif quantization != "none":
+        raise ValueError(f"Unknown quantization '{quantization}' (expected none, scalar or binary)")
+
+    hnsw_m = hnsw_m or HNSW_M
+    hnsw_ef_construct = hnsw_ef_construct or HNSW_EF_CONSTRUCT
+    if hnsw_m or hnsw_ef_construct:
+        config["hnsw_config"] = models.HnswConfigDiff(m=hnsw_m, ef_construct=hnsw_ef_construct)
+    return config
+
+
+def make_search_params(rescore=None, oversampling=None, hnsw_ef=None, exact=False):
+    """
+    Query-time SearchParams: `rescore` re-ranks quantized candidates with the
+    original vectors, `oversampling` fetches oversampling x limit candidates
+    before rescoring, `hnsw_ef` widens the graph search. None when every
+    option is left at Qdrant's default.
+    """
+    rescore = SEARCH_RESCORE if rescore is None else rescore
+    oversampling = oversampling or SEARCH_OVERSAMPLING
+    hnsw_ef = hnsw_ef or SEARCH_HNSW_EF
+    if rescore is None and not oversampling and not hnsw_ef and not exact:
+        return None
+    quantization = None
+    if rescore is not None or oversampling:
+        quantization = models.QuantizationSearchParams(rescore=rescore, oversampling=oversampling)
+    return models.SearchParams(hnsw_ef=hnsw_ef, exact=exact, quantization=quantization)
+
+
+def ensure_collection(client, collection_name, dims, source="the data", quantization=None, on_disk=None,
+                      hnsw_m=None, hnsw_ef_construct=None):
+    """
+    Create `collection_name` for `dims`-sized vectors if it is missing, or
+    check that the existing one has the same size; then create the payload
+    indexes. Storage options only apply to a newly created collection.
+    """
     if collection_name not in [c.name for c in client.get_collections().collections]:
-        client.create_collection(
+        config = collection_config(dims, quantization, on_disk, hnsw_m, hnsw_ef_construct)
+        client.create_collection(collection_name=collection_name, **config)
+        print(f"🆕 Created '{collection_name}': {dims} dims, quantization "
+              f"{type(config.get('quantization_config')).__name__ if 'quantization_config' in config else 'none'}, "
+              f"vectors {'on disk' if config['vectors_config'].on_disk else 'in RAM'}")
+    else:
+        existing = client.get_collection(collection_name).config.params.vectors.size
+        if existing != dims:
+            raise ValueError(f"Collection '{collection_name}' stores {existing}-dim vectors but {source} has "
+                             f"{dims}-dim vectors (embedding model changed?); delete the collection and rerun")
+    create_payload_indexes(client, collection_name)
+
+
+def setup_qdrant(host, port, collection_name, data_path=DEFAULT_DATA_PATH, client=None,
+                 batch_size=None, parallel=None, quantization=None, on_disk=None, hnsw_m=None,
+                 hnsw_ef_construct=None):
+    client = client or make_qdrant_client(host, port)
+    ensure_collection(client, collection_name, detect_vector_dims(data_path), data_path, quantization, on_disk,
+                      hnsw_m, hnsw_ef_construct)
+
+    uploaded = upload_points(client, collection_name, data_path, batch_size=batch_size, parallel=parallel)
+    print(f"Uploaded {uploaded} documents from {data_path} to collection '{collection_name}'.")
+    delete_stale_points(client, collection_name, data_path, batch_size)
+    return client
+
+
+def _scroll_existing(client, collection_name, source_files, page_size=1000, with_payload=True):
+    """Return {point_id: payload} for every point that came from `source_files` (payload None without it)."""
+    existing = {}
+    if not source_files:
+        return existing
+    scroll_filter = models.Filter(must=[
+        models.FieldCondition(key="source_file", match=models.MatchAny(any=sorted(source_files)))
+    ])
+    offset = None
+    while True:
+        points, offset = client.scroll(
             collection_name=collection_name,
-            vectors_config=VectorParams(size=768, distance=Distance.COSINE),
+            scroll_filter=scroll_filter,
+            limit=page_size,
+            offset=offset,
+            with_payload=with_payload,
+            with_vectors=False,
         )
+        existing.update((str(p.id), p.payload) for p in points)
+        if offset is None:
+            return existing
 
-    with open(data_path, "r", encoding="utf-8") as f:
-        docs = json.load(f)
-
-    points = [
-        PointStruct(
-            id=d["id"],
-            vector=d["vector"],
-            payload={
-                "text": d["text"],
-                **d.get("metadata", {})  # Include all metadata fields
-            }
-        )
-        for d in docs
-    ]
 
-    client.upsert(collection_name=collection_name, points=points)
-    print(f"Uploaded {len(points)} documents from {data_path} to collection '{collection_name}'.")
+def delete_points(client, collection_name, point_ids, batch_size=None):
+    for batch in iter_batches(sorted(point_ids), batch_size or UPSERT_BATCH_SIZE):
+        with span("qdrant.delete", collection=collection_name, points=len(batch)):
+            client.delete(collection_name=collection_name, points_selector=models.PointIdsList(points=batch))
+
+
+def delete_stale_points(client, collection_name, data_path, batch_size=None, source_files=None):
+    """
+    Delete the points of every source file in `data_path` (or in
+    `source_files`, which also covers files that produced no chunks) whose
+    IDs it no longer produces. IDs are content-derived, so an edited chunk
+    is upserted under a new ID and the old point would otherwise stay next
+    to it. Points of other source files are left alone.
+    """
+    current = set()
+    source_files = set(source_files or ())
+    for record in iter_documents(data_path):
+        current.add(str(record["id"]))
+        source_files.add(record.get("metadata", {}).get("source_file", "unknown"))
+    with span("qdrant.sync.scroll", collection=collection_name):
+        stale = _scroll_existing(client, collection_name, source_files, with_payload=False).keys() - current
+    delete_points(client, collection_name, stale, batch_size)
+    if stale:
+        print(f"🗑️  Deleted {len(stale)} stale points from '{collection_name}' (chunks no longer in {data_path})")
+    return len(stale)
+
+
+def sync_qdrant(host, port, collection_name, data_path=DEFAULT_DATA_PATH, client=None,
+                batch_size=None, parallel=None, **collection_options):
+    """
+    Bring `collection_name` in line with `data_path` touching only what changed.
+
+    Point IDs are content-derived, so a new ID means a new or edited chunk and
+    is upserted with its vector; an ID that is no longer produced is deleted;
+    an unchanged chunk whose metadata moved (e.g. its chunk_id shifted) only
+    gets its payload overwritten. IDs don't cover the embedding model, so a
+    point whose stored EMBED_MODEL_FIELD differs from the artifact's model is
+    re-upserted too. Only source files present in the new data are
+    considered, so other documents in the collection are left alone.
+    `collection_options` (quantization, on_disk, ...) only apply when the
+    collection does not exist yet and is created by setup_qdrant; an
+    existing collection must have the data's vector size.
+    """
+    client = client or make_qdrant_client(host, port)
+    if collection_name not in [c.name for c in client.get_collections().collections]:
+        return setup_qdrant(host, port, collection_name, data_path, client=client,
+                            batch_size=batch_size, parallel=parallel, **collection_options)
+
+    ensure_collection(client, collection_name, detect_vector_dims(data_path), data_path, **collection_options)
+    batch_size = batch_size or UPSERT_BATCH_SIZE
+    parallel = parallel or UPSERT_PARALLEL
+
+    # Pass 1: IDs and payloads only; vectors stay on disk
+    model = data_model(data_path)
+    new_payloads = {}
+    source_files = set()
+    for d in iter_documents(data_path):
+        payload = _payload_from_document(d, model)
+        new_payloads[str(d["id"])] = payload
+        source_files.add(payload.get("source_file", "unknown"))
+
+    with span("qdrant.sync.scroll", collection=collection_name):
+        existing = _scroll_existing(client, collection_name, source_files)
+    kept = new_payloads.keys() & existing.keys()
+    # Same text embedded by another model: the vector is stale even though the ID matches
+    reembedded = {pid for pid in kept if model and existing[pid].get(EMBED_MODEL_FIELD) != model}
+    to_upsert = (new_payloads.keys() - existing.keys()) | reembedded
+    to_delete = existing.keys() - new_payloads.keys()
+    to_relabel = [pid for pid in kept - reembedded if new_payloads[pid] != existing[pid]]
+    unchanged = len(new_payloads) - len(to_upsert) - len(to_relabel)
+    print(f"🔄 Sync '{collection_name}': {len(to_upsert)} new/changed ({len(reembedded)} from another model), "
+          f"{len(to_relabel)} payload-only, {len(to_delete)} stale, {unchanged} unchanged")
+
+    # Pass 2: stream vectors only for the points that need them
+    start_time = time.time()
+    changed_docs = (d for d in iter_documents(data_path) if str(d["id"]) in to_upsert)
+    with span("qdrant.upload", collection=collection_name):
+        upserted = upsert_batches(client, collection_name, enumerate(iter_batches(changed_docs, batch_size)),
+                                   parallel, False, UPSERT_MAX_RETRIES, model=model)
+
+    for batch in iter_batches(to_relabel, batch_size):
+        with span("qdrant.sync.relabel", points=len(batch)):
+            client.batch_update_points(
+                collection_name=collection_name,
+                update_operations=[
+                    models.OverwritePayloadOperation(
+                        overwrite_payload=models.SetPayload(payload=new_payloads[pid], points=[pid])
+                    )
+                    for pid in batch
+                ],
+            )
+
+    delete_points(client, collection_name, to_delete, batch_size)
+
+    print(f"⏱️  Sync finished in {time.time() - start_time:.2f}s: upserted {upserted}, "
+          f"relabeled {len(to_relabel)}, deleted {len(to_delete)}")
+    return client
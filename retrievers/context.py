@@ -0,0 +1,207 @@
+import os
+import threading
+from typing import Any, Optional
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_qdrant import QdrantVectorStore
+from qdrant_client import models
+from langchain_ollama import ChatOllama
+from embedding_cache import get_query_embeddings
+from bm25_index import BM25Index, bm25_index_path
+from qdrant_helper import build_qdrant_filter, make_qdrant_client, make_search_params, open_parent_docstore
+from retrievers.expansion_cache import get_expansion_cache
+from retrievers.numpy_store import NumpyVectorStore, default_data_path
+from tracing import span
+
+# "qdrant" or "numpy" (in-process search over the ingest artifacts, no Qdrant needed)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+
+
+class RetrievalContext:
+    """
+    Long-lived owner of everything the retrievers need: one Qdrant client
+    (whose HTTP connection pool is reused across calls), one embedder, one
+    LLM and one QdrantVectorStore per collection. Everything is created
+    lazily on first use, so a context that only runs baseline searches never
+    connects to the LLM. Searches go through search()/search_batch(), which
+    build Documents from the flat point payloads (retriever() wraps them for
+    LangChain chains).
+
+    Pass pre-built `client`, `embeddings` or `llm` to swap in local-mode or
+    stub backends. With backend="numpy" collections are loaded from their
+    ingest artifacts (`data_paths` maps collection -> path, defaulting to
+    where main.py writes them) into NumpyVectorStores and searched in
+    process. lexical_index() loads the BM25 index written next to a
+    collection's artifact for hybrid search. `search_params` (see make_search_params; defaults come from the
+    QDRANT_RESCORE / QDRANT_OVERSAMPLING / QDRANT_HNSW_EF env vars) is sent
+    with every Qdrant search. Call close() (or use it as a context manager)
+    when done.
+    """
+
+    def __init__(self, host="localhost", port=6333, client=None, embeddings=None, llm=None,
+                 expansion_cache=None, docstore=None, backend=None, data_paths=None, search_params=None):
+        self.host = host
+        self.port = port
+        self.search_params = search_params or make_search_params()
+        self.backend = backend or VECTOR_BACKEND
+        if self.backend not in ("qdrant", "numpy"):
+            raise ValueError(f"Unknown vector backend: {self.backend}")
+        self.data_paths = dict(data_paths or {})
+        self._client = client
+        self._embeddings = embeddings
+        self._llm = llm
+        self._expansion_cache = expansion_cache
+        self._docstore = docstore
+        self._vectorstores = {}
+        self._lexical_indexes = {}
+        self._lock = threading.RLock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = make_qdrant_client(self.host, self.port)
+            return self._client
+
+    @property
+    def embeddings(self):
+        with self._lock:
+            if self._embeddings is None:
+                self._embeddings = get_query_embeddings()
+            return self._embeddings
+
+    @property
+    def llm(self):
+        with self._lock:
+            if self._llm is None:
+                self._llm = ChatOllama(model=os.getenv("OLLAMA_MODEL", "llama3"))
+            return self._llm
+
+    @property
+    def expansion_cache(self):
+        """Persistent multi-query variant cache, or None when disabled (pass False to disable)."""
+        with self._lock:
+            if self._expansion_cache is None:
+                self._expansion_cache = get_expansion_cache() or False
+            return self._expansion_cache or None
+
+    @property
+    def docstore(self):
+        """Persistent parent docstore written at ingest time."""
+        with self._lock:
+            if self._docstore is None:
+                self._docstore = open_parent_docstore()
+            return self._docstore
+
+    def vectorstore(self, collection):
+        with self._lock:
+            if collection not in self._vectorstores and self.backend == "numpy":
+                self._vectorstores[collection] = NumpyVectorStore.from_artifact(
+                    self.data_paths.get(collection) or default_data_path(collection),
+                    embedding=self.embeddings,
+                    collection_name=collection,
+                )
+            elif collection not in self._vectorstores:
+                self._vectorstores[collection] = QdrantVectorStore(
+                    client=self.client,
+                    collection_name=collection,
+                    embedding=self.embeddings,
+                    content_payload_key="text"
+                )
+            return self._vectorstores[collection]
+
+    def lexical_index(self, collection):
+        """BM25 index built at ingest next to `collection`'s data (see data_paths)."""
+        with self._lock:
+            if collection not in self._lexical_indexes:
+                data_path = self.data_paths.get(collection) or default_data_path(collection)
+                self._lexical_indexes[collection] = BM25Index(bm25_index_path(data_path))
+            return self._lexical_indexes[collection]
+
+    def documents_by_id(self, collection, ids):
+        """Documents for point IDs in the given order, shaped like search_batch results (without scores)."""
+        if not ids:
+            return []
+        if self.backend == "numpy":
+            return self.vectorstore(collection).get_by_ids(ids)
+        with span("qdrant.retrieve", collection=collection, points=len(ids)):
+            points = self.client.retrieve(collection_name=collection, ids=list(ids), with_payload=True)
+        by_id = {str(p.id): p for p in points}
+        return [point_to_document(by_id[str(i)], collection) for i in ids if str(i) in by_id]
+
+    def search_batch(self, collection, vectors, k=3, filter=None):
+        """
+        Top-k search for several query vectors in one Qdrant request.
+        Returns one list of Documents per vector, in the same order.
+        `filter` (see build_qdrant_filter) is applied inside the search, so
+        scoped queries use the payload indexes instead of post-filtering.
+        """
+        if self.backend == "numpy":
+            return self.vectorstore(collection).search_batch(vectors, k=k, filter=filter)
+        query_filter = build_qdrant_filter(filter)
+        with span("qdrant.search", collection=collection, queries=len(vectors), k=k):
+            responses = self.client.query_batch_points(
+                collection_name=collection,
+                requests=[
+                    models.QueryRequest(query=list(vector), limit=k, filter=query_filter, params=self.search_params,
+                                        with_payload=True)
+                    for vector in vectors
+                ],
+            )
+        return [[point_to_document(p, collection) for p in r.points] for r in responses]
+
+    def search(self, collection, query, k=3, filter=None):
+        """search_batch for one query string: Documents with the flat payload as metadata and the score."""
+        return self.search_batch(collection, [self.embeddings.embed_query(query)], k=k, filter=filter)[0]
+
+    def retriever(self, collection, k=3, filter=None):
+        """LangChain retriever over search(), for chains such as MultiQueryRetriever."""
+        return ContextRetriever(context=self, collection=collection, k=k, filter=filter)
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+            self._client = None
+            self._vectorstores.clear()
+            self._lexical_indexes.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ContextRetriever(BaseRetriever):
+    """
+    Retriever backed by RetrievalContext.search. QdrantVectorStore reads
+    metadata from payload["metadata"], but points here carry flat payloads,
+    so its Documents would come back without source_file, chunk_id or score.
+    """
+
+    context: Any
+    collection: str
+    k: int = 3
+    filter: Optional[dict] = None
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        return self.context.search(self.collection, query, k=self.k, filter=self.filter)
+
+
+def point_to_document(point, collection):
+    """Turn a Qdrant ScoredPoint/Record into a Document carrying its payload as metadata."""
+    payload = dict(point.payload or {})
+    text = payload.pop("text", "")
+    metadata = {**payload, "_id": point.id, "_collection_name": collection}
+    if getattr(point, "score", None) is not None:
+        metadata["_score"] = point.score
+    return Document(page_content=text, metadata=metadata)
+
+
+def open_context(host, port, context=None):
+    """Return (context, owned): reuse the caller's context or create a temporary one."""
+    if context is not None:
+        return context, False
+    return RetrievalContext(host, port), True
@@ -0,0 +1,246 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from embedding_cache import LastAccessBuffer, SQLiteTransaction, evict_interval, normalize_text
+
+# Set EXPANSION_CACHE_PATH to an empty string to disable the cache
+EXPANSION_CACHE_PATH = os.getenv("EXPANSION_CACHE_PATH", "data/expansion_cache.sqlite")
+EXPANSION_CACHE_MAX_ENTRIES = int(os.getenv("EXPANSION_CACHE_MAX_ENTRIES", "10000"))
+# Cosine similarity above which a paraphrased question reuses cached variants; 0 disables
+EXPANSION_SIMILARITY_THRESHOLD = float(os.getenv("EXPANSION_SIMILARITY_THRESHOLD", "0"))
+
+
+def expansion_fingerprint(model, prompt_template):
+    """Changes whenever the LLM or the prompt changes, which invalidates old variants."""
+    return hashlib.sha256(f"{model}\n{prompt_template}".encode("utf-8")).hexdigest()
+
+
+class _VectorIndex:
+    """Unit-normalized query vectors of one fingerprint, held in memory for similarity lookups."""
+
+    def __init__(self, dims):
+        self.keys = []
+        self.rows = {}
+        self.matrix = np.zeros((16, dims), dtype=np.float32)
+
+    def put(self, key, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.shape != (self.matrix.shape[1],):
+            return
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.keys)
+            if row == len(self.matrix):
+                self.matrix = np.concatenate([self.matrix, np.zeros_like(self.matrix)])
+            self.keys.append(key)
+            self.rows[key] = row
+        self.matrix[row] = vector / (np.linalg.norm(vector) + 1e-12)
+
+    def remove(self, key):
+        row = self.rows.pop(key, None)
+        if row is None:
+            return
+        # Move the last row into the hole so the live rows stay contiguous
+        last = len(self.keys) - 1
+        if row != last:
+            moved = self.keys[last]
+            self.keys[row] = moved
+            self.rows[moved] = row
+            self.matrix[row] = self.matrix[last]
+        self.keys.pop()
+
+    def nearest(self, query_vector):
+        """(key, cosine similarity) of the closest cached query, or None."""
+        query = np.asarray(query_vector, dtype=np.float32)
+        if not self.keys or query.shape != (self.matrix.shape[1],):
+            return None
+        sims = self.matrix[:len(self.keys)] @ (query / (np.linalg.norm(query) + 1e-12))
+        best = int(np.argmax(sims))
+        return self.keys[best], float(sims[best])
+
+
+class ExpansionCache:
+    """
+    Persistent cache of LLM-generated query variants, stored in SQLite.
+
+    Entries are keyed by (model, prompt template, normalized query). When a
+    query vector is supplied, entries also keep it so that a paraphrased
+    question whose cosine similarity to a cached one is at least
+    `similarity_threshold` reuses that entry's variants. The vectors of a
+    fingerprint are read from SQLite once and then searched in memory;
+    entries other processes add afterwards only match exactly. Entries from
+    a different model or prompt are never returned but are not deleted
+    either, so processes using different LLMs can share one file; old
+    fingerprints age out of the LRU cap of `max_entries`. As in
+    EmbeddingCache, lookups are autocommit reads, hits are recorded in
+    batches and the cap is checked every `evict_interval(max_entries)` stores.
+    """
+
+    def __init__(self, path=None, max_entries=None, similarity_threshold=None):
+        self.path = path or EXPANSION_CACHE_PATH
+        self.max_entries = max_entries or EXPANSION_CACHE_MAX_ENTRIES
+        self.similarity_threshold = (
+            EXPANSION_SIMILARITY_THRESHOLD if similarity_threshold is None else similarity_threshold
+        )
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._indexes = {}   # fingerprint -> _VectorIndex, loaded on first similarity lookup
+        self._touches = LastAccessBuffer("expansions")
+        self._evict_interval = evict_interval(self.max_entries)
+        self._stores_since_check = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS expansions ("
+                " key TEXT PRIMARY KEY,"
+                " fingerprint TEXT NOT NULL,"
+                " query TEXT NOT NULL,"
+                " variants TEXT NOT NULL,"
+                " vector BLOB,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS expansions_fingerprint ON expansions(fingerprint)")
+            conn.execute("CREATE INDEX IF NOT EXISTS expansions_lru ON expansions(last_access)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _connect(self):
+        """Write transaction on this thread's connection."""
+        return SQLiteTransaction(self._connection())
+
+    def _index(self, fingerprint, dims):
+        """In-memory vectors of `fingerprint`, read from SQLite the first time; caller holds _lock."""
+        index = self._indexes.get(fingerprint)
+        if index is None:
+            index = self._indexes[fingerprint] = _VectorIndex(dims)
+            rows = self._connection().execute(
+                "SELECT key, vector FROM expansions WHERE fingerprint = ? AND vector IS NOT NULL",
+                (fingerprint,),
+            ).fetchall()
+            for key, blob in rows:
+                index.put(key, np.frombuffer(blob, dtype=np.float32))
+        return index
+
+    def _nearest(self, fingerprint, query_vector):
+        """Key of the most similar cached query at or above the threshold, or None."""
+        with self._lock:
+            match = self._index(fingerprint, len(query_vector)).nearest(query_vector)
+        if match is None or match[1] < self.similarity_threshold:
+            return None
+        return match[0]
+
+    def lookup(self, model, prompt_template, query, query_vector=None):
+        """Return cached variants for `query`, or None on a miss."""
+        fingerprint = expansion_fingerprint(model, prompt_template)
+        key = f"{fingerprint}:{normalize_text(query).lower()}"
+        row = self._touch(key)
+        hit_counter = "hits"
+        if row is None and query_vector is not None and self.similarity_threshold > 0:
+            hit_counter = "similar_hits"
+            similar_key = self._nearest(fingerprint, query_vector)
+            if similar_key is not None:
+                row = self._touch(similar_key)
+                if row is None:
+                    # Evicted by another process since the vectors were loaded
+                    self._forget([similar_key])
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            setattr(self, hit_counter, getattr(self, hit_counter) + 1)
+        return json.loads(row[1])
+
+    def _touch(self, key):
+        """(key, variants JSON) of an entry, marked as recently used; None if absent."""
+        row = self._connection().execute("SELECT key, variants FROM expansions WHERE key = ?", (key,)).fetchone()
+        if row is not None and self._touches.add([key]):
+            with self._connect() as conn:
+                self._touches.flush(conn)
+        return row
+
+    def _forget(self, keys):
+        with self._lock:
+            for index in self._indexes.values():
+                for key in keys:
+                    index.remove(key)
+
+    def store(self, model, prompt_template, query, variants, query_vector=None):
+        fingerprint = expansion_fingerprint(model, prompt_template)
+        key = f"{fingerprint}:{normalize_text(query).lower()}"
+        blob = None if query_vector is None else np.asarray(query_vector, dtype=np.float32).tobytes()
+        with self._lock:
+            self._stores_since_check += 1
+            check = self._stores_since_check >= self._evict_interval
+            if check:
+                self._stores_since_check = 0
+        evicted = []
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO expansions (key, fingerprint, query, variants, vector, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, fingerprint, query, json.dumps(variants), blob, time.time()),
+            )
+            entries = 0
+            if check:
+                self._touches.flush(conn)
+                entries = conn.execute("SELECT COUNT(*) FROM expansions").fetchone()[0]
+            if entries > self.max_entries:
+                evicted = [row[0] for row in conn.execute(
+                    "SELECT key FROM expansions ORDER BY last_access LIMIT ?", (entries - self.max_entries,)
+                )]
+                conn.executemany("DELETE FROM expansions WHERE key = ?", [(k,) for k in evicted])
+        with self._lock:
+            index = self._indexes.get(fingerprint)
+            if index is not None and query_vector is not None:
+                index.put(key, query_vector)
+        self._forget(evicted)
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM expansions")
+        with self._lock:
+            self._indexes.clear()
+
+    def stats(self):
+        lookups = self.hits + self.similar_hits + self.misses
+        return {
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.similar_hits) / lookups if lookups else 0.0,
+        }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_expansion_cache():
+    """Process-wide cache at EXPANSION_CACHE_PATH, or None when disabled."""
+    global _default_cache
+    if not EXPANSION_CACHE_PATH:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ExpansionCache()
+        return _default_cache
+
+
+def llm_model_name(llm):
+    return getattr(llm, "model", None) or getattr(llm, "model_name", None) or type(llm).__name__
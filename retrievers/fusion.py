@@ -0,0 +1,30 @@
+RRF_K = 60
+
+
+def document_key(doc):
+    """Identify a result across ranked lists: the Qdrant point ID, else its text."""
+    return doc.metadata.get("_id", doc.page_content)
+
+
+def reciprocal_rank_fusion(result_lists, k=RRF_K, limit=None):
+    """
+    Merge ranked lists of Documents with reciprocal-rank fusion:
+    score(d) = sum over lists of 1 / (k + rank of d in that list).
+    Documents found by several query variants rise to the top, unlike a
+    plain union where the first variant's ordering wins. The fused score is
+    stored in metadata["_rrf_score"].
+    """
+    scores = {}
+    docs = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, 1):
+            key = document_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+
+    fused = []
+    for key in sorted(scores, key=scores.get, reverse=True)[:limit]:
+        doc = docs[key]
+        doc.metadata["_rrf_score"] = scores[key]
+        fused.append(doc)
+    return fused
@@ -0,0 +1,82 @@
+import os
+import time
+from retrievers.context import open_context
+from retrievers.fusion import document_key, reciprocal_rank_fusion
+from retrievers.numpy_store import matches_filter
+from tracing import span
+
+# Results taken from each of the dense and BM25 lists before fusing
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# BM25 candidates are over-fetched by this factor when a metadata filter has to be applied afterwards
+FILTER_OVERFETCH = 4
+
+
+def lexical_search(context, collection, query, k=10, filter=None):
+    """
+    Top-k chunks by BM25 over the index built at ingest, as Documents with
+    the score in metadata["_bm25_score"]. The index has no payloads, so a
+    metadata `filter` is applied to the fetched documents.
+    """
+    index = context.lexical_index(collection)
+    with span("bm25.search", docs=len(index), k=k):
+        hits = index.search(query, k * FILTER_OVERFETCH if filter else k)
+    scores = dict(hits)
+    docs = context.documents_by_id(collection, [point_id for point_id, _ in hits])
+    if filter:
+        docs = [d for d in docs if matches_filter(d.metadata, filter)]
+    for doc in docs[:k]:
+        doc.metadata["_bm25_score"] = scores.get(str(doc.metadata.get("_id")))
+    return docs[:k]
+
+
+def hybrid_search(context, collection, query, k=3, filter=None, candidates=None):
+    """
+    Dense and BM25 retrieval fused with reciprocal-rank fusion in one pass.
+    Exact terms (error messages, config keys, product names) that embeddings
+    blur are picked up lexically, which is the recall multi-query buys with
+    an LLM call; here it costs one embedding and an in-memory index lookup.
+    """
+    candidates = max(k, candidates or HYBRID_CANDIDATES)
+    query_vector = context.embeddings.embed_query(query)
+    dense = context.search_batch(collection, [query_vector], k=candidates, filter=filter)[0]
+    sparse = lexical_search(context, collection, query, k=candidates, filter=filter)
+    with span("fusion.rrf", lists=2):
+        fused = reciprocal_rank_fusion([dense, sparse], limit=k)
+    # Chunks found by both keep the dense Document; carry the BM25 score over
+    bm25_scores = {document_key(d): d.metadata["_bm25_score"] for d in sparse}
+    for doc in fused:
+        if document_key(doc) in bm25_scores:
+            doc.metadata["_bm25_score"] = bm25_scores[document_key(doc)]
+    return fused
+
+
+def run_hybrid(host, port, collection, query, k=3, context=None, filter=None):
+    print(f"Query: {query}\n")
+    print(f"Fusing top-{HYBRID_CANDIDATES} dense and top-{HYBRID_CANDIDATES} BM25 results with RRF...")
+
+    context, owned = open_context(host, port, context)
+    try:
+        start_time = time.time()
+        docs = hybrid_search(context, collection, query, k=k, filter=filter)
+        end_time = time.time()
+
+        print(f"⏱️  Hybrid retrieval took: {end_time - start_time:.2f} seconds (1 embedding, no LLM call)")
+        print(f"📊 Retrieved {len(docs)} documents")
+
+        print("\nHybrid (BM25 + Dense) Results:")
+        for i, d in enumerate(docs, 1):
+            bm25, dense = d.metadata.get("_bm25_score"), d.metadata.get("_score")
+            print(f"Result {i}: RRF {d.metadata['_rrf_score']:.4f}, "
+                  f"BM25 {'-' if bm25 is None else f'{bm25:.2f}'}, dense {'-' if dense is None else f'{dense:.4f}'}")
+            print(f"Content: {d.page_content[:200]}...")
+            print("-" * 50)
+        return docs
+    except FileNotFoundError as e:
+        print(f"❌ {e}")
+        return []
+    except Exception as e:
+        print(f"❌ Error with hybrid retrieval: {e}")
+        return []
+    finally:
+        if owned:
+            context.close()
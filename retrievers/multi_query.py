@@ -1,33 +1,177 @@
-import os
 import time
-from langchain_qdrant import QdrantVectorStore
-from langchain_ollama import OllamaEmbeddings, ChatOllama
-from langchain.retrievers.multi_query import MultiQueryRetriever
-from qdrant_client import QdrantClient
+from typing import Any
+from langchain.retrievers.multi_query import MultiQueryRetriever, DEFAULT_QUERY_PROMPT, LineListOutputParser
+from retrievers.context import open_context
+from retrievers.fusion import document_key, reciprocal_rank_fusion
+from retrievers.expansion_cache import llm_model_name
+from tracing import count, span
 
-def run_multi_query(host, port, collection, query=None):
+def generate_query_variants(llm, query, cache=None, query_vector=None, prompt=DEFAULT_QUERY_PROMPT):
+    """
+    Ask the LLM for alternative phrasings, using MultiQueryRetriever's own prompt.
+    With an ExpansionCache, repeated (or, given `query_vector`, paraphrased)
+    questions reuse stored variants and skip the LLM entirely.
+    """
+    if cache is not None:
+        with span("expansion_cache.lookup"):
+            cached = cache.lookup(llm_model_name(llm), prompt.template, query, query_vector)
+        if cached is not None:
+            count("expansion_cache_hits")
+            return cached
+
+    chain = prompt | llm | LineListOutputParser()
+    with span("llm.generate_variants", model=llm_model_name(llm)) as s:
+        variants = [line.strip() for line in chain.invoke({"question": query})]
+        variants = [v for v in variants if v and v != query]
+        s.set(variants=len(variants))
+    count("llm_calls")
+
+    if cache is not None:
+        cache.store(llm_model_name(llm), prompt.template, query, variants, query_vector)
+    return variants
+
+class CachedMultiQueryRetriever(MultiQueryRetriever):
+    """
+    MultiQueryRetriever whose query generation goes through an ExpansionCache.
+    With `query_embeddings`, the question's vector is passed along so that
+    paraphrased questions reuse cached variants too.
+    """
+
+    expansion_cache: Any = None
+    query_embeddings: Any = None
+    cache_model: str = ""
+    cache_prompt: str = DEFAULT_QUERY_PROMPT.template
+
+    def generate_queries(self, question, run_manager):
+        query_vector = None
+        if self.expansion_cache is not None and self.query_embeddings is not None:
+            query_vector = self.query_embeddings.embed_query(question)
+        if self.expansion_cache is not None:
+            with span("expansion_cache.lookup"):
+                cached = self.expansion_cache.lookup(self.cache_model, self.cache_prompt, question, query_vector)
+            if cached is not None:
+                count("expansion_cache_hits")
+                return cached
+        with span("llm.generate_variants", model=self.cache_model) as s:
+            variants = super().generate_queries(question, run_manager)
+            s.set(variants=len(variants))
+        count("llm_calls")
+        if self.expansion_cache is not None:
+            self.expansion_cache.store(self.cache_model, self.cache_prompt, question, variants, query_vector)
+        return variants
+
+    def retrieve_documents(self, queries, run_manager):
+        # Same serial loop as MultiQueryRetriever, with one span per variant
+        # (the query embedding inside it is traced by the embedder)
+        documents = []
+        for query in queries:
+            with span("multi_query.variant_search") as s:
+                docs = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+                s.set(results=len(docs))
+            documents.extend(docs)
+        return documents
+
+    def unique_union(self, documents):
+        # Each variant's hits carry their own score, so Document equality would keep duplicates;
+        # dedupe on the point ID instead, keeping the first (earliest variant's) hit
+        seen = set()
+        unique = []
+        for doc in documents:
+            key = document_key(doc)
+            if key not in seen:
+                seen.add(key)
+                unique.append(doc)
+        return unique
+
+def build_multi_query_retriever(context, collection, k=3, filter=None):
+    """LangChain MultiQueryRetriever over the context's search, LLM and expansion cache."""
+    retriever = CachedMultiQueryRetriever.from_llm(
+        retriever=context.retriever(collection, k=k, filter=filter),
+        llm=context.llm
+    )
+    retriever.expansion_cache = context.expansion_cache
+    retriever.query_embeddings = context.embeddings
+    retriever.cache_model = llm_model_name(context.llm)
+    return retriever
+
+def multi_query_search(context, collection, query, k=3, filter=None):
+    """Serial LangChain multi-query: each variant searched in turn, results unioned."""
+    return build_multi_query_retriever(context, collection, k=k, filter=filter).invoke(query)
+
+def fused_multi_query_search(context, collection, query, k=3, filter=None):
+    """
+    Multi-query without the serial fan-out: one LLM call for the variants
+    (skipped on an expansion-cache hit), one embedding batch for the
+    variants, one Qdrant batch search, then reciprocal-rank fusion down to
+    the top k. Returns (docs, timings) where timings holds seconds per stage.
+    """
+    timings = {}
+    start = time.perf_counter()
+    # The query vector lets the expansion cache match paraphrased questions
+    query_vector = context.embeddings.embed_query(query)
+    timings["embed"] = time.perf_counter() - start
+
+    stage = time.perf_counter()
+    variants = generate_query_variants(context.llm, query, context.expansion_cache, query_vector)
+    timings["llm"] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    vectors = [query_vector] + (context.embeddings.embed_documents(variants) if variants else [])
+    timings["embed"] += time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    result_lists = context.search_batch(collection, vectors, k=k, filter=filter)
+    timings["search"] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    with span("fusion.rrf", lists=len(result_lists)):
+        docs = reciprocal_rank_fusion(result_lists, limit=k)
+    timings["fusion"] = time.perf_counter() - stage
+
+    timings["total"] = time.perf_counter() - start
+    timings["variants"] = len(variants)
+    return docs, timings
+
+def run_fused_multi_query(context, collection, query, k=3, filter=None):
+    print("Generating query variants, then one batched embed + one batched search...")
+    docs, timings = fused_multi_query_search(context, collection, query, k=k, filter=filter)
+
+    print(f"⏱️  Fused multi-query retrieval took: {timings['total']:.2f} seconds")
+    print(f"   🤖 LLM query generation: {timings['llm']:.2f}s ({timings['variants']} variants)")
+    print(f"   🧮 Batched embedding:    {timings['embed']:.3f}s")
+    print(f"   🔍 Batched Qdrant search: {timings['search']:.3f}s")
+    print(f"   🔀 RRF fusion:           {timings['fusion'] * 1000:.2f}ms")
+    print(f"📊 Retrieved {len(docs)} documents fused from {timings['variants'] + 1} queries")
+
+    print("\nFused Multi-Query Results:")
+    for i, d in enumerate(docs, 1):
+        print(f"Result {i} (RRF {d.metadata.get('_rrf_score', 0):.4f}):")
+        print(f"Content: {d.page_content[:200]}...")
+        print(f"Metadata: {d.metadata}")
+        print("-" * 50)
+    return docs
+
+def run_multi_query(host, port, collection, query=None, context=None, mode="langchain", filter=None):
+    """
+    mode="langchain" runs LangChain's MultiQueryRetriever (variants searched
+    one after another, results unioned); mode="fused" batches the variant
+    embeddings and searches and merges them with reciprocal-rank fusion.
+    `filter` scopes every search to matching metadata.
+    """
     if query is None:
         print("Missed query from run_multi_query")
         return
     
     print(f"Query: {query}\n")
 
-    client = QdrantClient(host=host, port=port)
-    embedding_fn = OllamaEmbeddings(model=os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text"))
-    vectorstore = QdrantVectorStore(
-        client=client, 
-        collection_name=collection, 
-        embedding=embedding_fn,
-        content_payload_key="text"
-    )
-
-    llm = ChatOllama(model=os.getenv("OLLAMA_MODEL", "llama3"))
+    # Reuse the caller's client/embedder/LLM; only build (and close) our own if none given
+    context, owned = open_context(host, port, context)
     
     try:
-        retriever = MultiQueryRetriever.from_llm(
-            retriever=vectorstore.as_retriever(search_kwargs={"k": 3}), 
-            llm=llm
-        )
+        if mode == "fused":
+            return run_fused_multi_query(context, collection, query, filter=filter)
+
+        retriever = build_multi_query_retriever(context, collection, k=3, filter=filter)
         
         print("Generating multiple queries and retrieving results...")
         
@@ -51,7 +195,7 @@ def run_multi_query(host, port, collection, query=None):
         # Compare with single query for reference
         print(f"\n🔍 For comparison - single similarity search:")
         single_start = time.time()
-        single_docs = vectorstore.similarity_search(query, k=3)
+        single_docs = context.search(collection, query, k=3, filter=filter)
         single_end = time.time()
         print(f"⏱️  Single query took: {single_end - single_start:.2f} seconds")
         print(f"📊 Retrieved {len(single_docs)} documents")
@@ -80,9 +224,12 @@ def run_multi_query(host, port, collection, query=None):
         print(f"Error with multi-query retriever: {e}")
         print("Using fallback similarity search...")
         
-        docs = vectorstore.similarity_search(query, k=3)
+        docs = context.search(collection, query, k=3, filter=filter)
         for i, d in enumerate(docs, 1):
             print(f"Fallback Result {i}:")
             print(f"Content: {d.page_content[:200]}...")
             print(f"Metadata: {d.metadata}")
             print("-" * 50)
+    finally:
+        if owned:
+            context.close()
@@ -0,0 +1,142 @@
+import time
+from langchain_core.documents import Document
+from qdrant_client import models
+from retrievers.context import open_context
+from tracing import span
+
+# Must match the ingest splitter in qdrant_helper.generate_json_from_docs
+CHUNK_OVERLAP = 50
+# Shorter suffix/prefix matches are treated as coincidence, not splitter overlap
+MIN_OVERLAP = 3
+
+
+def strip_overlap(previous, following, max_overlap=CHUNK_OVERLAP):
+    """Append `following` to `previous`, dropping the text the splitter repeated between them."""
+    for size in range(min(len(previous), len(following), max_overlap), MIN_OVERLAP - 1, -1):
+        if previous.endswith(following[:size]):
+            return previous + following[size:]
+    return previous + "\n" + following
+
+
+def merge_windows(hits, window):
+    """
+    Turn ranked hits into non-overlapping (source_file, first_id, last_id, hits)
+    ranges. Each hit covers chunk_id ± window; windows in the same file that
+    touch or overlap are merged. Ranges come back in the rank order of their
+    best hit, and each range's hits are in rank order.
+    """
+    spans = []
+    for rank, hit in enumerate(hits):
+        source = hit.metadata.get("source_file")
+        chunk_id = hit.metadata.get("chunk_id")
+        if source is None or chunk_id is None:
+            continue
+        spans.append((source, max(1, chunk_id - window), chunk_id + window, rank, hit))
+
+    merged = []
+    for source, lo, hi, rank, hit in sorted(spans, key=lambda s: (s[0], s[1])):
+        if merged and merged[-1][0] == source and lo <= merged[-1][2] + 1:
+            merged[-1][2] = max(merged[-1][2], hi)
+            merged[-1][3].append((rank, hit))
+        else:
+            merged.append([source, lo, hi, [(rank, hit)]])
+
+    merged.sort(key=lambda r: min(rank for rank, _ in r[3]))
+    return [(source, lo, hi, [hit for _, hit in sorted(ranked)]) for source, lo, hi, ranked in merged]
+
+
+def fetch_windows(client, collection, ranges):
+    """Fetch every chunk in `ranges` with a single filtered scroll."""
+    if not ranges:
+        return []
+    scroll_filter = models.Filter(should=[
+        models.Filter(must=[
+            models.FieldCondition(key="source_file", match=models.MatchValue(value=source)),
+            models.FieldCondition(key="chunk_id", range=models.Range(gte=lo, lte=hi)),
+        ])
+        for source, lo, hi, _ in ranges
+    ])
+    limit = sum(hi - lo + 1 for _, lo, hi, _ in ranges)
+    with span("qdrant.scroll", collection=collection, ranges=len(ranges)):
+        points, _ = client.scroll(
+            collection_name=collection,
+            scroll_filter=scroll_filter,
+            limit=limit,
+            with_payload=True,
+            with_vectors=False,
+        )
+    return points
+
+
+def fetch_window_payloads(context, collection, ranges):
+    """Payloads of every chunk in `ranges`, from Qdrant or the context's in-process store."""
+    if context.backend == "numpy":
+        store = context.vectorstore(collection)
+        return [
+            {**d.metadata, "text": d.page_content}
+            for source, lo, hi, _ in ranges
+            for d in store.scroll({"source_file": source, "chunk_id": {"gte": lo, "lte": hi}})
+        ]
+    return [point.payload or {} for point in fetch_windows(context.client, collection, ranges)]
+
+
+def neighbor_expansion_search(context, collection, query, k=3, window=1, filter=None):
+    """
+    Top-k similarity search, then widen each hit to its ±`window` neighboring
+    chunks (by source_file + chunk_id) fetched in one extra round trip.
+    Overlapping windows are merged and the splitter overlap is removed, so
+    each returned Document is one contiguous passage. `filter` scopes the
+    hits; their neighbors are fetched regardless of metadata.
+    """
+    query_vector = context.embeddings.embed_query(query)
+    hits = context.search_batch(collection, [query_vector], k=k, filter=filter)[0]
+    ranges = merge_windows(hits, window)
+
+    by_chunk = {}
+    for payload in fetch_window_payloads(context, collection, ranges):
+        by_chunk[(payload.get("source_file"), payload.get("chunk_id"))] = payload.get("text", "")
+
+    docs = []
+    for source, lo, hi, range_hits in ranges:
+        chunk_ids = [cid for cid in range(lo, hi + 1) if (source, cid) in by_chunk]
+        text = ""
+        for cid in chunk_ids:
+            text = strip_overlap(text, by_chunk[(source, cid)]) if text else by_chunk[(source, cid)]
+        best = range_hits[0]
+        docs.append(Document(page_content=text, metadata={
+            "source_file": source,
+            "chunk_ids": chunk_ids,
+            "hit_chunk_ids": sorted(h.metadata["chunk_id"] for h in range_hits),
+            "_id": best.metadata.get("_id"),
+            "_score": best.metadata.get("_score"),
+        }))
+    return docs
+
+
+def run_neighbor_expansion(host, port, collection, query, k=3, window=1, context=None, filter=None):
+    print(f"Query: {query}\n")
+    print(f"Searching top-{k} chunks, then fetching ±{window} neighbors in one batched scroll...")
+
+    context, owned = open_context(host, port, context)
+    try:
+        start_time = time.time()
+        docs = neighbor_expansion_search(context, collection, query, k=k, window=window, filter=filter)
+        end_time = time.time()
+
+        print(f"⏱️  Neighbor expansion took: {end_time - start_time:.2f} seconds (2 Qdrant round trips)")
+        print(f"📊 Retrieved {len(docs)} merged passages "
+              f"({sum(len(d.metadata['chunk_ids']) for d in docs)} chunks)")
+
+        print("\nNeighbor Expansion Results:")
+        for i, d in enumerate(docs, 1):
+            print(f"Result {i}: chunks {d.metadata['chunk_ids']} (hits {d.metadata['hit_chunk_ids']}), "
+                  f"{len(d.page_content)} chars")
+            print(f"Content: {d.page_content[:300]}...")
+            print("-" * 50)
+        return docs
+    except Exception as e:
+        print(f"❌ Error with neighbor expansion: {e}")
+        return []
+    finally:
+        if owned:
+            context.close()
@@ -0,0 +1,223 @@
+import threading
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from qdrant_helper import DEFAULT_DATA_PATH, PARENT_CHILD_DATA_PATH
+from tracing import span
+from vector_artifact import is_legacy_json, iter_documents, iter_records, open_vectors, read_manifest
+
+
+def default_data_path(collection):
+    """Where main.py writes the data for `collection` (children collections use the parent/child split)."""
+    return PARENT_CHILD_DATA_PATH if collection.endswith("_children") else DEFAULT_DATA_PATH
+
+
+def matches_filter(payload, filter):
+    """Whether one payload dict passes a filter of the form NumpyVectorStore.filter_mask takes."""
+    for field, condition in (filter or {}).items():
+        value = payload.get(field)
+        if isinstance(condition, dict):
+            if not isinstance(value, (int, float)):
+                return False
+            for op, bound in condition.items():
+                if op not in ("gte", "gt", "lte", "lt"):
+                    raise ValueError(f"Unsupported range operator '{op}' for field '{field}'")
+                if ((op == "gte" and value < bound) or (op == "gt" and value <= bound)
+                        or (op == "lte" and value > bound) or (op == "lt" and value >= bound)):
+                    return False
+        elif isinstance(condition, (list, tuple, set)):
+            if value not in condition:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process cosine search over a contiguous, pre-normalized float32 matrix.
+
+    Meant for collections small enough to hold in memory (demo_index is a few
+    hundred chunks), where a Qdrant round trip costs more than the search.
+    Top-k for one or many queries is one matrix product plus argpartition.
+    Payloads mirror what setup_qdrant uploads (text + flat metadata), and
+    returned Documents look like RetrievalContext.search_batch results.
+
+    Filters are dicts over payload fields:
+        {"category": "setup"}                 equality
+        {"document_type": ["tutorial", ...]}  any of
+        {"chunk_id": {"gte": 3, "lte": 9}}    numeric range (gt/gte/lt/lte)
+    """
+
+    def __init__(self, embedding=None, collection_name="numpy", ids=None, vectors=None, payloads=None):
+        self.embedding = embedding
+        self.collection_name = collection_name
+        self.ids = list(ids or [])
+        self.payloads = list(payloads or [])
+        self.matrix = (np.zeros((0, 0), dtype=np.float32) if vectors is None or len(vectors) == 0
+                       else _normalize_rows(np.array(vectors, dtype=np.float32, order="C")))
+        self._columns = {}
+        self._rows_by_id = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_artifact(cls, path, embedding=None, collection_name=None):
+        """Load the output of generate_json_from_docs (binary artifact or legacy JSON)."""
+        if is_legacy_json(path):
+            docs = list(iter_documents(path))
+            vectors = np.array([d["vector"] for d in docs], dtype=np.float32)
+            records = docs
+        else:
+            manifest = read_manifest(path)
+            # One read of the whole matrix; the copy makes it writable for in-place normalization
+            vectors = np.array(open_vectors(path, manifest), dtype=np.float32, order="C")
+            records = list(iter_records(path, manifest))
+        store = cls(embedding, collection_name or path)
+        store.ids = [str(r["id"]) for r in records]
+        store.payloads = [{"text": r["text"], **r.get("metadata", {})} for r in records]
+        store.matrix = _normalize_rows(vectors) if len(records) else np.zeros((0, 0), dtype=np.float32)
+        return store
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    def __len__(self):
+        return len(self.ids)
+
+    # --- filtering -------------------------------------------------------
+
+    def _column(self, field):
+        column = self._columns.get(field)
+        if column is None:
+            column = np.empty(len(self.payloads), dtype=object)
+            column[:] = [p.get(field) for p in self.payloads]
+            self._columns[field] = column
+        return column
+
+    def filter_mask(self, filter):
+        """Boolean row mask for a payload filter dict (None means every row)."""
+        if not filter:
+            return None
+        mask = np.ones(len(self.ids), dtype=bool)
+        for field, condition in filter.items():
+            column = self._column(field)
+            if isinstance(condition, dict):
+                numeric = np.array([v if isinstance(v, (int, float)) else np.nan for v in column], dtype=np.float64)
+                for op, bound in condition.items():
+                    if op == "gte":
+                        mask &= numeric >= bound
+                    elif op == "gt":
+                        mask &= numeric > bound
+                    elif op == "lte":
+                        mask &= numeric <= bound
+                    elif op == "lt":
+                        mask &= numeric < bound
+                    else:
+                        raise ValueError(f"Unsupported range operator '{op}' for field '{field}'")
+            elif isinstance(condition, (list, tuple, set)):
+                mask &= np.array([v in condition for v in column], dtype=bool)
+            else:
+                mask &= column == condition
+        return mask
+
+    # --- search ----------------------------------------------------------
+
+    def search_vectors(self, vectors, k=3, filter=None):
+        """
+        Top-k (row, score) pairs for each query vector, best first.
+        All queries are scored in one (queries x rows) matrix product.
+        """
+        queries = _normalize_rows(np.array(vectors, dtype=np.float32, ndmin=2))
+        if not len(self.ids) or k <= 0:
+            return [[] for _ in range(len(queries))]
+        with span("numpy.search", queries=len(queries), rows=len(self.ids), k=k):
+            scores = queries @ self.matrix.T
+            mask = self.filter_mask(filter)
+            candidates = len(self.ids)
+            if mask is not None:
+                scores[:, ~mask] = -np.inf
+                candidates = int(mask.sum())
+            k = min(k, candidates)
+            if k == 0:
+                return [[] for _ in range(len(queries))]
+            if k < scores.shape[1]:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            else:
+                top = np.tile(np.arange(scores.shape[1]), (len(queries), 1))
+            rows = np.arange(len(queries))[:, None]
+            order = np.argsort(-scores[rows, top], axis=1)
+            top = top[rows, order]
+            return [[(int(i), float(scores[q, i])) for i in top[q]] for q in range(len(queries))]
+
+    def _document(self, row, score=None):
+        payload = dict(self.payloads[row])
+        text = payload.pop("text", "")
+        metadata = {**payload, "_id": self.ids[row], "_collection_name": self.collection_name}
+        if score is not None:
+            metadata["_score"] = score
+        return Document(page_content=text, metadata=metadata)
+
+    def search_batch(self, vectors, k=3, filter=None):
+        """Same shape as RetrievalContext.search_batch: one list of Documents per query vector."""
+        return [[self._document(row, score) for row, score in hits] for hits in self.search_vectors(vectors, k, filter)]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        # Like QdrantVectorStore, no score in the metadata: MultiQueryRetriever
+        # dedupes on (page_content, metadata), and a per-variant score would defeat it
+        return [self._document(row) for row, _ in self.search_vectors([embedding], k, filter)[0]]
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        hits = self.search_vectors([self.embedding.embed_query(query)], k, filter)[0]
+        return [(self._document(row, score), score) for row, score in hits]
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k, filter)
+
+    def _select_relevance_score_fn(self):
+        return self._cosine_relevance_score_fn
+
+    def get_by_ids(self, ids):
+        """Documents for the given point IDs, in that order; unknown IDs are skipped."""
+        with self._lock:
+            if self._rows_by_id is None:
+                self._rows_by_id = {point_id: row for row, point_id in enumerate(self.ids)}
+            rows = [self._rows_by_id.get(str(point_id)) for point_id in ids]
+        return [self._document(row) for row in rows if row is not None]
+
+    def scroll(self, filter=None, limit=None):
+        """Documents matching `filter` in storage order (the Qdrant scroll equivalent)."""
+        mask = self.filter_mask(filter)
+        rows = range(len(self.ids)) if mask is None else np.flatnonzero(mask)
+        return [self._document(int(row)) for row in list(rows)[:limit]]
+
+    # --- writes ----------------------------------------------------------
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = [str(i) for i in ids] if ids else [str(uuid.uuid4()) for _ in texts]
+        vectors = _normalize_rows(np.array(self.embedding.embed_documents(texts), dtype=np.float32, ndmin=2))
+        with self._lock:
+            self.matrix = vectors if not len(self.ids) else np.vstack([self.matrix, vectors])
+            self.ids.extend(ids)
+            self.payloads.extend({"text": t, **m} for t, m in zip(texts, metadatas))
+            self._columns.clear()
+            self._rows_by_id = None
+        return ids
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, collection_name="numpy", **kwargs):
+        store = cls(embedding, collection_name)
+        store.add_texts(texts, metadatas, ids)
+        return store
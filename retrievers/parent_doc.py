@@ -1,41 +1,48 @@
-import os
 import time
-from langchain_qdrant import QdrantVectorStore
-from langchain_ollama import OllamaEmbeddings, ChatOllama
-from langchain.retrievers import ParentDocumentRetriever
-from langchain.storage import InMemoryStore
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from qdrant_client import QdrantClient
+from retrievers.context import open_context
+from tracing import span
 
-def run_parent_doc(host, port, collection, query=None):
+def children_collection_name(collection):
+    """Child chunks (with parent_id payloads) live next to the flat collection."""
+    return f"{collection}_children"
+
+def parent_doc_search(context, collection, query, k=3, children_collection=None, filter=None):
+    """
+    Search the child collection, then fetch the distinct parents of the best
+    hits from the persistent docstore in one mget. Children are over-fetched
+    so that k distinct parents are usually found. `filter` applies to the
+    children's metadata.
+    """
+    children_collection = children_collection or children_collection_name(collection)
+    query_vector = context.embeddings.embed_query(query)
+    children = context.search_batch(children_collection, [query_vector], k=k * 4, filter=filter)[0]
+    return parents_of_children(context, children, k)
+
+def parents_of_children(context, children, k=3):
+    """The first k distinct parents of ranked child hits, fetched from the docstore in one mget."""
+    parent_ids = []
+    for child in children:
+        parent_id = child.metadata.get("parent_id")
+        if parent_id and parent_id not in parent_ids:
+            parent_ids.append(parent_id)
+    parent_ids = parent_ids[:k]
+
+    with span("docstore.mget", keys=len(parent_ids)):
+        parents = context.docstore.mget(parent_ids)
+    return [doc for doc in parents if doc is not None]
+
+def run_parent_doc(host, port, collection, query=None, context=None, children_collection=None, filter=None):
     if query is None:
         query = "How does vector storage work?"
     
     print(f"Query: {query}\n")
 
-    client = QdrantClient(host=host, port=port)
-    embedding_fn = OllamaEmbeddings(model=os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text"))
-    vectorstore = QdrantVectorStore(
-        client=client, 
-        collection_name=collection, 
-        embedding=embedding_fn,
-        content_payload_key="text"
-    )
+    # Reuse the caller's client/embedder; only build (and close) our own if none given
+    context, owned = open_context(host, port, context)
 
     try:
-        # Parent document retriever setup - NOTE: This needs documents loaded first!
-        store = InMemoryStore()
-        
-        # Create text splitters for parent and child documents
-        parent_splitter = RecursiveCharacterTextSplitter(chunk_size=2000)
-        child_splitter = RecursiveCharacterTextSplitter(chunk_size=400)
-        
-        retriever = ParentDocumentRetriever(
-            vectorstore=vectorstore,
-            docstore=store,
-            child_splitter=child_splitter,
-            parent_splitter=parent_splitter,
-        )
+        # Parents (2000 chars) and child vectors (400 chars) are built once by
+        # main.py; here we only search children and bulk-read parents.
         
         # REALITY CHECK: Parent Document complexity in production
         print("⚠️  PRODUCTION REALITY: Parent-Child structure has major challenges!")
@@ -45,13 +52,13 @@ def run_parent_doc(host, port, collection, query=None):
         print("   ❌ Storage cost: ~2x storage (both child embeddings + parent content)")
         print("   ✅ SIMPLER ALTERNATIVE: Use larger chunks (1000+ chars) with overlap")
         print("   ✅ OR: Retrieve neighboring chunks for context expansion")
-        print("   Current demo shows 0 results because InMemoryStore is empty\n")
+        print("   This demo keeps parents in a file-backed docstore built by main.py\n")
 
         print("Generating parent document retrieval...")
         
         # PERFORMANCE ANALYSIS: How much time does parent document retrieval take?
         start_time = time.time()
-        docs = retriever.invoke(query)
+        docs = parent_doc_search(context, collection, query, children_collection=children_collection, filter=filter)
         end_time = time.time()
         
         print(f"⏱️  Parent Document retrieval took: {end_time - start_time:.2f} seconds")
@@ -68,7 +75,7 @@ def run_parent_doc(host, port, collection, query=None):
         # Compare with single query for reference
         print(f"\n🔍 For comparison - baseline similarity search:")
         single_start = time.time()
-        single_docs = vectorstore.similarity_search(query, k=3)
+        single_docs = context.search(collection, query, k=3, filter=filter)
         single_end = time.time()
         print(f"⏱️  Baseline query took: {single_end - single_start:.2f} seconds")
         print(f"📊 Retrieved {len(single_docs)} documents")
@@ -86,12 +93,11 @@ def run_parent_doc(host, port, collection, query=None):
             print(f"   ⚠️  High overhead - evaluate if context benefits justify cost")
         
         if len(docs) == 0:
-            print("📝 EXPLANATION: Got 0 results because InMemoryStore is empty")
-            print("   Parent Document retriever needs documents loaded with specific parent-child structure")
-            print("   Current Qdrant collection has flat chunks, not hierarchical documents")
+            print("📝 EXPLANATION: Got 0 results because the parent docstore or child collection is empty")
+            print("   Run `python main.py` to build parents in the docstore and child vectors in Qdrant")
             print("\n🔄 Falling back to similarity search to show what results would look like...")
             
-            fallback_docs = vectorstore.similarity_search(query, k=3)
+            fallback_docs = context.search(collection, query, k=3, filter=filter)
             print(f"\nFallback Similarity Results ({len(fallback_docs)} documents):")
             for i, d in enumerate(fallback_docs, 1):
                 print(f"Result {i}:")
@@ -109,14 +115,14 @@ def run_parent_doc(host, port, collection, query=None):
     except Exception as e:
         print(f"💥 TECHNICAL ERROR: {str(e)[:100]}...")
         print("📝 EXPLANATION: Parent document retriever needs specific setup:")
-        print("   1. Documents must be loaded into InMemoryStore first")
-        print("   2. Documents need parent-child chunk relationships")
-        print("   3. Current demo uses flat Qdrant chunks, not hierarchical structure")
+        print(f"   1. Child chunks must be uploaded to '{children_collection or children_collection_name(collection)}'")
+        print("   2. Parents must be written to the persistent docstore")
+        print("   3. Run `python main.py` to build both from my_doc.txt")
         print("\n🔄 Using fallback similarity search...")
         
         # Fallback to simple similarity search with timing
         fallback_start = time.time()
-        docs = vectorstore.similarity_search(query, k=3)
+        docs = context.search(collection, query, k=3, filter=filter)
         fallback_end = time.time()
         
         print(f"⏱️  Fallback similarity search took: {fallback_end - fallback_start:.2f} seconds")
@@ -128,3 +134,6 @@ def run_parent_doc(host, port, collection, query=None):
             print(f"Content: {d.page_content[:200]}...")
             print(f"Metadata: {d.metadata}")
             print("-" * 50)
+    finally:
+        if owned:
+            context.close()
@@ -0,0 +1,29 @@
+from retrievers.multi_query import multi_query_search, fused_multi_query_search
+from retrievers.parent_doc import parent_doc_search
+from retrievers.neighbor_expansion import neighbor_expansion_search
+from retrievers.hybrid import hybrid_search
+from tracing import traced
+
+
+def baseline_search(context, collection, query, k=3, filter=None):
+    return context.search(collection, query, k=k, filter=filter)
+
+
+def _fused_docs(context, collection, query, k=3, filter=None):
+    docs, _ = fused_multi_query_search(context, collection, query, k=k, filter=filter)
+    return docs
+
+
+# Quiet, structured entry points: strategy(context, collection, query, k, filter=None) -> [Document].
+# `filter` is a metadata dict such as {"category": "setup"} (see build_qdrant_filter).
+# The run_* functions print; these are what benchmarks and batch jobs call.
+STRATEGIES = {
+    "baseline": baseline_search,
+    "multi_query": multi_query_search,
+    "multi_query_fused": _fused_docs,
+    "parent_doc": parent_doc_search,
+    "neighbor": neighbor_expansion_search,
+    "hybrid": hybrid_search,
+}
+# Each call is one top-level "strategy.<name>" span when tracing is on
+STRATEGIES = {name: traced(f"strategy.{name}")(fn) for name, fn in STRATEGIES.items()}
@@ -0,0 +1,31 @@
+import time
+
+from tracing import count
+
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+
+
+def backoff_delay(attempt):
+    """Seconds to wait before retry number `attempt` (1-based): 0.5, 1, 2, 4, then 8 at most."""
+    return min(2 ** (attempt - 1) * RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+
+
+def call_with_retry(fn, max_retries, what, counter, sleep=time.sleep):
+    """
+    Return `fn(attempt)`, calling it again with exponential backoff while it
+    raises, up to `max_retries` retries; the last error is re-raised. Each
+    retry bumps the `counter` metric and prints one line naming `what` failed.
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn(attempt)
+        except Exception as e:
+            attempt += 1
+            if attempt > max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            count(counter)
+            print(f"⚠️  {what} failed ({e}); retry {attempt}/{max_retries} in {delay:.1f}s")
+            sleep(delay)
@@ -1,12 +1,23 @@
 # Comprehensive RAG Retriever Comparison Tool
 from retrievers.multi_query import run_multi_query
 from retrievers.parent_doc import run_parent_doc
-import os
+from retrievers.neighbor_expansion import run_neighbor_expansion
+from retrievers.hybrid import run_hybrid
+from retrievers.context import VECTOR_BACKEND, RetrievalContext, open_context
+from retrievers.strategies import STRATEGIES
+from benchmark import (
+    DEFAULT_RESULTS_PATH, build_offline_context, compare_quantization, compare_recall, compare_reports,
+    print_benchmark_table, print_quantization_table, print_recall_table, run_benchmark, write_report,
+)
+from qdrant_helper import DEFAULT_DATA_PATH
+from batch_queries import DEFAULT_BATCH_OUTPUT, print_batch_summary, run_batch
+from service import SERVICE_BATCH_WINDOW_MS, SERVICE_HOST, SERVICE_PORT, run_service
+import tracing
+from tracing import span
+import sys
+import json
+import contextlib
 import argparse
-from langchain_qdrant import QdrantVectorStore
-from langchain_ollama import OllamaEmbeddings, ChatOllama
-from langchain.retrievers import MultiQueryRetriever
-from qdrant_client import QdrantClient
 
 # Connection details
 HOST = "localhost"
@@ -19,23 +30,36 @@ def print_section_header(title, emoji="🔧"):
     print(f"{emoji} {title}")
     print('='*80)
 
-def run_baseline_search(host, port, collection, query, k=3):
+def parse_filter_args(pairs):
+    """
+    ["category=setup", "has_code=true", "document_type=tutorial,example"] ->
+    {"category": "setup", "has_code": True, "document_type": ["tutorial", "example"]}
+    Values are parsed as JSON when possible (numbers, booleans, objects such as
+    chunk_id={"gte":3}), comma-separated values become match-any lists.
+    """
+    metadata_filter = {}
+    for pair in pairs or []:
+        field, sep, raw = pair.partition("=")
+        if not sep or not field:
+            raise argparse.ArgumentTypeError(f"Filter must look like field=value, got '{pair}'")
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            value = raw.split(",") if "," in raw else raw
+        metadata_filter[field.strip()] = value
+    return metadata_filter or None
+
+def run_baseline_search(host, port, collection, query, k=3, context=None, filter=None):
     """Run baseline similarity search"""
     print(f"[🔍 Baseline Similarity Search]")
     print("Direct vector similarity search - fast and straightforward")
     print(f"Query: '{query}'\n")
+    if filter:
+        print(f"Filter: {filter}\n")
     
-    client = QdrantClient(host=host, port=port)
-    embedding_fn = OllamaEmbeddings(model=os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text"))
-    vectorstore = QdrantVectorStore(
-        client=client, 
-        collection_name=collection, 
-        embedding=embedding_fn,
-        content_payload_key="text"
-    )
-    
+    context, owned = open_context(host, port, context)
     try:
-        docs = vectorstore.similarity_search(query, k=k)
+        docs = context.search(collection, query, k=k, filter=filter)
         print(f"📋 Found {len(docs)} results:")
         for i, d in enumerate(docs, 1):
             content_preview = d.page_content.replace('\n', ' ')[:120]
@@ -46,6 +70,9 @@ def run_baseline_search(host, port, collection, query, k=3):
     except Exception as e:
         print(f"❌ Error: {e}")
         return []
+    finally:
+        if owned:
+            context.close()
 
 def demonstrate_multi_query_behavior(query):
     """Show what Multi-Query retriever does conceptually"""
@@ -91,17 +118,38 @@ def demonstrate_parent_doc_behavior(query):
     print("  3. ⚖️ Balance: precision in search, completeness in results")
     print("➡️ Best of both worlds: accurate matching + comprehensive answers")
 
-def compare_all_retrievers(queries, show_behavior=False):
+def demonstrate_neighbor_expansion_behavior(query):
+    """Show what the Neighbor Expansion retriever does conceptually"""
+    print(f"🧩 Neighbor Expansion Strategy:")
+    print(f"Query: '{query}'")
+    print("🎯 Context without a second storage system:")
+    print("  1. 🔍 Search the normal 500-char chunks for the top hits")
+    print("  2. ↔️ Fetch each hit's neighbors (chunk_id ± N) in one batched scroll")
+    print("  3. 🧵 Merge overlapping windows and strip the 50-char splitter overlap")
+    print("➡️ Parent-doc style context for one extra round trip")
+
+def compare_all_retrievers(queries, show_behavior=False, multi_query_mode="langchain", backend=None, filter=None):
     """Compare all retrievers with given queries"""
     print("🚀 RAG Retriever Comparison Analysis")
     print("Testing different retrieval strategies with Qdrant + Ollama + LangChain\n")
     
+    # One client/embedder/LLM for the whole run instead of per strategy per query
+    with RetrievalContext(HOST, PORT, backend=backend) as context:
+        _compare_queries(queries, show_behavior, context, multi_query_mode, filter)
+        if hasattr(context.embeddings, "stats"):
+            stats = context.embeddings.stats()
+            print(f"\n💾 Query embedding cache: {stats['hits']} hits, {stats['coalesced']} coalesced, "
+                  f"{stats['misses']} misses ({stats['hit_rate']:.0%} hit rate)")
+
+def _compare_queries(queries, show_behavior, context, multi_query_mode="langchain", filter=None):
+    """Run every strategy for each query against one shared context"""
     for i, query in enumerate(queries, 1):
         print(f"🎯 TEST QUERY {i}: '{query}'")
         print("=" * 100)
         
         # Baseline
-        baseline_docs = run_baseline_search(HOST, PORT, COLLECTION, query, k=2)
+        with span("strategy.baseline"):
+            baseline_docs = run_baseline_search(HOST, PORT, COLLECTION, query, k=2, context=context, filter=filter)
         
         if show_behavior:
             print_section_header("Multi-Query Retriever Behavior", "🔄")
@@ -109,12 +157,25 @@ def compare_all_retrievers(queries, show_behavior=False):
             
             print_section_header("Parent Document Retriever Behavior", "📄")
             demonstrate_parent_doc_behavior(query)
+            
+            print_section_header("Neighbor Expansion Retriever Behavior", "🧩")
+            demonstrate_neighbor_expansion_behavior(query)
         else:
             print_section_header("Multi-Query Retriever Results", "🔄")
-            run_multi_query(HOST, PORT, COLLECTION, query)
+            with span(f"strategy.multi_query{'_fused' if multi_query_mode == 'fused' else ''}"):
+                run_multi_query(HOST, PORT, COLLECTION, query, context=context, mode=multi_query_mode, filter=filter)
             
             print_section_header("Parent Document Retriever Results", "📄")
-            run_parent_doc(HOST, PORT, COLLECTION, query)
+            with span("strategy.parent_doc"):
+                run_parent_doc(HOST, PORT, COLLECTION, query, context=context, filter=filter)
+            
+            print_section_header("Neighbor Expansion Retriever Results", "🧩")
+            with span("strategy.neighbor"):
+                run_neighbor_expansion(HOST, PORT, COLLECTION, query, k=2, context=context, filter=filter)
+            
+            print_section_header("Hybrid BM25 + Dense Retriever Results", "🔀")
+            with span("strategy.hybrid"):
+                run_hybrid(HOST, PORT, COLLECTION, query, context=context, filter=filter)
         
         if i < len(queries):
             print(f"\n{'🔄 NEXT QUERY':<100}")
@@ -129,16 +190,157 @@ def print_summary():
     print("│ 🔍 Baseline     │ Fast, reliable queries - works with any content        │")
     print("│ 🔄 Multi-Query  │ Complex topics - improves recall through query expansion│")
     print("│ 📄 Parent Doc   │ Long documents - precise search, comprehensive context │")
+    print("│ 🧩 Neighbors    │ Context expansion - adjacent chunks, one extra round trip│")
+    print("│ 🔀 Hybrid       │ Exact terms + meaning - multi-query-like recall, no LLM │")
     print("└─────────────────┴─────────────────────────────────────────────────────────┘")
 
+def open_run_context(args):
+    """Real Qdrant + Ollama context, or the in-process stub stack with --offline"""
+    if args.offline:
+        return build_offline_context("my_doc.txt", COLLECTION, args.embed_latency, args.llm_latency, backend=args.backend)
+    return RetrievalContext(HOST, PORT, backend=args.backend)
+
+def run_benchmark_mode(args, queries):
+    """Repeat each strategy with warmup and report latency percentiles as a table and JSON"""
+    print_section_header("Retrieval Benchmark", "⏱️")
+    with open_run_context(args) as context:
+        report = run_benchmark(
+            context, COLLECTION, queries, args.strategies, args.runs, args.warmup, filter=args.filter,
+            config={"offline": args.offline, "embed_latency": args.embed_latency, "llm_latency": args.llm_latency},
+        )
+    print_benchmark_table(report)
+    if args.compare_to:
+        with open(args.compare_to, "r", encoding="utf-8") as f:
+            compare_reports(json.load(f), report)
+    write_report(report, args.results_json)
+
+def run_quantization_mode(args):
+    """Recall@k and latency of scalar/binary quantized copies of the collection vs. exact float32 search"""
+    print_section_header("Quantization: Recall vs Latency", "🗜️")
+    if args.offline:
+        print("⚠️  In-process Qdrant ignores quantization and HNSW settings (recall will read 1.0);")
+        print("   run against a Qdrant server for numbers you can choose settings with.")
+        context = build_offline_context("my_doc.txt", COLLECTION, backend="qdrant")
+    else:
+        context = RetrievalContext(HOST, PORT)
+    with context:
+        report = compare_quantization(
+            context.client, context.data_paths.get(COLLECTION, DEFAULT_DATA_PATH), args.quant_modes,
+            args.quant_queries, args.quant_k, args.oversampling, args.on_disk,
+        )
+    print_quantization_table(report)
+    write_report(report, args.results_json)
+
+def run_recall_mode(args, queries):
+    """Recall overlap and latency of cheap strategies against the multi-query reference"""
+    print_section_header(f"Recall vs {args.recall_reference}", "🎯")
+    with open_run_context(args) as context:
+        report = compare_recall(context, COLLECTION, queries, args.strategies or ["hybrid"], args.recall_reference,
+                                args.recall_k, args.filter)
+    print_recall_table(report)
+    write_report(report, args.results_json)
+
+def run_batch_mode(args):
+    """Stream queries from a JSONL file through concurrent workers, streaming JSONL results out"""
+    if not args.input:
+        raise SystemExit("--mode batch needs --input <queries.jsonl>")
+    # Keep stdout clean for the JSONL stream when writing results there
+    with contextlib.redirect_stdout(sys.stderr if args.output == "-" else sys.stdout):
+        print(f"📦 Batch: {args.input} -> {args.output} ({args.workers} workers, default strategy {args.strategy})")
+        context = open_run_context(args)
+    with context:
+        summary = run_batch(context, COLLECTION, args.input, args.output, args.workers, args.strategy,
+                            args.k, args.query_field, args.filter)
+    print_batch_summary(summary, args.output)
+
+def run_serve_mode(args):
+    """Serve baseline / multi-query / parent-doc over local HTTP with micro-batched embedding and search"""
+    with open_run_context(args) as context:
+        run_service(context, COLLECTION, args.serve_host, args.serve_port, window_ms=args.batch_window_ms)
+
+def export_tracing(args):
+    """Print per-stage totals and write the trace/metrics files requested on the command line"""
+    summary = tracing.stage_summary()
+    if not summary:
+        return
+    print_section_header("Per-Stage Timing", "🧭")
+    print(f"{'Stage':<32}{'calls':>8}{'total s':>10}{'mean ms':>10}")
+    for stage, s in sorted(summary.items(), key=lambda item: -item[1]["total_s"]):
+        print(f"{stage:<32}{s['count']:>8}{s['total_s']:>10.3f}{s['mean_ms']:>10.2f}")
+    if args.trace_json:
+        spans = tracing.export_json_trace(args.trace_json)
+        print(f"\n💾 {spans} spans written to {args.trace_json} (open in chrome://tracing or ui.perfetto.dev)")
+    if args.metrics_prom:
+        tracing.export_prometheus(args.metrics_prom)
+        print(f"💾 Prometheus metrics written to {args.metrics_prom}")
+
 def main():
     parser = argparse.ArgumentParser(description='RAG Retriever Comparison Tool')
-    parser.add_argument('--mode', choices=['results', 'behavior'], default='results',
-                        help='Show actual results or explain behavior (default: results)')
+    parser.add_argument('--mode', choices=['results', 'behavior', 'benchmark', 'recall', 'quantization', 'batch', 'serve'],
+                        default='results',
+                        help='Show actual results, explain behavior, benchmark latency, compare recall against '
+                             'multi-query, compare quantization recall/latency, replay a JSONL query file or run the '
+                             'HTTP service (default: results)')
     parser.add_argument('--query', type=str, help='Custom query to test')
     parser.add_argument('--queries', nargs='+', help='Multiple queries to test')
+    parser.add_argument('--backend', choices=['qdrant', 'numpy'], default=VECTOR_BACKEND,
+                        help='qdrant: search the Qdrant collections; numpy: search the ingest artifacts in process')
+    parser.add_argument('--filter', action='append', metavar='FIELD=VALUE',
+                        help='Metadata filter pushed down into every search, e.g. --filter category=setup '
+                             '--filter has_code=true --filter document_type=tutorial,example (repeatable)')
+    parser.add_argument('--multi-query-mode', choices=['langchain', 'fused'], default='langchain',
+                        help='langchain: serial MultiQueryRetriever; fused: batched embed/search + RRF')
+    
+    bench = parser.add_argument_group('benchmark mode')
+    bench.add_argument('--runs', type=int, default=20, help='Timed runs per strategy')
+    bench.add_argument('--warmup', type=int, default=3, help='Untimed warmup runs per strategy')
+    bench.add_argument('--strategies', nargs='+', choices=list(STRATEGIES), help='Strategies to benchmark (default: all)')
+    bench.add_argument('--offline', action='store_true',
+                       help='Use in-process Qdrant plus stub embedding/LLM backends built from my_doc.txt (benchmark and batch)')
+    bench.add_argument('--embed-latency', type=float, default=0.0, help='Simulated stub embedding latency (s)')
+    bench.add_argument('--llm-latency', type=float, default=0.0, help='Simulated stub LLM latency (s)')
+    bench.add_argument('--results-json', default=DEFAULT_RESULTS_PATH, help='Where to write JSON results')
+    bench.add_argument('--compare-to', help='Earlier results JSON to diff p50/p95 against')
+    
+    recall = parser.add_argument_group('recall mode (compares --strategies, default hybrid; results go to --results-json)')
+    recall.add_argument('--recall-reference', choices=list(STRATEGIES), default='multi_query',
+                        help='Strategy whose gain over baseline the others are measured against')
+    recall.add_argument('--recall-k', type=int, default=5, help='Results per query')
+    
+    quant = parser.add_argument_group('quantization mode (results go to --results-json)')
+    quant.add_argument('--quant-modes', nargs='+', choices=['scalar', 'binary'], default=['scalar', 'binary'],
+                       help='Quantization settings to compare against the unquantized collection')
+    quant.add_argument('--quant-queries', type=int, default=50, help='Query vectors sampled from the data')
+    quant.add_argument('--quant-k', type=int, default=10, help='k for recall@k')
+    quant.add_argument('--oversampling', type=float, default=2.0, help='Candidates fetched per result before rescoring')
+    quant.add_argument('--on-disk', action='store_true', help='Keep float32 originals on disk in the test collections')
+    
+    batch = parser.add_argument_group('batch mode')
+    batch.add_argument('--input', help='JSONL file of queries, one object per line')
+    batch.add_argument('--output', default=DEFAULT_BATCH_OUTPUT, help='JSONL results file, written as queries finish ("-" for stdout)')
+    batch.add_argument('--workers', type=int, default=4, help='Queries run concurrently')
+    batch.add_argument('--strategy', choices=list(STRATEGIES), default='baseline',
+                       help='Strategy for lines without a "strategy" field')
+    batch.add_argument('--k', type=int, default=3, help='Results per query for lines without a "k" field')
+    batch.add_argument('--query-field', default='query', help='JSON field holding the query text')
+    
+    serve = parser.add_argument_group('serve mode')
+    serve.add_argument('--serve-host', default=SERVICE_HOST, help='Address to listen on')
+    serve.add_argument('--serve-port', type=int, default=SERVICE_PORT, help='Port to listen on')
+    serve.add_argument('--batch-window-ms', type=float, default=SERVICE_BATCH_WINDOW_MS,
+                       help='How long to wait for more queries before sending an embedding/search batch (0 = no coalescing wait)')
+    
+    trace = parser.add_argument_group('tracing (also enabled by RAG_TRACE=1)')
+    trace.add_argument('--trace-json', help='Write nested per-stage spans as a Chrome trace-event JSON file')
+    trace.add_argument('--metrics-prom', help='Write stage latency histograms and counters in Prometheus text format')
     
     args = parser.parse_args()
+    try:
+        args.filter = parse_filter_args(args.filter)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    if args.trace_json or args.metrics_prom:
+        tracing.enable_tracing()
     
     # Default test queries
     default_queries = [
@@ -155,10 +357,22 @@ def main():
     else:
         queries = default_queries
     
-    # Run comparison
-    show_behavior = (args.mode == 'behavior')
-    compare_all_retrievers(queries, show_behavior)
-    print_summary()
+    if args.mode == 'benchmark':
+        run_benchmark_mode(args, queries)
+    elif args.mode == 'recall':
+        run_recall_mode(args, queries)
+    elif args.mode == 'quantization':
+        run_quantization_mode(args)
+    elif args.mode == 'batch':
+        run_batch_mode(args)
+    elif args.mode == 'serve':
+        run_serve_mode(args)
+    else:
+        # Run comparison
+        show_behavior = (args.mode == 'behavior')
+        compare_all_retrievers(queries, show_behavior, args.multi_query_mode, args.backend, args.filter)
+        print_summary()
+    export_tracing(args)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,356 @@
+"""
+Local asyncio HTTP retrieval service (stdlib only).
+
+    POST /search  {"query": "...", "strategy": "baseline|multi_query|parent_doc|hybrid", "k": 3,
+                   "filter": {"category": "setup"}}
+    GET  /health
+    GET  /stats
+
+Concurrent requests are coalesced: query texts that arrive within
+SERVICE_BATCH_WINDOW_MS of each other go to the embedder as one batch, and
+their vectors go to Qdrant as one query_batch_points call per collection.
+At most SERVICE_MAX_CONCURRENCY requests run at once; up to
+SERVICE_MAX_PENDING more wait, and anything beyond that gets 503 with
+Retry-After instead of piling up.
+"""
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from batch_queries import result_entry
+from retrievers.fusion import reciprocal_rank_fusion
+from retrievers.hybrid import HYBRID_CANDIDATES, lexical_search
+from retrievers.multi_query import generate_query_variants
+from retrievers.parent_doc import children_collection_name, parents_of_children
+from tracing import count, span
+
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8765"))
+SERVICE_BATCH_WINDOW_MS = float(os.getenv("SERVICE_BATCH_WINDOW_MS", "5"))
+SERVICE_MAX_BATCH = int(os.getenv("SERVICE_MAX_BATCH", "64"))
+SERVICE_MAX_CONCURRENCY = int(os.getenv("SERVICE_MAX_CONCURRENCY", "32"))
+SERVICE_MAX_PENDING = int(os.getenv("SERVICE_MAX_PENDING", "256"))
+# Request bodies declaring a larger Content-Length are refused with 413 before they are read
+SERVICE_MAX_BODY_BYTES = int(os.getenv("SERVICE_MAX_BODY_BYTES", "65536"))
+
+SERVICE_STRATEGIES = ("baseline", "multi_query", "parent_doc", "hybrid")
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class ServiceOverloaded(Exception):
+    pass
+
+
+class MicroBatcher:
+    """
+    Collect items submitted from many coroutines and hand them to the
+    blocking `fn(items) -> results` in batches of up to `max_batch`, waiting
+    at most `window` seconds after the first item of a batch. `fn` runs on
+    `executor`, so the event loop keeps accepting requests meanwhile.
+    """
+
+    def __init__(self, name, fn, executor, window, max_batch, max_queue):
+        self.name = name
+        self.fn = fn
+        self.executor = executor
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue(max_queue)
+        self.batches = 0
+        self.items = 0
+        self._task = None
+        self._dispatches = set()
+
+    def start(self):
+        self._task = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await asyncio.gather(*self._dispatches, return_exceptions=True)
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((item, future))
+        except asyncio.QueueFull:
+            raise ServiceOverloaded(f"{self.name} queue full")
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch):
+        self.batches += 1
+        self.items += len(batch)
+        count(f"service_{self.name}_batches")
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.fn, [item for item, _ in batch]
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        return {"batches": self.batches, "items": self.items,
+                "avg_batch": self.items / self.batches if self.batches else 0.0}
+
+
+class RetrievalService:
+    """Async front end over a RetrievalContext with micro-batched embedding and search."""
+
+    def __init__(self, context, collection, window_ms=None, max_batch=None, max_concurrency=None, max_pending=None):
+        self.context = context
+        self.collection = collection
+        self.window = (SERVICE_BATCH_WINDOW_MS if window_ms is None else window_ms) / 1000.0
+        self.max_batch = max_batch or SERVICE_MAX_BATCH
+        self.max_concurrency = max_concurrency or SERVICE_MAX_CONCURRENCY
+        self.max_pending = SERVICE_MAX_PENDING if max_pending is None else max_pending
+        # LLM calls and docstore reads block for a long time; keep them off the threads
+        # that run embedding/search batches so batches never queue behind them
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="rag-service")
+        self.batch_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="rag-batch")
+        self.requests = 0
+        self.rejected = 0
+        self.admitted = 0
+        self._semaphore = None
+        self._embedder = None
+        self._searcher = None
+
+    def _embed_many(self, texts):
+        with span("service.embed_batch", texts=len(texts)):
+            return self.context.embeddings.embed_documents(texts)
+
+    def _search_many(self, items):
+        """items: (collection, vector, k, filter); one batch search per (collection, filter) at the largest k."""
+        results = [None] * len(items)
+        groups = {}
+        for i, (collection, _, _, metadata_filter) in enumerate(items):
+            key = (collection, json.dumps(metadata_filter, sort_keys=True))
+            groups.setdefault(key, []).append(i)
+        for (collection, _), indices in groups.items():
+            k_max = max(items[i][2] for i in indices)
+            lists = self.context.search_batch(collection, [items[i][1] for i in indices], k=k_max,
+                                              filter=items[indices[0]][3])
+            for i, docs in zip(indices, lists):
+                results[i] = docs[:items[i][2]]
+        return results
+
+    async def start(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        queue_size = self.max_concurrency + self.max_pending
+        self._embedder = MicroBatcher("embed", self._embed_many, self.batch_executor, self.window, self.max_batch,
+                                      queue_size)
+        self._searcher = MicroBatcher("search", self._search_many, self.batch_executor, self.window, self.max_batch,
+                                      queue_size)
+        self._embedder.start()
+        self._searcher.start()
+
+    async def stop(self):
+        await self._embedder.stop()
+        await self._searcher.stop()
+        self.executor.shutdown(wait=False)
+        self.batch_executor.shutdown(wait=False)
+
+    async def embed(self, text):
+        return await self._embedder.submit(text)
+
+    async def search(self, collection, vector, k, metadata_filter=None):
+        return await self._searcher.submit((collection, vector, k, metadata_filter))
+
+    async def _blocking(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def baseline(self, query, k, metadata_filter=None):
+        return await self.search(self.collection, await self.embed(query), k, metadata_filter)
+
+    async def parent_doc(self, query, k, metadata_filter=None):
+        children = await self.search(children_collection_name(self.collection), await self.embed(query), k * 4,
+                                     metadata_filter)
+        return await self._blocking(parents_of_children, self.context, children, k)
+
+    async def multi_query(self, query, k, metadata_filter=None):
+        """Fused multi-query: variants are embedded and searched through the shared micro-batches, then RRF."""
+        query_vector = await self.embed(query)
+        variants = await self._blocking(
+            generate_query_variants, self.context.llm, query, self.context.expansion_cache, query_vector
+        )
+        vectors = [query_vector] + list(await asyncio.gather(*(self.embed(v) for v in variants)))
+        result_lists = await asyncio.gather(*(self.search(self.collection, v, k, metadata_filter) for v in vectors))
+        return reciprocal_rank_fusion(result_lists, limit=k)
+
+    async def hybrid(self, query, k, metadata_filter=None):
+        """Dense search through the shared micro-batches and a BM25 lookup side by side, then RRF."""
+        n = max(k, HYBRID_CANDIDATES)
+        dense, sparse = await asyncio.gather(
+            self.baseline(query, n, metadata_filter),
+            self._blocking(lexical_search, self.context, self.collection, query, n, metadata_filter),
+        )
+        return reciprocal_rank_fusion([dense, sparse], limit=k)
+
+    async def handle_search(self, request):
+        query = request.get("query")
+        if not isinstance(query, str) or not query.strip():
+            return 400, {"error": "'query' must be a non-empty string"}
+        strategy = request.get("strategy", "baseline")
+        if strategy not in SERVICE_STRATEGIES:
+            return 400, {"error": f"unknown strategy '{strategy}'", "strategies": list(SERVICE_STRATEGIES)}
+        k = request.get("k", 3)
+        if isinstance(k, bool) or not isinstance(k, int) or k < 1:
+            return 400, {"error": "'k' must be an integer >= 1"}
+        metadata_filter = request.get("filter")
+        if metadata_filter is not None and not isinstance(metadata_filter, dict):
+            return 400, {"error": "'filter' must be an object of field -> value"}
+
+        # Backpressure: bounded waiting room in front of the concurrency limit
+        if self.admitted >= self.max_concurrency + self.max_pending:
+            self.rejected += 1
+            return 503, {"error": "overloaded, retry later"}
+        self.admitted += 1
+        self.requests += 1
+        start = time.perf_counter()
+        try:
+            async with self._semaphore:
+                docs = await getattr(self, strategy)(query, k, metadata_filter)
+        except ServiceOverloaded as e:
+            self.rejected += 1
+            return 503, {"error": str(e)}
+        finally:
+            self.admitted -= 1
+        return 200, {
+            "query": query,
+            "strategy": strategy,
+            "k": k,
+            "latency_ms": (time.perf_counter() - start) * 1000.0,
+            "results": [result_entry(d) for d in docs],
+        }
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "in_flight": self.admitted,
+            "embed": self._embedder.stats(),
+            "search": self._searcher.stats(),
+        }
+
+    async def route(self, method, path, body):
+        path = path.split("?", 1)[0]
+        if path == "/health":
+            return 200, {"status": "ok"}
+        if path == "/stats":
+            return 200, self.stats()
+        if path != "/search":
+            return 404, {"error": f"no route for {path}"}
+        if method != "POST":
+            return 405, {"error": "use POST"}
+        try:
+            request = json.loads(body or b"{}")
+        except json.JSONDecodeError as e:
+            return 400, {"error": f"invalid JSON: {e}"}
+        if not isinstance(request, dict):
+            return 400, {"error": "request body must be a JSON object"}
+        return await self.handle_search(request)
+
+    async def handle_connection(self, reader, writer):
+        """Minimal HTTP/1.1 with keep-alive; one request at a time per connection."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                    length = int(headers.get("content-length") or 0)
+                    if length > SERVICE_MAX_BODY_BYTES:
+                        # The body is left unread, so the connection can't be reused
+                        _write_response(writer, 413, {"error": f"request body over {SERVICE_MAX_BODY_BYTES} bytes"},
+                                        keep_alive=False)
+                        await writer.drain()
+                        break
+                    body = await reader.readexactly(length)
+                except ValueError:
+                    _write_response(writer, 400, {"error": "malformed request"}, keep_alive=False)
+                    break
+                try:
+                    status, payload = await self.route(method, path, body)
+                except Exception as e:
+                    status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+                keep_alive = headers.get("connection", "").lower() != "close"
+                _write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=None, port=None):
+        await self.start()
+        server = await asyncio.start_server(self.handle_connection, host or SERVICE_HOST, port or SERVICE_PORT)
+        address = server.sockets[0].getsockname()
+        print(f"🌐 Retrieval service on http://{address[0]}:{address[1]} "
+              f"(window {self.window * 1000:.1f}ms, batch ≤{self.max_batch}, "
+              f"{self.max_concurrency} concurrent + {self.max_pending} pending)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.stop()
+
+
+def _write_response(writer, status, payload, keep_alive=True):
+    body = json.dumps(payload, default=str).encode("utf-8")
+    headers = [
+        f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    if status == 503:
+        headers.append("Retry-After: 1")
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+
+
+def run_service(context, collection, host=None, port=None, **options):
+    """Blocking entry point: serve until interrupted."""
+    service = RetrievalService(context, collection, **options)
+    try:
+        asyncio.run(service.serve(host, port))
+    except KeyboardInterrupt:
+        print("\n👋 Service stopped")
@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pytest
+from qdrant_client import QdrantClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embedding_helper import stub_embed_batch  # noqa: E402
+from helpers import TEST_DIMS, make_records  # noqa: E402
+from qdrant_helper import ensure_collection  # noqa: E402
+from vector_artifact import write_vector_artifact  # noqa: E402
+
+
+@pytest.fixture
+def make_artifact(tmp_path):
+    """write(texts, name=..., source_file=..., model=...) -> artifact directory with stub vectors."""
+    def write(texts, name="data", source_file="doc.txt", model="stub-model"):
+        path = str(tmp_path / name)
+        records = make_records(texts, source_file)
+        write_vector_artifact(path, records, stub_embed_batch([r["text"] for r in records], dims=TEST_DIMS), model)
+        return path
+    return write
+
+
+@pytest.fixture
+def client():
+    """qdrant-client local mode with an empty "test" collection."""
+    client = QdrantClient(location=":memory:")
+    ensure_collection(client, "test", TEST_DIMS)
+    yield client
+    client.close()
+
+
+@pytest.fixture(scope="session")
+def offline_context(tmp_path_factory):
+    """my_doc.txt ingested with stub embeddings and searched by the in-process NumPy backend; stub LLM."""
+    from benchmark import build_offline_context
+
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    context = build_offline_context(os.path.join(repo, "my_doc.txt"), "demo_index",
+                                    workdir=str(tmp_path_factory.mktemp("offline")), backend="numpy")
+    yield context
+    context.close()
+
+
+@pytest.fixture(scope="session")
+def qdrant_offline_context(tmp_path_factory):
+    """Like offline_context, but searched through qdrant-client's in-process mode."""
+    from benchmark import build_offline_context
+
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    context = build_offline_context(os.path.join(repo, "my_doc.txt"), "demo_index",
+                                    workdir=str(tmp_path_factory.mktemp("offline_qdrant")), backend="qdrant")
+    yield context
+    context.close()
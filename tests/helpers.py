@@ -0,0 +1,14 @@
+from qdrant_helper import chunk_point_id, content_hash, extract_metadata_from_text
+
+TEST_DIMS = 8
+
+
+def make_records(texts, source_file="doc.txt"):
+    """Records shaped like generate_json_from_docs output: content-derived IDs and chunk_id = position."""
+    records = []
+    for chunk_id, text in enumerate(texts, 1):
+        metadata = extract_metadata_from_text(text, chunk_id, source_file)
+        metadata["content_hash"] = content_hash(text)
+        records.append({"id": chunk_point_id(source_file, metadata["content_hash"]), "text": text,
+                        "metadata": metadata})
+    return records
@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+from batch_queries import run_batch, run_query_record
+
+
+@pytest.mark.parametrize("context_name", ["qdrant_offline_context", "offline_context"])
+@pytest.mark.parametrize("strategy", ["baseline", "multi_query"])
+def test_results_carry_payload_fields_and_scores(request, context_name, strategy):
+    context = request.getfixturevalue(context_name)
+
+    entry = run_query_record(context, "demo_index", 1, {"query": "How do I set up Qdrant?"}, strategy=strategy, k=3)
+
+    assert "error" not in entry
+    assert len(entry["results"]) >= 3
+    for result in entry["results"]:
+        assert result["id"] is not None
+        assert result["score"] is not None
+        assert result["source_file"] is not None
+        assert result["chunk_id"] is not None
+
+
+def test_multi_query_results_are_unique_points(qdrant_offline_context):
+    entry = run_query_record(qdrant_offline_context, "demo_index", 1, {"query": "How do I set up Qdrant?"},
+                             strategy="multi_query", k=3)
+
+    ids = [result["id"] for result in entry["results"]]
+    assert len(ids) == len(set(ids))
+
+
+def test_batch_streams_one_line_per_query(tmp_path, qdrant_offline_context):
+    queries = tmp_path / "queries.jsonl"
+    queries.write_text('{"id": "a", "query": "What is chunk overlap?"}\n\nnot json\n', encoding="utf-8")
+    output = tmp_path / "results.jsonl"
+
+    summary = run_batch(qdrant_offline_context, "demo_index", str(queries), str(output), workers=2)
+
+    lines = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert summary["queries"] == 2 and summary["errors"] == 1
+    assert {line["line"] for line in lines} == {1, 3}
+    assert next(line for line in lines if line["line"] == 1)["results"][0]["source_file"]
@@ -0,0 +1,43 @@
+import time
+
+from benchmark import benchmark_strategy, print_benchmark_table, run_benchmark
+
+
+def flaky(fail_calls, delay=0.0):
+    """Strategy that raises on the given call numbers (0-based) and sleeps `delay` on the others."""
+    calls = []
+
+    def strategy(context, collection, query, k=3, filter=None):
+        calls.append(query)
+        if len(calls) - 1 in fail_calls:
+            raise RuntimeError("backend down")
+        time.sleep(delay)
+        return []
+    return strategy
+
+
+def test_failed_warmups_and_runs_are_counted_not_timed():
+    stats = benchmark_strategy(flaky({0, 4, 5}), None, "c", ["q1", "q2"], runs=6, warmup=2)
+
+    assert stats["warmup_errors"] == 1
+    assert stats["errors"] == 2
+    assert stats["runs"] == 4
+
+
+def test_failures_do_not_drag_the_percentiles_down():
+    stats = benchmark_strategy(flaky(set(range(2, 12)), delay=0.02), None, "c", ["q"], runs=12, warmup=0)
+
+    assert stats["runs"] == 2
+    assert stats["min_ms"] >= 20.0
+
+
+def test_a_strategy_that_always_fails_does_not_abort_the_benchmark(monkeypatch, capsys):
+    monkeypatch.setattr("benchmark.STRATEGIES", {"broken": flaky(set(range(100))), "ok": flaky(set())})
+
+    report = run_benchmark(None, "c", ["q"], runs=3, warmup=2)
+    print_benchmark_table(report)
+
+    broken = report["results"]["broken"]
+    assert (broken["runs"], broken["errors"], broken["warmup_errors"], broken["p50_ms"]) == (0, 3, 2, None)
+    assert report["results"]["ok"]["runs"] == 3
+    assert "every run failed" in capsys.readouterr().out
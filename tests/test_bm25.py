@@ -0,0 +1,69 @@
+import math
+import os
+
+import pytest
+
+from bm25_index import BM25Index, BM25IndexWriter, tokenize
+
+TEXTS = [
+    "Qdrant stores dense vectors for semantic search.",
+    "BM25 ranks chunks by exact term matches; BM25 needs no embeddings.",
+    "Reciprocal rank fusion merges the dense and BM25 result lists.",
+    "The parent document retriever returns whole sections.",
+    "Chunk overlap keeps sentences intact across chunk boundaries.",
+]
+
+
+def build(path, texts=TEXTS, spill_postings=None):
+    with BM25IndexWriter(str(path), spill_postings=spill_postings) as writer:
+        for i, text in enumerate(texts):
+            writer.add(f"id-{i}", text)
+    return BM25Index(str(path))
+
+
+def test_tokenize_drops_stopwords_single_characters_and_case():
+    assert tokenize("What is a BM25 index, and how does it work? x") == ["bm25", "index", "work"]
+
+
+def test_score_matches_bm25_formula(tmp_path):
+    index = build(tmp_path / "bm25")
+    doc_lens = [len(tokenize(t)) for t in TEXTS]
+    avgdl = sum(doc_lens) / len(doc_lens)
+    df = sum(1 for t in TEXTS if "bm25" in tokenize(t))
+    idf = math.log(1 + (len(TEXTS) - df + 0.5) / (df + 0.5))
+    tf = tokenize(TEXTS[1]).count("bm25")
+    expected = idf * tf * (index.k1 + 1) / (tf + index.k1 * (1 - index.b + index.b * doc_lens[1] / avgdl))
+
+    assert index.scores("bm25")[1] == pytest.approx(expected, rel=1e-5)
+
+
+def test_search_orders_by_score_and_skips_non_matching_documents(tmp_path):
+    index = build(tmp_path / "bm25")
+
+    hits = index.search("bm25 dense", k=10)
+
+    assert [point_id for point_id, _ in hits] == ["id-2", "id-1", "id-0"]
+    assert [score for _, score in hits] == sorted((score for _, score in hits), reverse=True)
+    assert index.search("bm25 dense", k=1) == hits[:1]
+    assert index.search("unrelated words") == []
+
+
+def test_spilled_runs_merge_into_the_same_index(tmp_path):
+    texts = TEXTS * 20
+    in_memory = build(tmp_path / "one_run", texts)
+    spilled = build(tmp_path / "spilled", texts, spill_postings=7)
+
+    assert list(spilled.vocab) == list(in_memory.vocab)
+    assert spilled.ids == in_memory.ids
+    assert list(spilled.offsets) == list(in_memory.offsets)
+    assert list(spilled.postings) == list(in_memory.postings)
+    assert list(spilled.tfs) == list(in_memory.tfs)
+    assert spilled.avgdl == in_memory.avgdl
+    assert not os.path.exists(tmp_path / "spilled" / "runs")
+
+
+def test_empty_index_searches_to_nothing(tmp_path):
+    index = build(tmp_path / "bm25", texts=[])
+
+    assert len(index) == 0
+    assert index.search("bm25") == []
@@ -0,0 +1,83 @@
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from embedding_cache import EmbeddingCache
+from retrievers.expansion_cache import ExpansionCache
+
+
+@pytest.fixture
+def write_locked(tmp_path):
+    """lock() holds the write lock on a cache file from another connection until the test ends."""
+    conns = []
+
+    def lock(path):
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.execute("BEGIN IMMEDIATE")
+        conns.append(conn)
+
+    yield lock
+    for conn in conns:
+        conn.execute("ROLLBACK")
+        conn.close()
+
+
+def in_thread(fn):
+    """fn() in a fresh thread (so it opens its own connection), failing if it waits on a lock."""
+    with ThreadPoolExecutor(1) as pool:
+        return pool.submit(fn).result(timeout=5)
+
+
+def count_statements(cache, prefix):
+    statements = []
+    cache._connection().set_trace_callback(statements.append)
+    return lambda: sum(1 for s in statements if s.startswith(prefix))
+
+
+def test_embedding_lookups_do_not_wait_for_the_write_lock(tmp_path, write_locked):
+    path = str(tmp_path / "cache.sqlite")
+    cache = EmbeddingCache(path)
+    cache.put_many("m", ["cached"], [[1.0, 2.0]])
+    write_locked(path)
+
+    assert in_thread(lambda: cache.get_many("m", ["cached", "missing"])) == [[1.0, 2.0], None]
+
+
+def test_expansion_lookups_do_not_wait_for_the_write_lock(tmp_path, write_locked):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ExpansionCache(path)
+    cache.store("llama3", "prompt {question}", "What is RAG?", ["v1"])
+    write_locked(path)
+
+    assert in_thread(lambda: cache.lookup("llama3", "prompt {question}", "What is RAG?")) == ["v1"]
+
+
+def test_size_cap_is_checked_every_interval_not_every_put(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=1000)   # check every 10 inserts
+    counts = count_statements(cache, "SELECT COUNT(*)")
+
+    for i in range(25):
+        cache.put_many("m", [f"text {i}"], [[float(i)]])
+
+    assert counts() == 2
+
+
+def test_cap_keeps_recently_hit_entries(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=3)
+    cache.put_many("m", ["a", "b", "c"], [[1.0], [2.0], [3.0]])
+    cache.get_many("m", ["a"])
+    cache.put_many("m", ["d"], [[4.0]])
+
+    assert cache.get_many("m", ["a", "b", "c", "d"]) == [[1.0], None, [3.0], [4.0]]
+    assert cache.stats()["entries"] == 3
+
+
+def test_expansion_store_checks_the_cap_every_interval(tmp_path):
+    cache = ExpansionCache(str(tmp_path / "cache.sqlite"), max_entries=500)   # check every 5 stores
+    counts = count_statements(cache, "SELECT COUNT(*)")
+
+    for i in range(12):
+        cache.store("llama3", "prompt {question}", f"question {i}", [f"v{i}"])
+
+    assert counts() == 2
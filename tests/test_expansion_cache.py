@@ -0,0 +1,81 @@
+import numpy as np
+
+from benchmark import StubChatModel
+from embedding_helper import StubEmbeddings
+from retrievers.context import RetrievalContext
+from retrievers.expansion_cache import ExpansionCache
+from retrievers.strategies import STRATEGIES
+
+PROMPT = "Generate variants of: {question}"
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_paraphrase_reuses_variants_above_threshold(tmp_path):
+    cache = ExpansionCache(str(tmp_path / "cache.sqlite"), similarity_threshold=0.95)
+    cache.store("llama3", PROMPT, "How do I set up Qdrant?", ["v1", "v2"], unit(1, 0, 0))
+
+    assert cache.lookup("llama3", PROMPT, "Qdrant setup steps?", unit(1, 0.1, 0)) == ["v1", "v2"]
+    assert cache.lookup("llama3", PROMPT, "Unrelated question", unit(0, 1, 0)) is None
+    assert cache.stats()["similar_hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_similarity_lookups_read_sqlite_vectors_once(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    ExpansionCache(path).store("llama3", PROMPT, "How do I set up Qdrant?", ["v1"], unit(1, 0, 0))
+    cache = ExpansionCache(path, similarity_threshold=0.95)
+
+    for _ in range(3):
+        assert cache.lookup("llama3", PROMPT, "something else", unit(0, 0, 1)) is None
+    cache.store("llama3", PROMPT, "What is BM25?", ["b1"], unit(0, 0, 1))
+
+    assert len(cache._indexes) == 1
+    assert cache.lookup("llama3", PROMPT, "Explain BM25", unit(0, 0.1, 1)) == ["b1"]
+
+
+def test_other_models_entries_are_kept_but_never_returned(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    first = ExpansionCache(path)
+    second = ExpansionCache(path)
+    first.store("llama3", PROMPT, "What is RAG?", ["llama variant"])
+    second.store("mistral", PROMPT, "What is RAG?", ["mistral variant"])
+
+    assert first.lookup("llama3", PROMPT, "What is RAG?") == ["llama variant"]
+    assert second.lookup("mistral", PROMPT, "What is RAG?") == ["mistral variant"]
+    assert first.lookup("llama3", "another prompt {question}", "What is RAG?") is None
+
+
+def test_lru_eviction_also_drops_in_memory_vectors(tmp_path):
+    cache = ExpansionCache(str(tmp_path / "cache.sqlite"), max_entries=2, similarity_threshold=0.95)
+    cache.store("llama3", PROMPT, "first", ["a"], unit(1, 0, 0))
+    assert cache.lookup("llama3", PROMPT, "first?", unit(1, 0, 0)) == ["a"]
+    cache.store("llama3", PROMPT, "second", ["b"], unit(0, 1, 0))
+    cache.store("llama3", PROMPT, "third", ["c"], unit(0, 0, 1))
+
+    assert cache.lookup("llama3", PROMPT, "first again", unit(1, 0, 0)) is None
+    assert cache.lookup("llama3", PROMPT, "third again", unit(0, 0, 1)) == ["c"]
+
+
+class ParaphraseEmbeddings(StubEmbeddings):
+    """Stub embeddings that map a paraphrase onto the vector of the question it rephrases."""
+
+    def embed_query(self, text):
+        return super().embed_query(PARAPHRASES.get(text, text))
+
+
+PARAPHRASES = {"Steps to get Qdrant running?": "How do I set up Qdrant?"}
+
+
+def test_langchain_multi_query_reuses_variants_for_a_paraphrase(tmp_path, offline_context):
+    cache = ExpansionCache(str(tmp_path / "cache.sqlite"), similarity_threshold=0.95)
+    context = RetrievalContext(backend="numpy", data_paths=offline_context.data_paths,
+                               embeddings=ParaphraseEmbeddings(), llm=StubChatModel(), expansion_cache=cache)
+
+    first = STRATEGIES["multi_query"](context, "demo_index", "How do I set up Qdrant?", k=3)
+    second = STRATEGIES["multi_query"](context, "demo_index", "Steps to get Qdrant running?", k=3)
+
+    assert cache.stats() == {"hits": 0, "similar_hits": 1, "misses": 1, "hit_rate": 0.5}
+    assert [d.metadata["_id"] for d in second] == [d.metadata["_id"] for d in first]
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from langchain_core.documents import Document
+
+from benchmark import compare_recall
+from retrievers.fusion import RRF_K, document_key, reciprocal_rank_fusion
+from retrievers.strategies import STRATEGIES
+from service import RetrievalService
+
+
+def docs(*ids):
+    return [Document(page_content=f"text {i}", metadata={"_id": i}) for i in ids]
+
+
+def test_rrf_scores_are_summed_reciprocal_ranks():
+    fused = reciprocal_rank_fusion([docs("a", "b", "c"), docs("b", "d")])
+
+    assert [document_key(d) for d in fused] == ["b", "a", "d", "c"]
+    assert fused[0].metadata["_rrf_score"] == pytest.approx(1 / (RRF_K + 2) + 1 / (RRF_K + 1))
+    assert fused[1].metadata["_rrf_score"] == pytest.approx(1 / (RRF_K + 1))
+
+
+def test_rrf_limit_keeps_the_top_results():
+    fused = reciprocal_rank_fusion([docs("a", "b", "c"), docs("c", "b", "a"), docs("b")], limit=2)
+
+    assert [document_key(d) for d in fused] == ["b", "a"]
+
+
+def test_document_key_falls_back_to_text():
+    first = [Document(page_content="same chunk"), Document(page_content="other")]
+    second = [Document(page_content="same chunk")]
+
+    fused = reciprocal_rank_fusion([first, second])
+
+    assert [d.page_content for d in fused] == ["same chunk", "other"]
+
+
+@pytest.mark.parametrize("k", [1, 2, 5])
+def test_fused_multi_query_returns_k_results(offline_context, k):
+    results = STRATEGIES["multi_query_fused"](offline_context, "demo_index", "How do I set up Qdrant?", k=k)
+
+    assert len(results) == k
+
+
+def test_service_multi_query_returns_k_results(offline_context):
+    async def search():
+        service = RetrievalService(offline_context, "demo_index")
+        await service.start()
+        try:
+            return await service.handle_search({"query": "How do I set up Qdrant?", "strategy": "multi_query", "k": 2})
+        finally:
+            await service.stop()
+
+    status, body = asyncio.run(search())
+
+    assert status == 200
+    assert len(body["results"]) == 2
+
+
+def test_compare_recall_counts_only_each_strategys_top_k(offline_context):
+    queries = ["How do I set up Qdrant?", "What is chunk overlap?"]
+
+    report = compare_recall(offline_context, "demo_index", queries, ["hybrid", "multi_query_fused"], k=2)
+
+    rows = {row["strategy"]: row for row in report["results"]}
+    assert rows["multi_query"]["overlap@2"] == 1.0
+    assert all(row["novel"] <= 2 for row in rows.values())
@@ -0,0 +1,59 @@
+import random
+
+from embedding_helper import stub_embed_batch
+from helpers import TEST_DIMS
+from ingest_pipeline import run_ingest_pipeline
+from qdrant_helper import INGEST_SEGMENT_CHARS, generate_json_from_docs
+from vector_artifact import iter_records
+
+WORDS = ("qdrant vector chunk embedding retrieval parent neighbor query variant fusion index payload filter "
+         "batch segment splitter overlap metadata cache latency recall").split()
+
+
+def embed(texts, model=None):
+    return stub_embed_batch(texts, dims=TEST_DIMS)
+
+
+def write_corpus(path, chars, seed=0):
+    """Unique paragraphs of random words, some longer than a chunk, until `chars` is reached."""
+    rng = random.Random(seed)
+    paragraphs = []
+    size = 0
+    while size < chars:
+        sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 18))).capitalize() + "."
+                     for _ in range(rng.randint(1, 12))]
+        paragraph = f"{len(paragraphs)}. " + " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    path.write_text("\n\n".join(paragraphs) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def ids_and_chunk_ids(data_path):
+    return [(r["id"], r["metadata"]["chunk_id"], r["text"]) for r in iter_records(data_path)]
+
+
+def test_pipeline_and_generate_json_produce_identical_records_across_segments(tmp_path):
+    source = write_corpus(tmp_path / "big.txt", int(INGEST_SEGMENT_CHARS * 1.6))
+
+    generate_json_from_docs(source, str(tmp_path / "single"), embed_fn=embed, cache=False)
+    run_ingest_pipeline([source], str(tmp_path / "pipeline"), embed_fn=embed, cache=False, split_workers=2,
+                        progress_interval=0)
+
+    single = ids_and_chunk_ids(str(tmp_path / "single"))
+    assert len(single) > 500
+    assert ids_and_chunk_ids(str(tmp_path / "pipeline")) == single
+
+
+def test_pipeline_reingest_deletes_points_it_no_longer_produces(tmp_path, client):
+    source = tmp_path / "doc.txt"
+    write_corpus(source, 20_000, seed=1)
+    options = {"embed_fn": embed, "cache": False, "split_workers": 1, "upsert_parallel": 1, "progress_interval": 0}
+    run_ingest_pipeline([str(source)], str(tmp_path / "v1"), client, "test", **options)
+
+    write_corpus(source, 12_000, seed=2)
+    summary = run_ingest_pipeline([str(source)], str(tmp_path / "v2"), client, "test", **options)
+
+    points, _ = client.scroll("test", limit=10_000)
+    assert {str(p.id) for p in points} == {r[0] for r in ids_and_chunk_ids(str(tmp_path / "v2"))}
+    assert summary["stale_deleted"] > 0
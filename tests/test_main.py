@@ -0,0 +1,14 @@
+import os
+import subprocess
+import sys
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def test_missing_document_exits_with_a_clear_error(tmp_path):
+    result = subprocess.run([sys.executable, MAIN], cwd=tmp_path, capture_output=True, text=True, timeout=60)
+
+    assert result.returncode == 1
+    assert "my_doc.txt not found" in result.stderr
+    assert "Traceback" not in result.stderr
+    assert not (tmp_path / "data").exists()
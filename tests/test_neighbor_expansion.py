@@ -0,0 +1,38 @@
+from langchain_core.documents import Document
+
+from retrievers.neighbor_expansion import merge_windows, strip_overlap
+
+
+def hit(source, chunk_id):
+    return Document(page_content=f"{source}#{chunk_id}", metadata={"source_file": source, "chunk_id": chunk_id})
+
+
+def ranges(merged):
+    return [(source, lo, hi, [h.metadata["chunk_id"] for h in hits]) for source, lo, hi, hits in merged]
+
+
+def test_overlapping_and_touching_windows_merge():
+    merged = merge_windows([hit("a", 10), hit("a", 5), hit("a", 7)], window=1)
+
+    assert ranges(merged) == [("a", 4, 11, [10, 5, 7])]
+
+
+def test_ranges_follow_best_hit_rank_and_keep_files_apart():
+    merged = merge_windows([hit("b", 20), hit("a", 3), hit("b", 2), hit("a", 4)], window=1)
+
+    assert ranges(merged) == [("b", 19, 21, [20]), ("a", 2, 5, [3, 4]), ("b", 1, 3, [2])]
+
+
+def test_windows_start_at_chunk_one_and_skip_hits_without_position():
+    merged = merge_windows([hit("a", 1), Document(page_content="no metadata")], window=2)
+
+    assert ranges(merged) == [("a", 1, 3, [1])]
+
+
+def test_strip_overlap_drops_repeated_splitter_overlap():
+    assert strip_overlap("The quick brown fox", "brown fox jumps") == "The quick brown fox jumps"
+
+
+def test_strip_overlap_ignores_short_coincidental_matches():
+    assert strip_overlap("ends with a", "a new start") == "ends with a\na new start"
+    assert strip_overlap("abc", "xyz") == "abc\nxyz"
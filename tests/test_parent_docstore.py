@@ -0,0 +1,55 @@
+import os
+
+from embedding_helper import stub_embed_batch
+from qdrant_helper import generate_parent_child_docs, open_parent_docstore
+
+# ~1500 chars: one section per 2000-char parent
+SECTION = "Section {n}. " + "Parent documents give the LLM long context around a matched child chunk. " * 20
+
+
+def ingest(path, tmp_path, text, name):
+    source = tmp_path / name
+    source.write_text(text, encoding="utf-8")
+    generate_parent_child_docs(str(source), str(tmp_path / f"children_{name}"), path,
+                               embed_fn=stub_embed_batch, cache=False, clean=False)
+    return str(source)
+
+
+def parents_by_source(docstore):
+    keys = list(docstore.yield_keys())
+    by_source = {}
+    for doc in docstore.mget(keys):
+        by_source.setdefault(doc.metadata["source_file"], set()).add(doc.metadata["parent_id"])
+    return by_source
+
+
+def test_reingest_replaces_only_that_files_parents(tmp_path, monkeypatch):
+    path = str(tmp_path / "docstore")
+    a = ingest(path, tmp_path, "\n\n".join(SECTION.format(n=n) for n in range(4)), "a.txt")
+    b = ingest(path, tmp_path, "\n\n".join(SECTION.format(n=n) for n in range(10, 13)), "b.txt")
+    docstore = open_parent_docstore(path)
+    before = parents_by_source(docstore)
+
+    # With per-source lists the re-ingest must not scan the whole docstore
+    monkeypatch.setattr(type(docstore.store), "yield_keys", lambda *a, **kw: iter(()))
+    ingest(path, tmp_path, "\n\n".join(SECTION.format(n=n) for n in (0, 7)), "a.txt")
+    monkeypatch.undo()
+
+    after = parents_by_source(open_parent_docstore(path))
+    assert after[b] == before[b]
+    assert len(before[a]) == 4 and len(after[a]) == 2
+    assert len(after[a] & before[a]) == 1   # section 0 kept its ID, sections 1-3 deleted
+    assert os.path.isdir(path + ".sources")
+
+
+def test_docstore_without_source_lists_is_cleaned_by_one_scan(tmp_path):
+    path = str(tmp_path / "docstore")
+    a = ingest(path, tmp_path, "\n\n".join(SECTION.format(n=n) for n in range(3)), "a.txt")
+    for name in os.listdir(path + ".sources"):
+        os.remove(os.path.join(path + ".sources", name))
+
+    ingest(path, tmp_path, SECTION.format(n=5), "a.txt")
+
+    after = parents_by_source(open_parent_docstore(path))
+    assert set(after) == {a}
+    assert [doc.page_content[:10] for doc in open_parent_docstore(path).mget(sorted(after[a]))] == ["Section 5."]
@@ -0,0 +1,114 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import embedding_cache
+from embedding_cache import QueryEmbeddingCache, get_query_embeddings
+from embedding_helper import StubEmbeddings
+from helpers import TEST_DIMS
+
+
+class CountingEmbeddings(StubEmbeddings):
+    """StubEmbeddings that records every text it is asked to embed."""
+
+    def __init__(self, latency=0.0):
+        super().__init__(dims=TEST_DIMS, latency=latency)
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.extend(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls.append(text)
+        return super().embed_query(text)
+
+
+def test_repeated_queries_embed_once():
+    inner = CountingEmbeddings()
+    cache = QueryEmbeddingCache(inner)
+
+    first = cache.embed_query("What is RAG?")
+    assert cache.embed_query("What is RAG?") == first
+    vectors = cache.embed_documents(["What is RAG?", "chunking", "chunking"])
+
+    assert vectors[0] == first and vectors[1] == vectors[2]
+    assert inner.calls == ["What is RAG?", "chunking"]
+    assert cache.stats() == {"hits": 3, "misses": 2, "coalesced": 0, "hit_rate": 0.6, "size": 2}
+
+
+def test_least_recently_used_query_is_evicted():
+    inner = CountingEmbeddings()
+    cache = QueryEmbeddingCache(inner, max_size=2)
+
+    cache.embed_query("a")
+    cache.embed_query("b")
+    cache.embed_query("a")
+    cache.embed_query("c")
+    cache.embed_query("a")
+    cache.embed_query("b")
+
+    assert inner.calls == ["a", "b", "c", "b"]
+    assert cache.stats()["size"] == 2
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(embedding_cache.time, "monotonic", lambda: now[0])
+    inner = CountingEmbeddings()
+    cache = QueryEmbeddingCache(inner, ttl=10)
+
+    cache.embed_query("What is RAG?")
+    now[0] += 5
+    cache.embed_query("What is RAG?")
+    now[0] += 11
+    cache.embed_query("What is RAG?")
+
+    assert inner.calls == ["What is RAG?", "What is RAG?"]
+
+
+def test_concurrent_identical_queries_are_coalesced():
+    inner = CountingEmbeddings(latency=0.2)
+    cache = QueryEmbeddingCache(inner)
+
+    with ThreadPoolExecutor(8) as pool:
+        vectors = list(pool.map(lambda _: cache.embed_query("What is RAG?"), range(8)))
+
+    assert inner.calls == ["What is RAG?"]
+    assert all(v == vectors[0] for v in vectors)
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hits"] + cache.stats()["coalesced"] == 7
+
+
+def test_failed_embedding_is_not_cached_and_reaches_waiters():
+    release = threading.Event()
+
+    class FailingEmbeddings(CountingEmbeddings):
+        def embed_query(self, text):
+            self.calls.append(text)
+            release.wait(5)
+            raise ConnectionError("embedding server down")
+
+    cache = QueryEmbeddingCache(FailingEmbeddings())
+    with ThreadPoolExecutor(2) as pool:
+        first = pool.submit(cache.embed_query, "What is RAG?")
+        while not cache._inflight:
+            pass
+        second = pool.submit(cache.embed_query, "What is RAG?")
+        release.set()
+        for future in (first, second):
+            with pytest.raises(ConnectionError):
+                future.result(timeout=5)
+
+    assert cache.stats()["size"] == 0
+    assert not cache._inflight
+
+
+def test_get_query_embeddings_shares_one_instance_per_model(monkeypatch):
+    monkeypatch.setattr(embedding_cache, "_query_embeddings", {})
+    monkeypatch.setattr(embedding_cache, "get_embedding_cache", lambda: None)
+
+    assert get_query_embeddings("m1") is get_query_embeddings("m1")
+    assert get_query_embeddings("m1") is not get_query_embeddings("m2")
+    assert isinstance(get_query_embeddings("m1"), QueryEmbeddingCache)
@@ -0,0 +1,60 @@
+import asyncio
+import json
+
+import pytest
+
+from service import SERVICE_MAX_BODY_BYTES, RetrievalService
+
+
+def run(service, coroutine_fn):
+    async def main():
+        await service.start()
+        try:
+            return await coroutine_fn()
+        finally:
+            await service.stop()
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("k", [0, -1, 2.5, "3", True, None])
+def test_invalid_k_is_a_bad_request(offline_context, k):
+    service = RetrievalService(offline_context, "demo_index")
+
+    status, body = run(service, lambda: service.handle_search({"query": "What is RAG?", "k": k}))
+
+    assert status == 400
+    assert "'k'" in body["error"]
+
+
+async def http_request(service, raw):
+    server = await asyncio.start_server(service.handle_connection, "127.0.0.1", 0)
+    async with server:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(raw)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body)
+
+
+def test_oversized_body_is_refused_before_it_is_read(offline_context):
+    service = RetrievalService(offline_context, "demo_index")
+    raw = (f"POST /search HTTP/1.1\r\nContent-Length: {SERVICE_MAX_BODY_BYTES + 1}\r\n\r\n").encode("latin-1")
+
+    status, body = run(service, lambda: http_request(service, raw))
+
+    assert status == 413
+    assert "body" in body["error"]
+
+
+def test_search_over_http_still_works(offline_context):
+    service = RetrievalService(offline_context, "demo_index")
+    payload = json.dumps({"query": "What is RAG?", "k": 2}).encode("utf-8")
+    raw = (f"POST /search HTTP/1.1\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n\r\n"
+           .encode("latin-1") + payload)
+
+    status, body = run(service, lambda: http_request(service, raw))
+
+    assert status == 200
+    assert len(body["results"]) == 2
@@ -0,0 +1,85 @@
+import pytest
+
+from embedding_helper import stub_embed_batch
+from helpers import TEST_DIMS, make_records
+from qdrant_helper import EMBED_MODEL_FIELD, setup_qdrant, sync_qdrant
+from vector_artifact import write_vector_artifact
+
+ORIGINAL = [
+    "Qdrant stores vectors with payloads.",
+    "Chunks are embedded in batches.",
+    "Neighbor expansion widens hits to adjacent chunks.",
+    "The parent docstore holds long context.",
+]
+# Second chunk edited, third removed, a new one appended; the last one shifts from chunk_id 4 to 3
+EDITED = [
+    "Qdrant stores vectors with payloads.",
+    "Chunks are embedded in concurrent batches.",
+    "The parent docstore holds long context.",
+    "Hybrid search fuses BM25 with dense results.",
+]
+
+
+def point_ids(client, collection="test"):
+    points, _ = client.scroll(collection_name=collection, limit=100, with_payload=True)
+    return {str(p.id): p.payload for p in points}
+
+
+def test_setup_qdrant_deletes_chunks_that_are_no_longer_produced(client, make_artifact):
+    setup_qdrant(None, None, "test", make_artifact(ORIGINAL, "v1"), client=client, parallel=1)
+    setup_qdrant(None, None, "test", make_artifact(EDITED, "v2"), client=client, parallel=1)
+
+    payloads = point_ids(client)
+    assert set(payloads) == {r["id"] for r in make_records(EDITED)}
+    assert sorted(p["chunk_id"] for p in payloads.values()) == [1, 2, 3, 4]
+
+
+def test_setup_qdrant_leaves_other_source_files_alone(client, make_artifact):
+    setup_qdrant(None, None, "test", make_artifact(ORIGINAL, "a", source_file="a.txt"), client=client, parallel=1)
+    setup_qdrant(None, None, "test", make_artifact(EDITED, "b", source_file="b.txt"), client=client, parallel=1)
+
+    assert client.count("test").count == len(ORIGINAL) + len(EDITED)
+
+
+def test_sync_diff_upserts_relabels_and_deletes(client, make_artifact, capsys):
+    setup_qdrant(None, None, "test", make_artifact(ORIGINAL, "v1"), client=client, parallel=1)
+    before = point_ids(client)
+    capsys.readouterr()
+
+    sync_qdrant(None, None, "test", make_artifact(EDITED, "v2"), client=client, parallel=1)
+
+    assert "2 new/changed (0 from another model), 1 payload-only, 2 stale, 1 unchanged" in capsys.readouterr().out
+    after = point_ids(client)
+    assert set(after) == {r["id"] for r in make_records(EDITED)}
+    moved = make_records(EDITED)[2]["id"]
+    assert before[moved]["chunk_id"] == 4 and after[moved]["chunk_id"] == 3
+
+
+def test_sync_reembeds_unchanged_text_after_model_switch(client, make_artifact, capsys):
+    setup_qdrant(None, None, "test", make_artifact(ORIGINAL, "v1", model="model-a"), client=client, parallel=1)
+    capsys.readouterr()
+
+    sync_qdrant(None, None, "test", make_artifact(ORIGINAL, "v2", model="model-b"), client=client, parallel=1)
+
+    assert "4 new/changed (4 from another model), 0 payload-only, 0 stale, 0 unchanged" in capsys.readouterr().out
+    assert {p[EMBED_MODEL_FIELD] for p in point_ids(client).values()} == {"model-b"}
+
+
+def test_sync_of_identical_data_is_a_no_op(client, make_artifact, capsys):
+    path = make_artifact(ORIGINAL)
+    setup_qdrant(None, None, "test", path, client=client, parallel=1)
+    capsys.readouterr()
+
+    sync_qdrant(None, None, "test", path, client=client, parallel=1)
+
+    assert "0 new/changed (0 from another model), 0 payload-only, 0 stale, 4 unchanged" in capsys.readouterr().out
+
+
+def test_sync_rejects_data_with_another_vector_size(client, tmp_path):
+    path = str(tmp_path / "wide")
+    records = make_records(ORIGINAL)
+    write_vector_artifact(path, records, stub_embed_batch(ORIGINAL, dims=TEST_DIMS * 2), "wider-model")
+
+    with pytest.raises(ValueError, match="embedding model changed"):
+        sync_qdrant(None, None, "test", path, client=client, parallel=1)
+    assert client.count("test").count == 0
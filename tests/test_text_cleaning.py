@@ -0,0 +1,139 @@
+import json
+import os
+
+import pytest
+
+from embedding_helper import stub_embed_batch
+from helpers import TEST_DIMS
+from qdrant_helper import generate_json_from_docs
+from text_cleaning import BoilerplateFilter, CorpusCleaner, NearDuplicateIndex
+from vector_artifact import iter_records
+
+MY_DOC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "my_doc.txt")
+
+
+def embed(texts, model=None):
+    return stub_embed_batch(texts, dims=TEST_DIMS)
+
+
+def my_doc_line(number):
+    with open(MY_DOC, "r", encoding="utf-8") as f:
+        return f.read().splitlines()[number - 1]
+
+
+@pytest.mark.parametrize("number", [1, 3, 5, 32, 563])
+def test_site_chrome_in_my_doc_is_stripped(number):
+    assert BoilerplateFilter().reason(my_doc_line(number)) == "site_chrome"
+
+
+@pytest.mark.parametrize("number", [7, 9, 11, 17, 45, 51, 106, 294, 455, 565, 567, 590, 629])
+def test_content_lines_in_my_doc_are_kept(number):
+    assert BoilerplateFilter().reason(my_doc_line(number)) is None
+
+
+@pytest.mark.parametrize("line", [
+    "We use cookies. Manage preferences | Accept",
+    "Advertisement",
+    "Sponsored content",
+    "Home > Docs > Retrieval",
+    "Blog • Docs • Pricing • About",
+    "[Home](/) | [Docs](/docs) | [Blog](/blog) | [Contact](/contact)",
+    "Share on: Facebook | Twitter | LinkedIn",
+    "Subscribe to our newsletter",
+    "© 2024 Acme Inc. All rights reserved.",
+    "Privacy Policy | Terms of Service",
+])
+def test_site_chrome_is_stripped(line):
+    assert BoilerplateFilter().reason(line) == "site_chrome"
+
+
+@pytest.mark.parametrize("line", [
+    "HOW TO BUILD RAG SYSTEMS",
+    "Copyright law affects training data usage.",
+    "Our app uses cookies to store the session token.",
+    "Sponsored content is filtered out before indexing.",
+    "Advertisement revenue funds most of the public datasets.",
+    "Home directories are mounted read-only in the container.",
+    "See [the docs](https://example.com/docs) for the full list of retriever options and their defaults.",
+    "Alice • Bob • Carol went to the store",
+    "Step 1 • Step 2 • Step 3",
+    "Terms of the contract | Home loans | About rates",
+])
+def test_prose_that_looks_like_chrome_is_kept(line):
+    assert BoilerplateFilter().reason(line) is None
+
+
+def test_my_doc_chunks_carry_no_site_chrome(tmp_path):
+    data_path = str(tmp_path / "data")
+    generate_json_from_docs(MY_DOC, data_path, embed_fn=embed, cache=False)
+    text = "\n".join(r["text"] for r in iter_records(data_path))
+
+    for number in (1, 5, 32, 563):
+        assert my_doc_line(number) not in text
+    assert my_doc_line(45) in text
+
+
+def observed(texts):
+    boilerplate = BoilerplateFilter(min_repeats=3)
+    for text in texts:
+        boilerplate.observe(text)
+    return boilerplate
+
+
+def test_repeated_footer_is_stripped_but_repeated_code_is_kept():
+    page = "Acme Docs - the retrieval handbook\nimport numpy as np\n{body}\n"
+    boilerplate = observed([page.format(body=f"Unique paragraph number {i} about chunking.") for i in range(3)])
+
+    text, removed = boilerplate.strip(page.format(body="Another unique paragraph about embeddings."))
+
+    assert removed == [("Acme Docs - the retrieval handbook", "repeated")]
+    assert "import numpy as np" in text
+
+
+def test_lines_inside_code_fences_are_kept():
+    page = "Acme Docs - the retrieval handbook\n```\nresults = retriever.invoke(query)\n```\n{body}\n"
+    boilerplate = observed([page.format(body=f"Unique paragraph number {i} about chunking.") for i in range(3)])
+
+    text, removed = boilerplate.strip(page.format(body="Another unique paragraph about embeddings."))
+
+    assert [reason for _, reason in removed] == ["repeated"]
+    assert "results = retriever.invoke(query)" in text
+
+
+def paragraph(i):
+    return f"Paragraph {i} talks about " + " ".join(f"topic{i}x{j}" for j in range(30))
+
+
+def test_near_duplicate_index_keeps_only_the_latest_chunks():
+    index = NearDuplicateIndex(max_chunks=3)
+    for i in range(10):
+        assert index.check_and_add(f"k{i}", paragraph(i)) is None
+
+    assert len(index) == 3
+    assert sum(len(rows) for band in index._buckets for rows in band.values()) == 3 * index.bands
+    assert index.check_and_add("copy9", paragraph(9)) == ("k9", 1.0)
+    assert index.check_and_add("copy0", paragraph(0)) is None
+
+
+def test_line_counts_stay_capped_and_still_find_repeated_lines():
+    boilerplate = BoilerplateFilter(min_repeats=3, max_lines=10)
+    for i in range(100):
+        boilerplate.observe(f"Unique line number {i} of the corpus\nAcme Docs - the retrieval handbook\n")
+
+    assert len(boilerplate.counts) <= 10
+    assert boilerplate.reason("Acme Docs - the retrieval handbook") == "repeated"
+
+
+def test_dropped_chunks_are_spooled_into_the_log(tmp_path):
+    cleaner = CorpusCleaner()
+    assert cleaner.keep_chunk("a", paragraph(1), "doc.txt")
+    assert not cleaner.keep_chunk("b", paragraph(1), "doc.txt")
+    cleaner.record_lines([("Skip to main content", "site_chrome")])
+
+    log = tmp_path / "removed.jsonl"
+    cleaner.write_log(str(log))
+    entries = [json.loads(line) for line in log.read_text(encoding="utf-8").splitlines()]
+
+    assert cleaner.chunks_removed == 1
+    assert [e["kind"] for e in entries] == ["boilerplate", "near_duplicate"]
+    assert entries[1]["duplicate_of"] == "a"
@@ -0,0 +1,114 @@
+import json
+import threading
+
+import pytest
+
+import tracing
+from embedding_cache import CachedEmbeddings, EmbeddingCache, QueryEmbeddingCache
+from embedding_helper import StubEmbeddings
+from helpers import TEST_DIMS
+from qdrant_helper import upload_points
+
+TEXTS = [f"Chunk number {i} about vector search and retrieval." for i in range(10)]
+
+
+@pytest.fixture
+def traced():
+    """Tracing on with empty span/metric stores; switched back off after the test."""
+    tracing.reset()
+    tracing.enable_tracing()
+    yield
+    tracing.disable_tracing()
+    tracing.reset()
+
+
+def counters():
+    return dict(tracing._counters)
+
+
+def test_nested_spans_record_parents_and_histograms(traced):
+    with tracing.span("outer") as outer:
+        with tracing.span("inner", n=1) as inner:
+            inner.set(found=2)
+
+    spans = {s.name: s for s in tracing._spans}
+    assert spans["inner"].parent_id == outer.span_id
+    assert spans["outer"].parent_id is None
+    assert spans["inner"].attrs == {"n": 1, "found": 2}
+    assert tracing.stage_summary()["inner"]["count"] == 1
+
+
+def test_bound_functions_keep_the_parent_span_on_worker_threads(traced):
+    def work():
+        with tracing.span("child"):
+            pass
+
+    with tracing.span("parent") as parent:
+        thread = threading.Thread(target=tracing.bind_context(work))
+        thread.start()
+        thread.join()
+
+    child = next(s for s in tracing._spans if s.name == "child")
+    assert child.parent_id == parent.span_id
+
+
+def test_failed_span_records_the_error(traced):
+    with pytest.raises(ValueError):
+        with tracing.span("fails"):
+            raise ValueError("boom")
+
+    assert tracing._spans[0].attrs["error"] == "ValueError"
+
+
+def test_disabled_tracing_records_nothing():
+    tracing.reset()
+    tracing.disable_tracing()
+
+    with tracing.span("ignored"):
+        tracing.count("ignored")
+
+    assert tracing._spans == []
+    assert counters() == {}
+
+
+def test_upload_counts_upserted_points_under_the_upload_span(traced, client, make_artifact, tmp_path):
+    path = make_artifact(TEXTS)
+
+    uploaded = upload_points(client, "test", path, batch_size=3, parallel=2,
+                             checkpoint_path=str(tmp_path / "upload.checkpoint.json"))
+
+    upload = next(s for s in tracing._spans if s.name == "qdrant.upload")
+    upserts = [s for s in tracing._spans if s.name == "qdrant.upsert"]
+    assert uploaded == 10
+    assert counters()["points_upserted"] == 10
+    assert len(upserts) == 4
+    assert all(s.parent_id == upload.span_id for s in upserts)
+
+
+def test_cached_embeddings_put_and_query_counters(traced, tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    embeddings = QueryEmbeddingCache(CachedEmbeddings(StubEmbeddings(dims=TEST_DIMS), "stub-model", cache))
+
+    embeddings.embed_query("What is RAG?")
+    embeddings.embed_query("What is RAG?")
+
+    assert cache.get_many("stub-model", ["What is RAG?"])[0] is not None
+    assert counters()["query_embed_cache_hits"] == 1
+    assert counters()["query_embed_cache_misses"] == 1
+
+
+def test_exports_write_chrome_trace_and_prometheus_text(traced, tmp_path):
+    with tracing.span("ingest.split", file="doc.txt"):
+        tracing.count("pipeline_chunks", 3)
+
+    trace_path = tmp_path / "out" / "trace.json"
+    prom_path = tmp_path / "out" / "metrics.prom"
+    assert tracing.export_json_trace(str(trace_path)) == 1
+    tracing.export_prometheus(str(prom_path))
+
+    event = json.loads(trace_path.read_text(encoding="utf-8"))["traceEvents"][0]
+    prom = prom_path.read_text(encoding="utf-8")
+    assert (event["name"], event["ph"], event["args"]["file"]) == ("ingest.split", "X", "doc.txt")
+    assert 'rag_stage_duration_seconds_count{stage="ingest.split"} 1' in prom
+    assert 'rag_stage_duration_seconds_bucket{stage="ingest.split",le="+Inf"} 1' in prom
+    assert "rag_pipeline_chunks_total 3" in prom
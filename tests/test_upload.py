@@ -0,0 +1,113 @@
+import json
+import os
+
+import pytest
+
+from qdrant_helper import upload_points
+from retry import backoff_delay, call_with_retry
+from vector_artifact import iter_json_array
+
+TEXTS = [f"Chunk number {i} about vector search and retrieval." for i in range(10)]
+
+
+class FlakyClient:
+    """Forwards to a real client, but the `fail_on`-th upsert call raises."""
+
+    def __init__(self, client, fail_on):
+        self.client = client
+        self.fail_on = fail_on
+        self.calls = 0
+
+    def upsert(self, **kwargs):
+        self.calls += 1
+        if self.calls == self.fail_on:
+            raise ConnectionError("connection reset")
+        return self.client.upsert(**kwargs)
+
+
+def test_upload_points_streams_all_batches_and_removes_checkpoint(client, make_artifact, tmp_path):
+    path = make_artifact(TEXTS)
+    checkpoint = str(tmp_path / "upload.checkpoint.json")
+
+    uploaded = upload_points(client, "test", path, batch_size=3, parallel=1, checkpoint_path=checkpoint)
+
+    assert uploaded == 10
+    assert client.count("test").count == 10
+    assert not os.path.exists(checkpoint)
+
+
+def test_upload_resumes_from_checkpoint_after_crash(client, make_artifact, tmp_path):
+    path = make_artifact(TEXTS)
+    checkpoint = str(tmp_path / "upload.checkpoint.json")
+
+    with pytest.raises(ConnectionError):
+        upload_points(FlakyClient(client, fail_on=3), "test", path, batch_size=3, parallel=1,
+                      max_retries=0, checkpoint_path=checkpoint)
+    with open(checkpoint, "r", encoding="utf-8") as f:
+        assert json.load(f)["done"] == [0, 1]
+
+    # Only batches 2 and 3 (3 + 1 points) are sent again
+    assert upload_points(client, "test", path, batch_size=3, parallel=1, checkpoint_path=checkpoint) == 4
+    assert client.count("test").count == 10
+    assert not os.path.exists(checkpoint)
+
+
+def test_checkpoint_for_other_batch_size_is_ignored(client, make_artifact, tmp_path):
+    path = make_artifact(TEXTS)
+    checkpoint = str(tmp_path / "upload.checkpoint.json")
+    with pytest.raises(ConnectionError):
+        upload_points(FlakyClient(client, fail_on=2), "test", path, batch_size=3, parallel=1,
+                      max_retries=0, checkpoint_path=checkpoint)
+
+    assert upload_points(client, "test", path, batch_size=4, parallel=1, checkpoint_path=checkpoint) == 10
+
+
+def test_upsert_is_retried_with_backoff(client, make_artifact, tmp_path, monkeypatch):
+    monkeypatch.setattr("retry.time.sleep", lambda seconds: None)
+    path = make_artifact(TEXTS)
+    flaky = FlakyClient(client, fail_on=1)
+
+    assert upload_points(flaky, "test", path, batch_size=5, parallel=1, max_retries=1,
+                         checkpoint_path=str(tmp_path / "cp.json")) == 10
+    assert flaky.calls == 3
+
+
+def test_call_with_retry_gives_up_after_max_retries():
+    delays = []
+    attempts = []
+
+    def always_fails(attempt):
+        attempts.append(attempt)
+        raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError):
+        call_with_retry(always_fails, 3, "Test call", "test_retries", sleep=delays.append)
+    assert attempts == [0, 1, 2, 3]
+    assert delays == [0.5, 1.0, 2.0]
+    assert backoff_delay(10) == 8.0
+
+
+def test_iter_json_array_streams_across_read_chunks(tmp_path):
+    items = [{"id": i, "text": "x" * (i * 7), "nested": {"list": [1, 2, "]"]}} for i in range(50)]
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps(items, indent=2), encoding="utf-8")
+
+    # A tiny chunk size forces every element to straddle several reads
+    assert list(iter_json_array(str(path), chunk_size=16)) == items
+    assert list(iter_json_array(str(path))) == items
+
+
+def test_iter_json_array_handles_empty_and_rejects_non_arrays(tmp_path):
+    empty = tmp_path / "empty.json"
+    empty.write_text("  [ ]\n", encoding="utf-8")
+    assert list(iter_json_array(str(empty))) == []
+
+    not_array = tmp_path / "object.json"
+    not_array.write_text('{"id": 1}', encoding="utf-8")
+    with pytest.raises(ValueError):
+        list(iter_json_array(str(not_array)))
+
+    truncated = tmp_path / "truncated.json"
+    truncated.write_text('[{"id": 1}, {"id": 2', encoding="utf-8")
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array(str(truncated), chunk_size=4))
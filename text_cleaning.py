@@ -0,0 +1,372 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from tracing import count, span
+
+# A line seen at least this many times across the corpus is treated as page furniture
+BOILERPLATE_MIN_REPEATS = int(os.getenv("BOILERPLATE_MIN_REPEATS", "3"))
+# Distinct line digests counted at most (~100 bytes each); beyond it rarely seen lines are forgotten
+BOILERPLATE_MAX_LINES = int(os.getenv("BOILERPLATE_MAX_LINES", "500000"))
+# Shorter lines ("---", "```", ")") are document structure, never counted as boilerplate
+BOILERPLATE_MIN_CHARS = 12
+# Text where more than this share of lines is "repeated" is a copy of another document, not furniture;
+# its repeated lines are kept and near-duplicate detection drops its chunks instead
+BOILERPLATE_MAX_SHARE = 0.5
+# Estimated Jaccard similarity of word shingles above which a chunk is dropped as a near-duplicate
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.85"))
+# Chunks kept for near-duplicate comparison (~4 KB each); the oldest are dropped beyond it
+NEAR_DUP_MAX_CHUNKS = int(os.getenv("NEAR_DUP_MAX_CHUNKS", "50000"))
+MINHASH_PERMUTATIONS = 128
+MINHASH_BANDS = 16          # 16 bands x 8 rows: pairs above ~0.7 similarity share a bucket
+SHINGLE_WORDS = 3
+REMOVED_LOG_FILE = "removed.jsonl"
+
+# Scraped-site chrome that shows up once per page, so repetition alone can't catch it on a single page.
+# Each rule matches a whole line in its chrome form, never a sentence that merely starts the same way.
+SITE_CHROME_PATTERNS = [
+    re.compile(r"^skip to (main |primary )?(content|navigation)\W*$", re.IGNORECASE),
+    re.compile(r"\bcookies?\b.*\b(accept( all)?|reject all|cookie settings|manage (cookie )?preferences|got it)\W*$",
+               re.IGNORECASE),                                                  # banner ending in its buttons
+    re.compile(r"^(advertisement|sponsored( content| links?)?|ads by google)\W*$", re.IGNORECASE),
+    re.compile(r"^(ADVERTISEMENT|SPONSORED)\b|^(?i:advertisement|sponsored)\s*[:|–—-]"),  # ADVERTISEMENT: Try ...
+    re.compile(r"^home(\s*[>»›/]\s*[^>»›/]{1,40}){1,6}$", re.IGNORECASE),         # Home > Docs > Retrieval
+    re.compile(r"^share( this| on)?\W*(facebook|twitter|linkedin|x)\b[\w\s|,/·•]*$", re.IGNORECASE),
+    re.compile(r"^(subscribe|sign up)\b.{0,60}\bnewsletter\W*$", re.IGNORECASE),
+    re.compile(r"^(©|copyright\s*(©|\(c\))?)\s*\d{4}\b.{0,80}\ball rights reserved\W*$", re.IGNORECASE),
+    re.compile(r"^(privacy( policy)?|terms( of (use|service))?)\s*\|", re.IGNORECASE),
+]
+SITE_CHROME_MAX_CHARS = 300
+# A line of at least this many links whose text outside the links is at most NAV_MAX_OTHER_SHARE is a nav bar
+NAV_MIN_LINKS = 3
+NAV_MAX_OTHER_SHARE = 0.2
+NAV_MAX_CHARS = 200
+
+# Items of nav bars, cookie bars and footers. A line split on separators (or, without any, on spaces) into
+# at least NAV_MIN_ITEMS items, NAV_MIN_CHROME_SHARE of them from this list, is a nav bar. Bullets also
+# separate bylines and lists ("5 hours ago • Gold Award"), so there every item has to be on the list.
+NAV_CHROME_ITEMS = frozenset([
+    "home", "products", "product", "blog", "about", "about us", "contact", "contact us", "login", "log in",
+    "logout", "sign in", "sign up", "register", "menu", "search", "faq", "help", "support", "pricing", "docs",
+    "careers", "sitemap", "subscribe", "newsletter", "privacy", "privacy policy", "terms", "terms of use",
+    "terms of service", "cookies", "cookie policy", "cookie settings", "ads by google", "advertisement",
+    "skip to main content", "skip to content",
+])
+NAV_MIN_ITEMS = 3
+NAV_MIN_CHROME_SHARE = 0.6
+
+_LINKS = re.compile(r"\[[^\]]*\]\([^)]*\)|https?://\S+")
+# Source lines legitimately repeat across docs ("import numpy as np"), so they are never "repeated" boilerplate
+_CODE_LINE = re.compile(
+    r"^(\s{4,}|\t|\s*(>>>|\$) )"
+    r"|^\s*(import\s+\w|from\s+[\w.]+\s+import\b|def\s+\w+\s*\(|class\s+\w+|return\b|@\w+|#include\b)"
+    r"|[;{}]\s*$"
+)
+_NAV_SEPARATORS = re.compile(r"\s*[|>»›]\s*|\s{2,}")
+_BULLETS = re.compile(r"\s[•·]\s")
+_FENCE = re.compile(r"^\s*(```|~~~)")
+_WHITESPACE = re.compile(r"\s+")
+_WORDS = re.compile(r"\w+")
+
+
+def normalize_line(line):
+    """Case and whitespace are ignored when comparing lines."""
+    return _WHITESPACE.sub(" ", line.strip().lower())
+
+
+def _mostly_links(line):
+    """Short lines of NAV_MIN_LINKS+ links with little else around them: [Home](/) | [Docs](/docs) | ..."""
+    if len(line) > NAV_MAX_CHARS:
+        return False
+    links = _LINKS.findall(line)
+    if len(links) < NAV_MIN_LINKS:
+        return False
+    other = sum(1 for c in _LINKS.sub("", line) if c.isalnum())
+    return other <= NAV_MAX_OTHER_SHARE * sum(1 for c in line if c.isalnum())
+
+
+def _chrome_nav(line):
+    """Pipe/bullet/space separated bars of NAV_CHROME_ITEMS: "Skip to main content | Ads by Google | Privacy"."""
+    if len(line) > NAV_MAX_CHARS:
+        return False
+    if _BULLETS.search(line):
+        items = [item.strip().lower() for item in _BULLETS.split(line)]
+        return len(items) >= NAV_MIN_ITEMS and all(item in NAV_CHROME_ITEMS for item in items)
+    items = [item.strip(" :").lower() for item in _NAV_SEPARATORS.split(line) if item.strip(" :")]
+    if len(items) == 1:
+        items = items[0].split()
+        return len(items) >= NAV_MIN_ITEMS and all(item in NAV_CHROME_ITEMS for item in items)
+    chrome = sum(1 for item in items if item in NAV_CHROME_ITEMS)
+    return len(items) >= NAV_MIN_ITEMS and chrome >= NAV_MIN_CHROME_SHARE * len(items)
+
+
+def _line_key(line):
+    return hashlib.blake2b(normalize_line(line).encode("utf-8"), digest_size=8).digest()
+
+
+class BoilerplateFilter:
+    """
+    Drops navigation bars, cookie banners and other page furniture line by line.
+
+    Two signals: lines matching SITE_CHROME_PATTERNS or made up mostly of
+    links, and lines that occur `min_repeats` or more times across the
+    corpus (headers and footers stamped on every page). Code is never
+    stripped: lines inside ``` fences are kept whole, and code-looking
+    lines don't count as repeated. Counting needs a pass over the whole
+    corpus first: call observe() for every document, then strip() each
+    one. Only 8-byte line digests are kept, at most `max_lines` of them:
+    when the table fills up, lines seen once so far are forgotten (then,
+    if that is not enough, lines seen fewer than min_repeats times), so a
+    line that only starts repeating after a prune needs min_repeats
+    sightings from there.
+    """
+
+    def __init__(self, min_repeats=None, max_lines=None):
+        self.min_repeats = min_repeats or BOILERPLATE_MIN_REPEATS
+        self.max_lines = max_lines or BOILERPLATE_MAX_LINES
+        self.counts = Counter()
+        self._repeated = frozenset()
+
+    @staticmethod
+    def _countable(line):
+        stripped = line.strip()
+        return len(stripped) >= BOILERPLATE_MIN_CHARS and any(c.isalpha() for c in stripped)
+
+    def observe(self, text):
+        self.observe_lines(text.splitlines())
+
+    def observe_lines(self, lines):
+        for line in lines:
+            if self._countable(line):
+                self.counts[_line_key(line)] += 1
+                if len(self.counts) > self.max_lines:
+                    self._prune()
+        self._repeated = None
+
+    def _prune(self):
+        for below in (2, self.min_repeats):
+            self.counts = Counter({key: n for key, n in self.counts.items() if n >= below})
+            if len(self.counts) <= self.max_lines // 2:
+                break
+        count("boilerplate_count_prunes")
+
+    @property
+    def repeated(self):
+        """Digests of lines seen at least min_repeats times so far."""
+        if self._repeated is None:
+            self._repeated = frozenset(key for key, n in self.counts.items() if n >= self.min_repeats)
+        return self._repeated
+
+    def observe_file(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            self.observe_lines(f)
+
+    def frozen(self):
+        """Copy without the counts, cheap to ship to worker processes."""
+        copy = BoilerplateFilter(self.min_repeats, self.max_lines)
+        copy._repeated = self.repeated
+        return copy
+
+    def reason(self, line):
+        """"site_chrome", "repeated" or None."""
+        stripped = line.strip()
+        if not stripped:
+            return None
+        if len(stripped) <= SITE_CHROME_MAX_CHARS and any(p.search(stripped) for p in SITE_CHROME_PATTERNS):
+            return "site_chrome"
+        if _mostly_links(stripped) or _chrome_nav(stripped):
+            return "site_chrome"
+        if _CODE_LINE.search(line.rstrip("\r\n")):
+            return None
+        if self.repeated and self._countable(line) and _line_key(line) in self.repeated:
+            return "repeated"
+        return None
+
+    def strip(self, text):
+        """(text without boilerplate lines, [(line, reason), ...] removed)."""
+        lines = text.splitlines(keepends=True)
+        reasons = []
+        in_fence = False
+        for line in lines:
+            if _FENCE.match(line):
+                in_fence = not in_fence
+                reasons.append(None)
+            else:
+                reasons.append(None if in_fence else self.reason(line))
+        countable = sum(1 for line in lines if self._countable(line))
+        if countable and reasons.count("repeated") > BOILERPLATE_MAX_SHARE * countable:
+            reasons = [None if r == "repeated" else r for r in reasons]
+        kept = []
+        removed = []
+        for line, reason in zip(lines, reasons):
+            if reason:
+                removed.append((line.strip(), reason))
+            else:
+                kept.append(line)
+        return "".join(kept), removed
+
+
+class NearDuplicateIndex:
+    """
+    Streaming near-duplicate detection with MinHash + LSH banding.
+
+    Each chunk becomes a MinHash signature over its word 3-shingles; the
+    signature is cut into bands and a chunk is only compared with earlier
+    chunks sharing at least one band bucket. A candidate whose estimated
+    Jaccard similarity reaches `threshold` makes the new chunk a duplicate,
+    and it is not added; otherwise it is indexed. First occurrence wins.
+    Only the latest `max_chunks` indexed chunks are kept, so memory stays
+    bounded; a copy of a chunk indexed longer ago than that is not caught.
+    """
+
+    def __init__(self, threshold=None, num_perm=MINHASH_PERMUTATIONS, bands=MINHASH_BANDS,
+                 shingle_words=SHINGLE_WORDS, seed=1, max_chunks=None):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.threshold = NEAR_DUP_THRESHOLD if threshold is None else threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_words = shingle_words
+        self.max_chunks = max_chunks or NEAR_DUP_MAX_CHUNKS
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing: (a * x + b) mod 2**64 with odd a, keeping the high 32 bits
+        self._a = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+        self._buckets = [{} for _ in range(bands)]   # band key -> rows, oldest first
+        self._signatures = {}                         # row -> signature
+        self._keys = {}                               # row -> key
+        self._next_row = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def signature(self, text):
+        words = _WORDS.findall(text.lower())
+        if not words:
+            return None
+        n = self.shingle_words
+        shingles = {" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        with np.errstate(over="ignore"):
+            permuted = (np.outer(self._a, hashes) + self._b[:, None]) >> np.uint64(32)
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def check_and_add(self, key, text):
+        """(key of the earlier near-duplicate, similarity), or None after indexing `text` under `key`."""
+        signature = self.signature(text)
+        if signature is None:
+            return None
+        band_keys = self._band_keys(signature)
+        candidates = {row for band, bk in zip(self._buckets, band_keys) for row in band.get(bk, ())}
+        best = None
+        for row in candidates:
+            similarity = float(np.mean(self._signatures[row] == signature))
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (self._keys[row], similarity)
+        if best:
+            return best
+        row = self._next_row
+        self._next_row += 1
+        self._keys[row] = key
+        self._signatures[row] = signature
+        for band, bk in zip(self._buckets, band_keys):
+            band.setdefault(bk, []).append(row)
+        if len(self._keys) > self.max_chunks:
+            self._evict(row - self.max_chunks)
+        return None
+
+    def _evict(self, row):
+        """Forget the oldest indexed chunk; it is first in each of its buckets."""
+        del self._keys[row]
+        for band, bk in zip(self._buckets, self._band_keys(self._signatures.pop(row))):
+            rows = band[bk]
+            del rows[0]
+            if not rows:
+                del band[bk]
+
+
+def removed_log_path(output_path):
+    """removed.jsonl inside an artifact directory, or <name>.removed.jsonl next to a legacy JSON file."""
+    if output_path.endswith(".json"):
+        return output_path[:-len(".json")] + ".removed.jsonl"
+    return os.path.join(output_path, REMOVED_LOG_FILE)
+
+
+class CorpusCleaner:
+    """
+    Boilerplate stripping plus near-duplicate chunk elimination for one
+    ingest run, with a log of everything removed.
+
+    Boilerplate lines are logged once per distinct line with a removal
+    count, so one counter entry per distinct removed line stays in memory;
+    dropped chunks are logged individually with the ID of the chunk they
+    duplicate and the estimated similarity, spooled to a temporary file
+    until write_log().
+    """
+
+    def __init__(self, boilerplate=None, near_duplicates=None):
+        self.boilerplate = boilerplate or BoilerplateFilter()
+        self.near_duplicates = near_duplicates or NearDuplicateIndex()
+        self.removed_lines = Counter()   # (line, reason) -> times removed
+        self.chunks_removed = 0
+        self.chars_removed = 0
+        self._chunk_log = None           # temporary JSONL of dropped chunks
+
+    def strip_boilerplate(self, text):
+        with span("clean.boilerplate", chars=len(text)):
+            text, removed = self.boilerplate.strip(text)
+        self.record_lines(removed)
+        return text
+
+    def record_lines(self, removed):
+        for line, reason in removed:
+            self.removed_lines[(line, reason)] += 1
+            self.chars_removed += len(line)
+        count("boilerplate_lines_removed", len(removed))
+
+    def keep_chunk(self, key, text, source_file):
+        """False (and logged) when `text` nearly duplicates a chunk kept earlier in this run."""
+        duplicate = self.near_duplicates.check_and_add(key, text)
+        if duplicate is None:
+            return True
+        if self._chunk_log is None:
+            self._chunk_log = tempfile.TemporaryFile("w+", encoding="utf-8")
+        entry = {
+            "kind": "near_duplicate",
+            "source_file": source_file,
+            "duplicate_of": duplicate[0],
+            "similarity": round(duplicate[1], 3),
+            "text": text[:200],
+        }
+        self._chunk_log.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.chunks_removed += 1
+        count("near_duplicate_chunks_removed")
+        return False
+
+    def write_log(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for (line, reason), n in self.removed_lines.most_common():
+                f.write(json.dumps({"kind": "boilerplate", "reason": reason, "line": line, "removed": n},
+                                   ensure_ascii=False) + "\n")
+            if self._chunk_log is not None:
+                self._chunk_log.seek(0)
+                shutil.copyfileobj(self._chunk_log, f)
+                self._chunk_log.seek(0, os.SEEK_END)
+        return path
+
+    def summary(self):
+        lines = sum(self.removed_lines.values())
+        return (f"🧹 Removed {lines} boilerplate lines ({self.chars_removed} chars, "
+                f"{len(self.removed_lines)} distinct) and {self.chunks_removed} near-duplicate chunks")
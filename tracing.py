@@ -0,0 +1,228 @@
+"""
+Lightweight per-stage tracing and metrics for ingest and retrieval.
+
+    with span("qdrant.search", collection=name):
+        ...
+    count("embed_cache_hits", 3)
+
+Spans nest through a context variable, record wall time into a per-stage
+latency histogram and are kept (up to TRACE_MAX_SPANS) for a JSON trace in
+Chrome trace-event format (open in chrome://tracing or ui.perfetto.dev).
+Metrics export in Prometheus text format. Tracing is off unless RAG_TRACE=1
+or enable_tracing() is called; while off, span() returns a shared no-op
+object and count() returns immediately.
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+
+TRACE_MAX_SPANS = int(os.getenv("RAG_TRACE_MAX_SPANS", "100000"))
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_enabled = os.getenv("RAG_TRACE", "") not in ("", "0", "false")
+_lock = threading.Lock()
+_current_span = contextvars.ContextVar("rag_current_span", default=None)
+_spans = []
+_histograms = {}
+_counters = {}
+_next_id = 0
+_origin_ns = time.perf_counter_ns()
+
+
+def enable_tracing():
+    global _enabled
+    _enabled = True
+
+
+def disable_tracing():
+    global _enabled
+    _enabled = False
+
+
+def tracing_enabled():
+    return _enabled
+
+
+def reset():
+    """Drop recorded spans and metrics (e.g. between benchmark runs)."""
+    with _lock:
+        _spans.clear()
+        _histograms.clear()
+        _counters.clear()
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("name", "attrs", "span_id", "parent_id", "thread_id", "start_ns", "duration_ns", "_token")
+
+    def __init__(self, name, attrs):
+        global _next_id
+        self.name = name
+        self.attrs = attrs
+        with _lock:
+            _next_id += 1
+            self.span_id = _next_id
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.thread_id = threading.get_ident()
+
+    def set(self, **attrs):
+        """Attach attributes discovered while the span is open (e.g. result counts)."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_ns = time.perf_counter_ns() - self.start_ns
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        _record(self)
+        return False
+
+
+def span(name, **attrs):
+    """Time a block as stage `name`; nested spans record their parent."""
+    if not _enabled:
+        return _NOOP_SPAN
+    return Span(name, attrs)
+
+
+def traced(name):
+    """Decorator form of span() for whole functions."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with Span(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bind_context(fn):
+    """
+    Carry the caller's current span into `fn` when it runs on a worker thread
+    (ThreadPoolExecutor does not copy context variables on its own).
+    """
+    if not _enabled:
+        return fn
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def count(name, value=1):
+    """Increment counter `name` (exported as rag_<name>_total)."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def _record(s):
+    seconds = s.duration_ns / 1e9
+    with _lock:
+        if len(_spans) < TRACE_MAX_SPANS:
+            _spans.append(s)
+        hist = _histograms.get(s.name)
+        if hist is None:
+            hist = _histograms[s.name] = {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                hist["buckets"][i] += 1
+                break
+        hist["sum"] += seconds
+        hist["count"] += 1
+
+
+def stage_summary():
+    """{stage: {"count", "total_s", "mean_ms"}} for quick printing."""
+    with _lock:
+        return {
+            name: {"count": h["count"], "total_s": h["sum"], "mean_ms": h["sum"] / h["count"] * 1000}
+            for name, h in _histograms.items()
+        }
+
+
+def export_json_trace(path):
+    """Write recorded spans as Chrome trace-event JSON."""
+    with _lock:
+        spans = list(_spans)
+    events = [
+        {
+            "name": s.name,
+            "ph": "X",
+            "ts": (s.start_ns - _origin_ns) / 1000.0,
+            "dur": s.duration_ns / 1000.0,
+            "pid": os.getpid(),
+            "tid": s.thread_id,
+            "args": {"span_id": s.span_id, "parent_id": s.parent_id, **{k: _jsonable(v) for k, v in s.attrs.items()}},
+        }
+        for s in spans
+    ]
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return len(events)
+
+
+def _jsonable(value):
+    return value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+
+
+def _prom_name(name):
+    return "".join(c if c.isalnum() or c == "_" else "_" for c in name)
+
+
+def prometheus_text():
+    lines = [
+        "# HELP rag_stage_duration_seconds Wall time per traced stage.",
+        "# TYPE rag_stage_duration_seconds histogram",
+    ]
+    with _lock:
+        histograms = {k: {"buckets": list(v["buckets"]), "sum": v["sum"], "count": v["count"]} for k, v in _histograms.items()}
+        counters = dict(_counters)
+    for stage in sorted(histograms):
+        hist = histograms[stage]
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS, hist["buckets"]):
+            cumulative += n
+            lines.append(f'rag_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'rag_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {hist["count"]}')
+        lines.append(f'rag_stage_duration_seconds_sum{{stage="{stage}"}} {hist["sum"]}')
+        lines.append(f'rag_stage_duration_seconds_count{{stage="{stage}"}} {hist["count"]}')
+    for name in sorted(counters):
+        metric = f"rag_{_prom_name(name)}_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {counters[name]}")
+    return "\n".join(lines) + "\n"
+
+
+def export_prometheus(path):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
@@ -0,0 +1,171 @@
+import json
+import os
+
+import numpy as np
+
+ARTIFACT_FORMAT = "rag-vectors"
+ARTIFACT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.f32"
+RECORDS_FILE = "records.jsonl"
+
+
+def is_legacy_json(path):
+    """Old artifacts are a single indented JSON array; new ones are a directory."""
+    return path.endswith(".json")
+
+
+class VectorArtifactWriter:
+    """
+    Incrementally write a vector artifact directory:
+
+        manifest.json   {"format", "version", "dtype", "dims", "count", "model", ...}
+        vectors.f32     row-major float32 matrix, one row per record
+        records.jsonl   one {"id", "text", "metadata"} object per line, same order
+
+    The manifest is written last, so a directory without one is an
+    interrupted write and is rejected by the loader.
+    """
+
+    def __init__(self, path, model):
+        self.path = path
+        self.model = model
+        self.dims = None
+        self.count = 0
+        os.makedirs(path, exist_ok=True)
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        self._vectors = open(os.path.join(path, VECTORS_FILE), "wb")
+        self._records = open(os.path.join(path, RECORDS_FILE), "w", encoding="utf-8")
+
+    def add(self, record, vector):
+        row = np.asarray(vector, dtype=np.float32)
+        if self.dims is None:
+            self.dims = int(row.shape[0])
+        elif row.shape[0] != self.dims:
+            raise ValueError(f"Vector for record {record.get('id')} has {row.shape[0]} dims, expected {self.dims}")
+        self._vectors.write(row.tobytes())
+        self._records.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.count += 1
+
+    def close(self):
+        self._vectors.close()
+        self._records.close()
+        manifest = {
+            "format": ARTIFACT_FORMAT,
+            "version": ARTIFACT_VERSION,
+            "dtype": "float32",
+            "dims": self.dims or 0,
+            "count": self.count,
+            "model": self.model,
+            "vectors_file": VECTORS_FILE,
+            "records_file": RECORDS_FILE,
+        }
+        with open(os.path.join(self.path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._vectors.close()
+            self._records.close()
+        return False
+
+
+def write_vector_artifact(path, records, vectors, model):
+    with VectorArtifactWriter(path, model) as writer:
+        for record, vector in zip(records, vectors):
+            writer.add(record, vector)
+    return writer.count
+
+
+def read_manifest(path):
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"No {MANIFEST_FILE} in {path} (missing or incomplete artifact)")
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != ARTIFACT_FORMAT:
+        raise ValueError(f"{path} is not a {ARTIFACT_FORMAT} artifact")
+    return manifest
+
+
+def open_vectors(path, manifest=None):
+    """Memory-map the vector matrix read-only; rows are only paged in when touched."""
+    manifest = manifest or read_manifest(path)
+    if manifest["count"] == 0:
+        return np.zeros((0, manifest["dims"]), dtype=np.float32)
+    return np.memmap(
+        os.path.join(path, manifest["vectors_file"]),
+        dtype=np.float32,
+        mode="r",
+        shape=(manifest["count"], manifest["dims"]),
+    )
+
+
+def iter_records(path, manifest=None):
+    manifest = manifest or read_manifest(path)
+    with open(os.path.join(path, manifest["records_file"]), "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_json_array(path, chunk_size=1 << 20):
+    """Yield the elements of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} does not contain a JSON array")
+        buffer = buffer[1:]
+        eof = False
+        while True:
+            buffer = buffer.lstrip().lstrip(",").lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = f.read(chunk_size)
+                eof = not more
+                buffer += more
+                continue
+            yield item
+            buffer = buffer[end:]
+
+
+def iter_documents(path):
+    """
+    Lazily yield {"id", "text", "vector", "metadata"} dicts from either format.
+    For binary artifacts `vector` is a zero-copy row view into the memory map.
+    """
+    if is_legacy_json(path):
+        yield from iter_json_array(path)
+        return
+    manifest = read_manifest(path)
+    vectors = open_vectors(path, manifest)
+    for row, record in enumerate(iter_records(path, manifest)):
+        yield {**record, "vector": vectors[row]}
+
+
+def count_documents(path):
+    if is_legacy_json(path):
+        return sum(1 for _ in iter_json_array(path))
+    return read_manifest(path)["count"]
+
+
+def convert_legacy_json(json_path, artifact_path, model):
+    """One-off migration of an old demo_data.json into the binary artifact format."""
+    with VectorArtifactWriter(artifact_path, model) as writer:
+        for d in iter_json_array(json_path):
+            writer.add({"id": d["id"], "text": d["text"], "metadata": d.get("metadata", {})}, d["vector"])
+    return writer.count